@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Ensayo, Pregunta, Opcion, Resultado, Respuesta, Etiqueta
+from .models import Ensayo, Pregunta, Opcion, Resultado, Respuesta, Etiqueta, EnvioPendiente, Imagen
+from . import busqueda, calificacion
 
 class OpcionInline(admin.TabularInline):
     model = Opcion
@@ -28,12 +29,35 @@ class PreguntaAdmin(admin.ModelAdmin):
     list_filter = ('tipo',)
     search_fields = ('enunciado',)
     filter_horizontal = ('etiquetas',)
+    raw_id_fields = ('imagen',)
     inlines = [OpcionInline]
 
+    def save_related(self, request, form, formsets, change):
+        # Las opciones del OpcionInline se guardan después de la pregunta; se
+        # invalida al final para no dejar una pauta a medio editar en cache.
+        super().save_related(request, form, formsets, change)
+        calificacion.invalidar_pauta(form.instance.ensayo_id)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Con FTS5 se usa el índice de búsqueda en vez de LIKE '%...%' sobre enunciado.
+        if search_term and busqueda.disponible():
+            return queryset.filter(pk__in=busqueda.ids_coincidentes(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
+
     def resumen_enunciado(self, obj):
         return (obj.enunciado[:60] + '...') if len(obj.enunciado) > 60 else obj.enunciado
     resumen_enunciado.short_description = 'Enunciado'
 
+@admin.register(Imagen)
+class ImagenAdmin(admin.ModelAdmin):
+    # Se suben por /api/ensayos/imagenes/ o con el comando importar_imagenes.
+    list_display = ('id', 'hash', 'formato', 'ancho', 'alto', 'bytes', 'creado')
+    search_fields = ('hash',)
+    readonly_fields = ('hash', 'archivo', 'formato', 'ancho', 'alto', 'bytes', 'transparente', 'creado')
+
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(Opcion)
 class OpcionAdmin(admin.ModelAdmin):
     list_display = ('id', 'texto', 'pregunta', 'es_correcta')
@@ -48,3 +72,7 @@ class ResultadoAdmin(admin.ModelAdmin):
 class RespuestaAdmin(admin.ModelAdmin):
     list_display = ('resultado','pregunta','opcion','correcta')
 
+@admin.register(EnvioPendiente)
+class EnvioPendienteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'ensayo', 'alumno', 'estado', 'intentos', 'resultado', 'creado')
+    list_filter = ('estado',)
@@ -0,0 +1,279 @@
+"""
+Agregados materializados por ensayo para results_summary.
+
+`aplicar` se llama desde calificacion.guardar_lote dentro de la misma
+transacción que inserta los Resultado, y suma los conteos del lote con un
+UPDATE por tabla. Así el resumen lee filas proporcionales al número de
+preguntas y etiquetas, no al número de respuestas acumuladas.
+
+Los cambios que no son envíos nuevos (borrar resultados o respuestas,
+cambiar el tipo, el ensayo o las etiquetas de una pregunta) no se pueden
+sumar: ensayos.signals los registra con `programar` y, al confirmar la
+transacción, `reconstruir` recalcula esos ensayos desde Respuesta/Resultado.
+"""
+import threading
+from collections import Counter, defaultdict
+
+from django.apps import apps as apps_globales
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from . import analisis
+from .models import (
+    Ensayo, Pregunta, ParticipanteEnsayo, AgregadoEnsayo, AgregadoPregunta, AgregadoTipo, AgregadoEtiqueta,
+)
+
+# Máximo de claves por CASE en un UPDATE (cada una agrega parámetros a la consulta).
+MAX_CLAVES_UPDATE = 200
+
+_pendientes = threading.local()
+
+
+def _sumar(queryset, campo_clave, deltas):
+    """
+    Suma `deltas` ({clave: (respondidas, correctas)}) a las filas de
+    `queryset` identificadas por `campo_clave`, en un UPDATE con CASE.
+    """
+    claves = list(deltas)
+    for i in range(0, len(claves), MAX_CLAVES_UPDATE):
+        tramo = claves[i:i + MAX_CLAVES_UPDATE]
+        queryset.filter(**{f'{campo_clave}__in': tramo}).update(
+            respondidas=F('respondidas') + Case(
+                *[When(**{campo_clave: k}, then=Value(deltas[k][0])) for k in tramo],
+                default=Value(0), output_field=IntegerField()),
+            correctas=F('correctas') + Case(
+                *[When(**{campo_clave: k}, then=Value(deltas[k][1])) for k in tramo],
+                default=Value(0), output_field=IntegerField()),
+        )
+
+
+def aplicar(envios):
+    """
+    Suma al agregado los envíos recién guardados. `envios` es la misma lista
+    de pares (alumno_id, Calificacion) que recibe guardar_lote.
+    """
+    if not envios:
+        return
+    ensayo_ids = {calif.ensayo_id for _, calif in envios}
+
+    tipo_de = dict(Pregunta.objects.filter(ensayo_id__in=ensayo_ids).values_list('id', 'tipo'))
+    etiquetas_de = defaultdict(list)
+    for pregunta_id, etiqueta_id in Pregunta.etiquetas.through.objects \
+            .filter(pregunta__ensayo_id__in=ensayo_ids).values_list('pregunta_id', 'etiqueta_id'):
+        etiquetas_de[pregunta_id].append(etiqueta_id)
+
+    por_pregunta = defaultdict(lambda: [0, 0])
+    por_tipo = defaultdict(lambda: [0, 0])
+    por_etiqueta = defaultdict(lambda: [0, 0])
+    sin_etiqueta = defaultdict(lambda: [0, 0])
+    envios_por_ensayo = Counter()
+    pares = set()
+
+    for alumno_id, calif in envios:
+        ensayo_id = calif.ensayo_id
+        envios_por_ensayo[ensayo_id] += 1
+        pares.add((ensayo_id, alumno_id))
+        for pregunta_id, _, _, correcta in calif.respuestas:
+            c = 1 if correcta else 0
+            fila = por_pregunta[(ensayo_id, pregunta_id)]
+            fila[0] += 1
+            fila[1] += c
+            fila = por_tipo[(ensayo_id, tipo_de.get(pregunta_id, ''))]
+            fila[0] += 1
+            fila[1] += c
+            etiquetas = etiquetas_de.get(pregunta_id)
+            for etiqueta_id in etiquetas or ():
+                fila = por_etiqueta[(ensayo_id, etiqueta_id)]
+                fila[0] += 1
+                fila[1] += c
+            if not etiquetas:
+                fila = sin_etiqueta[ensayo_id]
+                fila[0] += 1
+                fila[1] += c
+
+    existentes = set(ParticipanteEnsayo.objects
+                     .filter(ensayo_id__in=ensayo_ids, alumno_id__in={a for _, a in pares})
+                     .values_list('ensayo_id', 'alumno_id'))
+    nuevos = pares - existentes
+    ParticipanteEnsayo.objects.bulk_create(
+        [ParticipanteEnsayo(ensayo_id=e, alumno_id=a) for e, a in nuevos], ignore_conflicts=True)
+    nuevos_por_ensayo = Counter(e for e, _ in nuevos)
+
+    # Primero se asegura que existan las filas y luego se suma sobre ellas.
+    AgregadoEnsayo.objects.bulk_create(
+        [AgregadoEnsayo(ensayo_id=e) for e in ensayo_ids], ignore_conflicts=True)
+    AgregadoPregunta.objects.bulk_create(
+        [AgregadoPregunta(ensayo_id=e, pregunta_id=p) for e, p in por_pregunta], ignore_conflicts=True)
+    AgregadoTipo.objects.bulk_create(
+        [AgregadoTipo(ensayo_id=e, tipo=t) for e, t in por_tipo], ignore_conflicts=True)
+    AgregadoEtiqueta.objects.bulk_create(
+        [AgregadoEtiqueta(ensayo_id=e, etiqueta_id=t) for e, t in por_etiqueta], ignore_conflicts=True)
+
+    _sumar(AgregadoPregunta.objects.all(), 'pregunta_id', {p: v for (_, p), v in por_pregunta.items()})
+    for ensayo_id in ensayo_ids:
+        _sumar(AgregadoTipo.objects.filter(ensayo_id=ensayo_id), 'tipo',
+               {t: v for (e, t), v in por_tipo.items() if e == ensayo_id})
+        _sumar(AgregadoEtiqueta.objects.filter(ensayo_id=ensayo_id), 'etiqueta_id',
+               {t: v for (e, t), v in por_etiqueta.items() if e == ensayo_id})
+        AgregadoEnsayo.objects.filter(ensayo_id=ensayo_id).update(
+            envios=F('envios') + envios_por_ensayo[ensayo_id],
+            participantes=F('participantes') + nuevos_por_ensayo[ensayo_id],
+            sin_etiqueta_respondidas=F('sin_etiqueta_respondidas') + sin_etiqueta[ensayo_id][0],
+            sin_etiqueta_correctas=F('sin_etiqueta_correctas') + sin_etiqueta[ensayo_id][1],
+        )
+
+
+def reconstruir(ensayo_ids=None, apps=None):
+    """
+    Recalcula desde cero los agregados de los ensayos dados (o de todos).
+    Acepta el registro `apps` de una migración para poder usarse en RunPython.
+    """
+    apps = apps or apps_globales
+    Ensayo = apps.get_model('ensayos', 'Ensayo')
+    Resultado = apps.get_model('ensayos', 'Resultado')
+    Respuesta = apps.get_model('ensayos', 'Respuesta')
+    ParticipanteEnsayo = apps.get_model('ensayos', 'ParticipanteEnsayo')
+    AgregadoEnsayo = apps.get_model('ensayos', 'AgregadoEnsayo')
+    AgregadoPregunta = apps.get_model('ensayos', 'AgregadoPregunta')
+    AgregadoTipo = apps.get_model('ensayos', 'AgregadoTipo')
+    AgregadoEtiqueta = apps.get_model('ensayos', 'AgregadoEtiqueta')
+
+    if ensayo_ids is None:
+        ensayo_ids = list(Ensayo.objects.values_list('id', flat=True))
+    ensayo_ids = list(ensayo_ids)
+
+    conteos = dict(respondidas=Count('id'), correctas=Count('id', filter=Q(correcta=True)))
+    respuestas = Respuesta.objects.filter(pregunta__ensayo_id__in=ensayo_ids)
+
+    with transaction.atomic():
+        for modelo in (ParticipanteEnsayo, AgregadoEnsayo, AgregadoPregunta, AgregadoTipo, AgregadoEtiqueta):
+            modelo.objects.filter(ensayo_id__in=ensayo_ids).delete()
+
+        envios = dict(Resultado.objects.filter(ensayo_id__in=ensayo_ids)
+                      .values('ensayo_id').annotate(n=Count('id')).values_list('ensayo_id', 'n'))
+        pares = list(Resultado.objects.filter(ensayo_id__in=ensayo_ids)
+                     .values_list('ensayo_id', 'alumno_id').distinct())
+        ParticipanteEnsayo.objects.bulk_create(
+            [ParticipanteEnsayo(ensayo_id=e, alumno_id=a) for e, a in pares])
+        participantes = Counter(e for e, _ in pares)
+
+        AgregadoPregunta.objects.bulk_create([
+            AgregadoPregunta(ensayo_id=row['pregunta__ensayo_id'], pregunta_id=row['pregunta_id'],
+                             respondidas=row['respondidas'], correctas=row['correctas'])
+            for row in respuestas.values('pregunta__ensayo_id', 'pregunta_id').annotate(**conteos)
+        ])
+        AgregadoTipo.objects.bulk_create([
+            AgregadoTipo(ensayo_id=row['pregunta__ensayo_id'], tipo=row['pregunta__tipo'] or '',
+                         respondidas=row['respondidas'], correctas=row['correctas'])
+            for row in respuestas.values('pregunta__ensayo_id', 'pregunta__tipo').annotate(**conteos)
+        ])
+
+        sin_etiqueta = defaultdict(lambda: (0, 0))
+        por_etiqueta = []
+        for row in respuestas.values('pregunta__ensayo_id', 'pregunta__etiquetas__id').annotate(**conteos):
+            if row['pregunta__etiquetas__id'] is None:
+                sin_etiqueta[row['pregunta__ensayo_id']] = (row['respondidas'], row['correctas'])
+            else:
+                por_etiqueta.append(AgregadoEtiqueta(
+                    ensayo_id=row['pregunta__ensayo_id'], etiqueta_id=row['pregunta__etiquetas__id'],
+                    respondidas=row['respondidas'], correctas=row['correctas']))
+        AgregadoEtiqueta.objects.bulk_create(por_etiqueta)
+
+        AgregadoEnsayo.objects.bulk_create([
+            AgregadoEnsayo(ensayo_id=e, envios=envios.get(e, 0), participantes=participantes.get(e, 0),
+                           sin_etiqueta_respondidas=sin_etiqueta[e][0], sin_etiqueta_correctas=sin_etiqueta[e][1])
+            for e in ensayo_ids
+        ])
+
+    return len(ensayo_ids)
+
+
+def programar(ensayo_ids=(), pregunta_ids=()):
+    """
+    Reconstruye una vez, al confirmar la transacción actual, los agregados
+    de los ensayos dados y de los ensayos de las preguntas dadas (resueltos
+    al confirmar, cuando ya se sabe en qué ensayo quedó cada pregunta).
+    """
+    ensayo_ids = {e for e in ensayo_ids if e is not None}
+    pregunta_ids = {p for p in pregunta_ids if p is not None}
+    if not ensayo_ids and not pregunta_ids:
+        return
+    if getattr(_pendientes, 'ensayos', None) is None:
+        _pendientes.ensayos, _pendientes.preguntas = set(), set()
+    _pendientes.ensayos.update(ensayo_ids)
+    _pendientes.preguntas.update(pregunta_ids)
+    transaction.on_commit(_vaciar_pendientes)
+
+
+def _vaciar_pendientes():
+    ensayos = getattr(_pendientes, 'ensayos', None)
+    preguntas = getattr(_pendientes, 'preguntas', None)
+    if not ensayos and not preguntas:
+        return
+    _pendientes.ensayos, _pendientes.preguntas = set(), set()
+    ensayos |= set(Pregunta.objects.filter(pk__in=preguntas).values_list('ensayo_id', flat=True))
+    # Si se borró el ensayo completo sus agregados se fueron en cascada.
+    existentes = list(Ensayo.objects.filter(pk__in=ensayos).values_list('id', flat=True))
+    if existentes:
+        reconstruir(existentes)
+    # El análisis de ítems lee las mismas filas; su marca no ve un borrado
+    # de respuestas sueltas (sin borrar el Resultado).
+    for ensayo_id in existentes:
+        analisis.invalidar(ensayo_id)
+
+
+def _porcentaje(correctas, total):
+    return round((correctas / total * 100), 1) if total > 0 else 0.0
+
+
+def resumen(ensayo):
+    """Cuerpo de results_summary leído desde los agregados."""
+    agregado = AgregadoEnsayo.objects.filter(ensayo=ensayo).first()
+
+    by_type = [{
+        'tipo': row.tipo,
+        'respondidas': row.respondidas,
+        'correctas': row.correctas,
+        'porcentaje_correctas': _porcentaje(row.correctas, row.respondidas),
+    } for row in AgregadoTipo.objects.filter(ensayo=ensayo, respondidas__gt=0).order_by('tipo')]
+
+    by_question = []
+    for row in AgregadoPregunta.objects.filter(ensayo=ensayo, respondidas__gt=0) \
+            .select_related('pregunta').order_by('pregunta_id'):
+        preg = row.pregunta
+        by_question.append({
+            'pregunta_id': preg.id,
+            'texto': preg.enunciado or '',
+            'tipo': preg.tipo or '',
+            'respondidas': row.respondidas,
+            'correctas': row.correctas,
+            'porcentaje_correctas': _porcentaje(row.correctas, row.respondidas),
+            'explicacion_texto': preg.explicacion_texto or '',
+            'explicacion_url': preg.explicacion_url or '',
+        })
+
+    by_tag = [{
+        'tag_id': row.etiqueta_id,
+        'tag': row.etiqueta.nombre,
+        'respondidas': row.respondidas,
+        'correctas': row.correctas,
+        'porcentaje_correctas': _porcentaje(row.correctas, row.respondidas),
+    } for row in AgregadoEtiqueta.objects.filter(ensayo=ensayo, respondidas__gt=0).select_related('etiqueta')]
+    if agregado and agregado.sin_etiqueta_respondidas:
+        by_tag.append({
+            'tag_id': None,
+            'tag': 'Sin etiqueta',
+            'respondidas': agregado.sin_etiqueta_respondidas,
+            'correctas': agregado.sin_etiqueta_correctas,
+            'porcentaje_correctas': _porcentaje(agregado.sin_etiqueta_correctas, agregado.sin_etiqueta_respondidas),
+        })
+    by_tag.sort(key=lambda t: -t['respondidas'])
+
+    return {
+        'ensayo_id': ensayo.id,
+        'titulo': ensayo.titulo,
+        'total_participantes': agregado.participantes if agregado else 0,
+        'by_type': by_type,
+        'by_question': by_question,
+        'by_tag': by_tag,
+    }
@@ -0,0 +1,200 @@
+"""
+Análisis de ítems (teoría clásica de tests) por ensayo.
+
+Se arma una matriz alumnos x ítems a partir de Resultado/Respuesta (cada
+Resultado es una fila, cada Pregunta del ensayo una columna; lo no respondido
+cuenta como incorrecto) y todo se calcula con operaciones vectorizadas de
+NumPy:
+
+- dificultad (p): proporción de aciertos por ítem.
+- discriminación punto-biserial, corregida (ítem contra el puntaje sin ese ítem).
+- índice de discriminación D con los grupos superior/inferior del 27%.
+- análisis de distractores: proporción que elige cada opción (total, grupo
+  superior e inferior) y eficiencia = distractores funcionales / distractores.
+- KR-20 y alfa de Cronbach del ensayo completo.
+
+El resultado se cachea por ensayo junto con su `marca`: la versión del
+ensayo (sube con cada cambio de preguntas u opciones), la cantidad de
+Resultado y el mayor id entre ellos. Los ids no se reutilizan, así que un
+envío nuevo, un borrado o un borrado seguido de otro envío cambian la marca.
+"""
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max, Value
+from django.db.models.functions import Coalesce
+
+from .models import Ensayo, Opcion, Pregunta, Respuesta, Resultado
+
+FRACCION_GRUPOS = 0.27
+# Un distractor es funcional si lo elige al menos esta proporción de alumnos.
+UMBRAL_DISTRACTOR = 0.05
+
+
+def _clave(ensayo_id):
+    return f'ensayos:items:{ensayo_id}'
+
+
+def _redondear(x, decimales=4):
+    if x is None or not np.isfinite(x):
+        return None
+    return round(float(x), decimales)
+
+
+def matriz_respuestas(ensayo_id):
+    """
+    Devuelve (pregunta_ids, resultado_ids, correctas, elegidas): `correctas`
+    es una matriz int8 alumnos x ítems con 1 si acertó, `elegidas` tiene el id
+    de la opción marcada (0 si no marcó ninguna). Las filas siguen el orden de
+    resultado_ids y las columnas el de pregunta_ids. Hay una fila por cada
+    Resultado del ensayo, también los que no tienen respuestas (todo en cero).
+    """
+    pregunta_ids = np.array(
+        Pregunta.objects.filter(ensayo_id=ensayo_id).order_by('id').values_list('id', flat=True),
+        dtype=np.int64)
+    resultado_ids = np.array(
+        Resultado.objects.filter(ensayo_id=ensayo_id).order_by('id').values_list('id', flat=True),
+        dtype=np.int64)
+    correctas = np.zeros((len(resultado_ids), len(pregunta_ids)), dtype=np.int8)
+    elegidas = np.zeros((len(resultado_ids), len(pregunta_ids)), dtype=np.int64)
+    if not len(resultado_ids) or not len(pregunta_ids):
+        return pregunta_ids, resultado_ids, correctas, elegidas
+
+    filas = list(
+        Respuesta.objects.filter(resultado__ensayo_id=ensayo_id)
+        .values_list('resultado_id', 'pregunta_id', Coalesce('opcion_id', Value(0)), 'correcta'))
+    if not filas:
+        return pregunta_ids, resultado_ids, correctas, elegidas
+
+    datos = np.array(filas, dtype=np.int64)
+    # Los dos conjuntos de ids vienen ordenados: searchsorted da fila y columna.
+    fila = np.clip(np.searchsorted(resultado_ids, datos[:, 0]), 0, len(resultado_ids) - 1)
+    columna = np.clip(np.searchsorted(pregunta_ids, datos[:, 1]), 0, len(pregunta_ids) - 1)
+    valida = (resultado_ids[fila] == datos[:, 0]) & (pregunta_ids[columna] == datos[:, 1])
+    fila, columna, datos = fila[valida], columna[valida], datos[valida]
+
+    correctas[fila, columna] = datos[:, 3]
+    elegidas[fila, columna] = datos[:, 2]
+    return pregunta_ids, resultado_ids, correctas, elegidas
+
+
+def analizar_matriz(correctas, elegidas=None, opciones_por_item=None):
+    """
+    Calcula las estadísticas a partir de las matrices. `opciones_por_item` es
+    una lista (una por columna) de listas de (opcion_id, es_correcta); si no
+    se entrega, se omite el análisis de distractores.
+    """
+    X = correctas.astype(np.float64)
+    n, k = X.shape
+    if n == 0:
+        return {
+            'n_alumnos': 0, 'n_items': k, 'media': None, 'desviacion': None,
+            'kr20': None, 'alfa_cronbach': None, 'items': [{} for _ in range(k)],
+        }
+    total = X.sum(axis=1)
+
+    p = X.mean(axis=0)
+
+    # Punto-biserial corregido: correlación de cada ítem con el puntaje del resto.
+    resto = total[:, None] - X
+    cov = (X * resto).mean(axis=0) - p * resto.mean(axis=0)
+    std = X.std(axis=0) * resto.std(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pb = np.where(std > 0, cov / std, np.nan)
+
+    # Grupos extremos del 27% según puntaje total.
+    g = max(1, int(round(FRACCION_GRUPOS * n)))
+    orden = np.argsort(total, kind='stable')
+    inferior, superior = orden[:g], orden[n - g:]
+    p_sup = X[superior].mean(axis=0)
+    p_inf = X[inferior].mean(axis=0)
+    indice_d = p_sup - p_inf
+
+    # Confiabilidad.
+    var_total = total.var()
+    kr20 = alfa = None
+    if k > 1 and var_total > 0:
+        kr20 = (k / (k - 1)) * (1 - (p * (1 - p)).sum() / var_total)
+        if n > 1:
+            alfa = (k / (k - 1)) * (1 - X.var(axis=0, ddof=1).sum() / total.var(ddof=1))
+
+    items = []
+    for j in range(k):
+        item = {
+            'dificultad_p': _redondear(p[j]),
+            'discriminacion_pb': _redondear(pb[j]),
+            'indice_discriminacion': _redondear(indice_d[j]),
+            'p_grupo_superior': _redondear(p_sup[j]),
+            'p_grupo_inferior': _redondear(p_inf[j]),
+        }
+        if elegidas is not None and opciones_por_item is not None:
+            columna = elegidas[:, j]
+            col_sup, col_inf = columna[superior], columna[inferior]
+            opciones = []
+            distractores = funcionales = 0
+            for opcion_id, es_correcta in opciones_por_item[j]:
+                proporcion = (columna == opcion_id).mean()
+                funcional = None
+                if not es_correcta:
+                    distractores += 1
+                    funcional = bool(proporcion >= UMBRAL_DISTRACTOR)
+                    funcionales += int(funcional)
+                opciones.append({
+                    'id': opcion_id,
+                    'es_correcta': es_correcta,
+                    'proporcion': _redondear(proporcion),
+                    'proporcion_superior': _redondear((col_sup == opcion_id).mean()),
+                    'proporcion_inferior': _redondear((col_inf == opcion_id).mean()),
+                    'funcional': funcional,
+                })
+            item['opciones'] = opciones
+            item['sin_respuesta'] = _redondear((columna == 0).mean())
+            item['eficiencia_distractores'] = _redondear(funcionales / distractores) if distractores else None
+        items.append(item)
+
+    return {
+        'n_alumnos': n,
+        'n_items': k,
+        'media': _redondear(total.mean()),
+        'desviacion': _redondear(total.std()),
+        'kr20': _redondear(kr20),
+        'alfa_cronbach': _redondear(alfa),
+        'items': items,
+    }
+
+
+def analizar(ensayo_id):
+    pregunta_ids, _, correctas, elegidas = matriz_respuestas(ensayo_id)
+    opciones = {int(pid): [] for pid in pregunta_ids}
+    for opcion_id, pregunta_id, es_correcta in Opcion.objects.filter(pregunta__ensayo_id=ensayo_id) \
+            .order_by('id').values_list('id', 'pregunta_id', 'es_correcta'):
+        opciones[pregunta_id].append((opcion_id, bool(es_correcta)))
+
+    data = analizar_matriz(correctas, elegidas, [opciones[int(pid)] for pid in pregunta_ids])
+    for pid, item in zip(pregunta_ids, data['items']):
+        item['pregunta_id'] = int(pid)
+    data['ensayo_id'] = ensayo_id
+    return data
+
+
+def marca(ensayo_id):
+    """(versión del ensayo, cantidad de resultados, mayor id de resultado), en una consulta."""
+    fila = Ensayo.objects.filter(pk=ensayo_id) \
+        .annotate(n=Count('resultados'), ultimo=Max('resultados__id')) \
+        .values_list('version', 'n', 'ultimo').first()
+    return (fila[0], fila[1], fila[2] or 0) if fila else None
+
+
+def obtener(ensayo_id):
+    # La marca se lee antes de analizar: si llega un envío entretanto, la
+    # entrada guardada queda vieja y se recalcula en la próxima consulta.
+    version = marca(ensayo_id)
+    entrada = cache.get(_clave(ensayo_id))
+    if entrada is not None and entrada[0] == version:
+        return entrada[1]
+    data = analizar(ensayo_id)
+    cache.set(_clave(ensayo_id), (version, data), None)
+    return data
+
+
+def invalidar(ensayo_id):
+    cache.delete(_clave(ensayo_id))
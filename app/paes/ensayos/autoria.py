@@ -0,0 +1,79 @@
+"""
+Creación de un ensayo completo (preguntas, opciones y etiquetas) en una
+sola transacción.
+
+El documento ya viene validado por EnsayoNuevoSerializer. Se inserta con un
+bulk_create por modelo, así que un ensayo de 80 preguntas son unas pocas
+consultas en vez de una por fila como en los inlines del admin. Las
+etiquetas se resuelven por nombre con una consulta; las que no existen se
+crean.
+
+bulk_create no dispara señales: lo que harían las de ensayos.signals
+(índice de búsqueda, hash de contenido, fórmulas, banco del generador) se
+hace aquí.
+"""
+import string
+
+from django.db import transaction
+
+from . import busqueda, ensamblador, formulas, importacion
+from .models import Ensayo, Etiqueta, Opcion, Pregunta
+
+
+def resolver_etiquetas(nombres):
+    """{nombre: id} para los nombres dados, creando los que falten."""
+    if not nombres:
+        return {}
+    ids = dict(Etiqueta.objects.filter(nombre__in=nombres).values_list('nombre', 'id'))
+    faltan = [nombre for nombre in nombres if nombre not in ids]
+    if faltan:
+        # ignore_conflicts por si otro docente las crea al mismo tiempo; luego se releen.
+        Etiqueta.objects.bulk_create([Etiqueta(nombre=nombre) for nombre in faltan], ignore_conflicts=True)
+        ids.update(Etiqueta.objects.filter(nombre__in=faltan).values_list('nombre', 'id'))
+    return ids
+
+
+@transaction.atomic
+def crear(datos, creador=None):
+    """Crea el ensayo descrito por `datos` y lo devuelve con `pregunta_ids` en el orden recibido."""
+    campos = {campo: datos[campo] for campo in ('titulo', 'materia', 'curso') if campo in datos}
+    # Por id: con JWT el creador es un UsuarioToken, no una instancia de Usuario.
+    ensayo = Ensayo.objects.create(creador_id=getattr(creador, 'id', None), **campos)
+    preguntas = datos.get('preguntas', [])
+
+    creadas = Pregunta.objects.bulk_create([
+        Pregunta(
+            ensayo=ensayo,
+            enunciado=pregunta['enunciado'],
+            tipo=pregunta['tipo'],
+            explicacion_texto=pregunta['explicacion_texto'],
+            explicacion_url=pregunta['explicacion_url'],
+            # Letra de la opción correcta (A, B, ...) según su posición.
+            correct_answer=string.ascii_uppercase[
+                next(i for i, opcion in enumerate(pregunta['opciones']) if opcion['es_correcta'])
+            ],
+            hash_contenido=importacion.hash_contenido(
+                pregunta['enunciado'], [opcion['texto'] for opcion in pregunta['opciones']]),
+            **({'dificultad': pregunta['dificultad']} if 'dificultad' in pregunta else {}),
+        ) for pregunta in preguntas
+    ])
+    Opcion.objects.bulk_create([
+        Opcion(pregunta=creada, texto=opcion['texto'], es_correcta=opcion['es_correcta'])
+        for creada, pregunta in zip(creadas, preguntas)
+        for opcion in pregunta['opciones']
+    ])
+
+    etiquetas = resolver_etiquetas(list(dict.fromkeys(nombre for p in preguntas for nombre in p['etiquetas'])))
+    relacion = Pregunta.etiquetas.through
+    relacion.objects.bulk_create([
+        relacion(pregunta=creada, etiqueta_id=etiquetas[nombre])
+        for creada, pregunta in zip(creadas, preguntas)
+        for nombre in dict.fromkeys(pregunta['etiquetas'])
+    ])
+
+    ensayo.pregunta_ids = [creada.id for creada in creadas]
+    busqueda.programar(ensayo.pregunta_ids)
+    formulas.programar(*(texto for p in preguntas for texto in
+                         (p['enunciado'], p['explicacion_texto'], *(o['texto'] for o in p['opciones']))))
+    ensamblador.invalidar_banco()
+    return ensayo
@@ -0,0 +1,81 @@
+"""
+Orden de preguntas y opciones distinto para cada alumno.
+
+La semilla se deriva de (alumno, ensayo, intento) con blake2b usando
+SECRET_KEY como clave, así que el orden es reproducible (la revisión muestra
+lo mismo que vio el alumno) pero no se puede adivinar el de otro alumno. Cada
+pregunta y cada opción se ordena por un hash de su id con esa semilla: quitar
+o agregar una pregunta no cambia el orden relativo de las demás.
+
+Para servir el ensayo barajado no se vuelve a serializar: el snapshot de la
+variante alumno se parte una vez en fragmentos de bytes (cabecera del ensayo,
+cada pregunta sin sus opciones, cada opción) y cada respuesta es sólo unir
+esos fragmentos en el orden del alumno. La calificación no depende del orden
+porque las respuestas se identifican por pregunta_id y opcion_id.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+ACTIVO = getattr(settings, 'ENSAYOS_BARAJAR', True)
+_CLAVE = hashlib.blake2b(settings.SECRET_KEY.encode()).digest()
+
+
+def semilla(alumno_id, ensayo_id, intento):
+    return hashlib.blake2b(f'{alumno_id}:{ensayo_id}:{intento}'.encode(), key=_CLAVE, digest_size=16).digest()
+
+
+def _llave(semilla, item_id):
+    return hashlib.blake2b(item_id.to_bytes(8, 'little'), key=semilla, digest_size=8).digest()
+
+
+def ordenar(semilla, ids):
+    """Los ids en el orden que corresponde a la semilla."""
+    return sorted(ids, key=lambda item_id: _llave(semilla, item_id))
+
+
+class Fragmentos:
+    """El JSON de un snapshot partido para reordenarlo sin serializar."""
+
+    def __init__(self, contenido):
+        renderer = JSONRenderer()
+        data = json.loads(contenido)
+        preguntas = data.pop('preguntas', [])
+        cabecera = renderer.render(dict(data, preguntas=[]))
+        # Los separadores compactos de JSONRenderer y las comillas escapadas
+        # dentro de los textos garantizan que el marcador aparece una sola vez.
+        self.antes, self.despues = cabecera.split(b'"preguntas":[]', 1)
+        self.preguntas = {}
+        for pregunta in preguntas:
+            opciones = pregunta.pop('opciones', [])
+            inicio, fin = renderer.render(dict(pregunta, opciones=[])).split(b'"opciones":[]', 1)
+            self.preguntas[pregunta['id']] = (
+                inicio, fin, {opcion['id']: renderer.render(opcion) for opcion in opciones},
+            )
+
+    def render(self, semilla, intento):
+        partes = []
+        for pregunta_id in ordenar(semilla, self.preguntas):
+            inicio, fin, opciones = self.preguntas[pregunta_id]
+            partes.append(b''.join((
+                inicio, b'"opciones":[',
+                b','.join(opciones[opcion_id] for opcion_id in ordenar(semilla, opciones)),
+                b']', fin,
+            )))
+        return b''.join((
+            b'{"intento":', str(intento).encode(), b',', self.antes[1:],
+            b'"preguntas":[', b','.join(partes), b']', self.despues,
+        ))
+
+
+def fragmentos(snapshot):
+    """Fragmentos del snapshot, calculados una vez y guardados junto a él en la cache."""
+    if snapshot.fragmentos is None:
+        snapshot.fragmentos = Fragmentos(snapshot.contenido)
+    return snapshot.fragmentos
+
+
+def etag(snapshot, semilla):
+    return '"%s"' % hashlib.blake2b(snapshot.etag.encode() + semilla, digest_size=16).hexdigest()
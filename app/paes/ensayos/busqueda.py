@@ -0,0 +1,188 @@
+"""
+Búsqueda de texto completo en el banco de preguntas (SQLite FTS5).
+
+La tabla virtual ensayos_pregunta_fts (migración 0012) tiene una fila por
+Pregunta, con rowid = pregunta_id y cuatro columnas: enunciado, textos de las
+opciones, explicación y nombres de etiquetas. Las señales de ensayos.signals
+llaman a `programar` con las preguntas afectadas; se reindexan todas juntas
+al confirmar la transacción, así guardar una pregunta con sus opciones en el
+admin la indexa una sola vez.
+
+Los resultados se ordenan por bm25 (el enunciado pesa más que las opciones,
+y éstas más que la explicación y las etiquetas). Cada palabra de la consulta
+se busca como término; la última, o cualquiera terminada en '*', también
+como prefijo. Con otra base de datos la búsqueda no está disponible.
+"""
+import re
+import threading
+
+from django.db import connection, transaction
+
+from .models import Etiqueta, Opcion, Pregunta
+
+TABLA = 'ensayos_pregunta_fts'
+# Igual a la de la migración 0012; benchmark_busqueda la usa en una base aparte.
+DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+    "enunciado, opciones, explicacion, etiquetas, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+PESOS = (10.0, 3.0, 1.0, 2.0)
+TAMANO_LOTE = 500
+MAX_RESULTADOS = 100
+
+_TERMINO = re.compile(r'(\w+)(\*?)')
+_pendientes = threading.local()
+
+
+def disponible():
+    return connection.vendor == 'sqlite'
+
+
+def consulta_fts(texto):
+    """Convierte el texto del usuario en una consulta FTS5 segura (o None si no hay términos)."""
+    terminos = _TERMINO.findall(texto or '')
+    if not terminos:
+        return None
+    partes = []
+    for i, (palabra, asterisco) in enumerate(terminos):
+        prefijo = asterisco or i == len(terminos) - 1
+        partes.append(f'"{palabra}"' + ('*' if prefijo else ''))
+    return ' '.join(partes)
+
+
+def _documentos(pregunta_ids):
+    preguntas = {
+        pid: [enunciado, [], ' '.join(filter(None, (texto, url))), []]
+        for pid, enunciado, texto, url in Pregunta.objects.filter(pk__in=pregunta_ids)
+        .values_list('id', 'enunciado', 'explicacion_texto', 'explicacion_url')
+    }
+    for pregunta_id, texto in Opcion.objects.filter(pregunta_id__in=preguntas).values_list('pregunta_id', 'texto'):
+        preguntas[pregunta_id][1].append(texto or '')
+    relacion = Pregunta.etiquetas.through
+    for pregunta_id, nombre in relacion.objects.filter(pregunta_id__in=preguntas) \
+            .values_list('pregunta_id', 'etiqueta__nombre'):
+        preguntas[pregunta_id][3].append(nombre)
+    return [
+        (pid, enunciado, '\n'.join(opciones), explicacion, ' '.join(etiquetas))
+        for pid, (enunciado, opciones, explicacion, etiquetas) in preguntas.items()
+    ]
+
+
+def indexar(pregunta_ids):
+    """Reindexa las preguntas dadas; las que ya no existen se quitan del índice."""
+    if not disponible():
+        return
+    pregunta_ids = list(pregunta_ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for i in range(0, len(pregunta_ids), TAMANO_LOTE):
+            lote = pregunta_ids[i:i + TAMANO_LOTE]
+            marcas = ','.join(['%s'] * len(lote))
+            cursor.execute(f'DELETE FROM {TABLA} WHERE rowid IN ({marcas})', lote)
+            cursor.executemany(
+                f'INSERT INTO {TABLA} (rowid, enunciado, opciones, explicacion, etiquetas) VALUES (%s, %s, %s, %s, %s)',
+                _documentos(lote),
+            )
+
+
+def reindexar_todo(tamano_lote=TAMANO_LOTE):
+    """Vacía y reconstruye el índice completo. Devuelve cuántas preguntas indexó."""
+    if not disponible():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLA}')
+    ids = list(Pregunta.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(ids), tamano_lote):
+        indexar(ids[i:i + tamano_lote])
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLA} ({TABLA}) VALUES ('optimize')")
+    return len(ids)
+
+
+def programar(pregunta_ids):
+    """Marca preguntas para reindexar al confirmar la transacción actual (o de inmediato)."""
+    if not disponible():
+        return
+    ids = {pid for pid in pregunta_ids if pid is not None}
+    if not ids:
+        return
+    pendientes = getattr(_pendientes, 'ids', None)
+    if pendientes is None:
+        pendientes = _pendientes.ids = set()
+    pendientes.update(ids)
+    # Cada llamada registra un callback, pero el primero en correr vacía el
+    # conjunto y los demás no hacen nada. Si la transacción se revierte, los
+    # ids quedan para la siguiente, lo que sólo repite una reindexación.
+    transaction.on_commit(_vaciar_pendientes)
+
+
+def _vaciar_pendientes():
+    ids = getattr(_pendientes, 'ids', None)
+    if ids:
+        _pendientes.ids = set()
+        indexar(ids)
+
+
+def preguntas_de_etiqueta(etiqueta_id):
+    return list(Pregunta.etiquetas.through.objects.filter(etiqueta_id=etiqueta_id)
+                .values_list('pregunta_id', flat=True))
+
+
+def buscar(texto, etiqueta=None, tipo=None, dificultad=None, desde=0, cantidad=20):
+    """
+    Preguntas que calzan con `texto`, de la más a la menos relevante. Filtra
+    opcionalmente por nombre de etiqueta, tipo y dificultad. Devuelve
+    (resultados, hay_mas).
+    """
+    consulta = consulta_fts(texto)
+    if consulta is None or not disponible():
+        return [], False
+    cantidad = max(1, min(cantidad, MAX_RESULTADOS))
+    pregunta = Pregunta._meta.db_table
+    sql = [
+        f'SELECT p.id, p.ensayo_id, p.enunciado, p.tipo, p.dificultad, '
+        f"snippet({TABLA}, -1, '[', ']', '…', 12), bm25({TABLA}, %s, %s, %s, %s) AS puntaje "
+        f'FROM {TABLA} JOIN {pregunta} p ON p.id = {TABLA}.rowid '
+        f'WHERE {TABLA} MATCH %s'
+    ]
+    params = [*PESOS, consulta]
+    if tipo:
+        sql.append('AND p.tipo = %s')
+        params.append(tipo)
+    if dificultad:
+        sql.append('AND p.dificultad = %s')
+        params.append(dificultad)
+    if etiqueta:
+        relacion = Pregunta.etiquetas.through._meta.db_table
+        sql.append(
+            f'AND EXISTS (SELECT 1 FROM {relacion} pe JOIN {Etiqueta._meta.db_table} e ON e.id = pe.etiqueta_id '
+            f'WHERE pe.pregunta_id = p.id AND e.nombre = %s)'
+        )
+        params.append(etiqueta)
+    sql.append('ORDER BY puntaje LIMIT %s OFFSET %s')
+    params += [cantidad + 1, max(0, desde)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        filas = cursor.fetchall()
+    resultados = [{
+        'pregunta_id': pid,
+        'ensayo_id': ensayo_id,
+        'enunciado': enunciado,
+        'tipo': tipo_,
+        'dificultad': dificultad_,
+        'fragmento': fragmento,
+        # bm25 es negativo: más negativo, más relevante.
+        'relevancia': round(-puntaje, 4),
+    } for pid, ensayo_id, enunciado, tipo_, dificultad_, fragmento, puntaje in filas[:cantidad]]
+    return resultados, len(filas) > cantidad
+
+
+def ids_coincidentes(texto, limite=1000):
+    """Sólo los ids, para filtrar querysets (p.ej. la búsqueda del admin)."""
+    consulta = consulta_fts(texto)
+    if consulta is None or not disponible():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {TABLA} WHERE {TABLA} MATCH %s ORDER BY rank LIMIT %s', [consulta, limite])
+        return [fila[0] for fila in cursor.fetchall()]
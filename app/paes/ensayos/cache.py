@@ -0,0 +1,113 @@
+"""
+Cache LRU en memoria, compartida por todos los hilos del proceso.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """
+    Diccionario acotado con desalojo LRU y contadores de aciertos, fallos y
+    desalojos. Mientras una clave se está cargando, cada invalidación
+    incrementa su generación, así un valor leído de la base de datos antes de
+    invalidarse no se guarda. Las generaciones sólo existen mientras hay
+    cargas en curso, así que no crecen con las claves que pasan por la cache.
+    Con `ttl` (segundos) cada valor además vence ese tiempo después de guardarse.
+    """
+
+    def __init__(self, max_entradas, ttl=None):
+        self.max_entradas = max(1, int(max_entradas))
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._vencimientos = {}
+        # clave -> [cargas en curso, generación]
+        self._cargas = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.vencidos = 0
+
+    def _vigente(self, clave):
+        # Se llama con el lock tomado; quita la entrada si ya venció.
+        if clave not in self._datos:
+            return False
+        if self.ttl is not None and self._vencimientos[clave] <= time.monotonic():
+            del self._datos[clave]
+            del self._vencimientos[clave]
+            self.vencidos += 1
+            return False
+        return True
+
+    def obtener(self, clave, defecto=None):
+        with self._lock:
+            if not self._vigente(clave):
+                self.fallos += 1
+                return defecto
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return self._datos[clave]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._guardar(clave, valor)
+
+    def _guardar(self, clave, valor):
+        # Se llama con el lock tomado.
+        self._datos[clave] = valor
+        self._datos.move_to_end(clave)
+        if self.ttl is not None:
+            self._vencimientos[clave] = time.monotonic() + self.ttl
+        while len(self._datos) > self.max_entradas:
+            desalojada, _ = self._datos.popitem(last=False)
+            self._vencimientos.pop(desalojada, None)
+            self.desalojos += 1
+
+    def obtener_o_cargar(self, clave, cargar):
+        """Devuelve el valor cacheado o lo construye con `cargar()` (un None no se guarda)."""
+        with self._lock:
+            if self._vigente(clave):
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+            carga = self._cargas.setdefault(clave, [0, 0])
+            carga[0] += 1
+            generacion = carga[1]
+        valor = None
+        try:
+            valor = cargar()
+        finally:
+            with self._lock:
+                if valor is not None and carga[1] == generacion:
+                    self._guardar(clave, valor)
+                carga[0] -= 1
+                if carga[0] == 0:
+                    del self._cargas[clave]
+        return valor
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._vencimientos.pop(clave, None)
+            if clave in self._cargas:
+                self._cargas[clave][1] += 1
+
+    def limpiar(self):
+        with self._lock:
+            for carga in self._cargas.values():
+                carga[1] += 1
+            self._datos.clear()
+            self._vencimientos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'vencidos': self.vencidos,
+            }
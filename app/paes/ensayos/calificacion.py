@@ -0,0 +1,343 @@
+"""
+Motor de calificación de ensayos.
+
+La pauta de un ensayo (pregunta -> opciones válidas -> opción correcta) se
+carga en una sola consulta y queda compilada en una cache LRU del proceso;
+el payload completo se valida y califica en memoria, y el Resultado junto a
+todas sus Respuesta se guardan en una única transacción con bulk_create. La
+cantidad de consultas no depende del número de preguntas del ensayo.
+"""
+import json
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .cache import CacheLRU
+from .escritor import EscritorAgrupado
+from .models import Pregunta, Opcion, Resultado, Respuesta
+from . import agregados, idempotencia, ranking
+
+# Pautas compiladas por ensayo_id. Se invalidan desde ensayos.signals en este
+# proceso; en los demás, al ver un Ensayo.version más nuevo que el de la pauta.
+_pautas = CacheLRU(getattr(settings, 'ENSAYOS_PAUTAS_CACHE_MAX', 256))
+
+
+class Pauta:
+    """
+    Pauta compilada de un ensayo: para cada pregunta, sus opciones válidas y
+    cuáles son correctas. Se guarda en arreglos compactos ordenados para que
+    cada pauta ocupe poco en la cache del proceso:
+
+    - preguntas: ids de pregunta ordenados.
+    - inicio: para la pregunta i, sus opciones están en opciones[inicio[i]:inicio[i + 1]].
+    - opciones: ids de opción, ordenados dentro de cada pregunta.
+    - correctas: 1 si la opción en la misma posición es correcta.
+    - correcta_de_pregunta: id de la (primera) opción correcta de cada pregunta, 0 si no hay.
+    - opciones_ordenadas / posicion_opcion: índice global opción -> posición en `opciones`.
+    """
+
+    def __init__(self, ensayo_id, opciones, version=None):
+        # opciones: {pregunta_id: {opcion_id: es_correcta}}
+        self.ensayo_id = ensayo_id
+        self.version = version
+        self.preguntas = array('q', sorted(opciones))
+        self.inicio = array('q', [0])
+        self.opciones = array('q')
+        self.correctas = bytearray()
+        self.correcta_de_pregunta = array('q')
+        for pregunta_id in self.preguntas:
+            correcta = 0
+            for opcion_id in sorted(opciones[pregunta_id]):
+                es_correcta = opciones[pregunta_id][opcion_id]
+                self.opciones.append(opcion_id)
+                self.correctas.append(1 if es_correcta else 0)
+                if es_correcta and not correcta:
+                    correcta = opcion_id
+            self.inicio.append(len(self.opciones))
+            self.correcta_de_pregunta.append(correcta)
+
+        orden = sorted(range(len(self.opciones)), key=self.opciones.__getitem__)
+        self.opciones_ordenadas = array('q', (self.opciones[i] for i in orden))
+        self.posicion_opcion = array('q', orden)
+
+    @property
+    def total_preguntas(self):
+        return len(self.preguntas)
+
+    def _indice_pregunta(self, pregunta_id):
+        i = bisect_left(self.preguntas, pregunta_id)
+        if i < len(self.preguntas) and self.preguntas[i] == pregunta_id:
+            return i
+        return -1
+
+    def _posicion(self, pregunta_id, opcion_id):
+        i = self._indice_pregunta(pregunta_id)
+        if i < 0:
+            return -1
+        lo, hi = self.inicio[i], self.inicio[i + 1]
+        j = bisect_left(self.opciones, opcion_id, lo, hi)
+        if j < hi and self.opciones[j] == opcion_id:
+            return j
+        return -1
+
+    def contiene_pregunta(self, pregunta_id):
+        return self._indice_pregunta(pregunta_id) >= 0
+
+    def opcion_valida(self, pregunta_id, opcion_id):
+        return self._posicion(pregunta_id, opcion_id) >= 0
+
+    def contiene_opcion(self, opcion_id):
+        j = bisect_left(self.opciones_ordenadas, opcion_id)
+        return j < len(self.opciones_ordenadas) and self.opciones_ordenadas[j] == opcion_id
+
+    def es_correcta(self, pregunta_id, opcion_id):
+        j = self._posicion(pregunta_id, opcion_id)
+        return j >= 0 and bool(self.correctas[j])
+
+    def opcion_correcta(self, pregunta_id):
+        i = self._indice_pregunta(pregunta_id)
+        if i < 0:
+            return None
+        return self.correcta_de_pregunta[i] or None
+
+
+class Calificacion:
+    """Resultado de calificar un payload contra una pauta, aún sin persistir."""
+
+    def __init__(self, ensayo_id, total_preguntas):
+        self.ensayo_id = ensayo_id
+        self.total_preguntas = total_preguntas
+        # (pregunta_id, opcion_id, texto, correcta)
+        self.respuestas = []
+        self.correctas = 0
+        self.errores = []
+        # Si viene, la respuesta queda guardada bajo esta clave (ver ensayos.idempotencia).
+        self.clave_idempotencia = None
+
+    @property
+    def puntaje(self):
+        if self.total_preguntas > 0:
+            return int((self.correctas / self.total_preguntas) * 1000)
+        return 0
+
+
+def cargar_pauta(ensayo_id, version=None):
+    """Carga la pauta del ensayo con una sola consulta (LEFT JOIN a opciones)."""
+    opciones = {}
+    filas = Pregunta.objects.filter(ensayo_id=ensayo_id) \
+        .values_list('id', 'opciones__id', 'opciones__es_correcta')
+    for pregunta_id, opcion_id, es_correcta in filas:
+        por_pregunta = opciones.setdefault(pregunta_id, {})
+        if opcion_id is not None:
+            por_pregunta[opcion_id] = bool(es_correcta)
+    return Pauta(ensayo_id, opciones, version)
+
+
+def obtener_pauta(ensayo_id, version=None):
+    """
+    Pauta del ensayo desde la cache del proceso; la carga si no está. Si se
+    da la `version` del ensayo y la pauta cacheada es anterior, se recarga.
+    """
+    pauta = _pautas.obtener_o_cargar(ensayo_id, lambda: cargar_pauta(ensayo_id, version))
+    if version is not None and (pauta.version is None or pauta.version < version):
+        _pautas.invalidar(ensayo_id)
+        pauta = _pautas.obtener_o_cargar(ensayo_id, lambda: cargar_pauta(ensayo_id, version))
+    return pauta
+
+
+def invalidar_pauta(ensayo_id):
+    if ensayo_id is not None:
+        _pautas.invalidar(ensayo_id)
+
+
+def estadisticas_pautas():
+    return _pautas.estadisticas()
+
+
+def _normalizar(respuestas_payload, errores):
+    """
+    Primera pasada: parsea cada elemento y descarta los que no tienen forma
+    de respuesta. Devuelve tuplas (index, rp) con rp ya como dict.
+    """
+    elementos = []
+    for idx, rp in enumerate(respuestas_payload):
+        if isinstance(rp, str):
+            try:
+                rp = json.loads(rp)
+            except Exception:
+                errores.append({'index': idx, 'error': 'Elemento no parseable como JSON', 'raw': str(rp)})
+                continue
+
+        if not isinstance(rp, dict):
+            errores.append({'index': idx, 'error': 'Elemento debe ser un objeto con keys pregunta_id/opcion_id/texto', 'raw': str(rp)})
+            continue
+
+        elementos.append((idx, rp))
+    return elementos
+
+
+def _opciones_externas(pauta, elementos):
+    """
+    Para las opciones que no pertenecen a ninguna pregunta del ensayo hace
+    falta saber si existen en otra parte (para distinguir "no pertenece" de
+    "no encontrada"). Se resuelven todas juntas en una consulta.
+    """
+    candidatas = set()
+    for _, rp in elementos:
+        try:
+            opcion_id = int(rp.get('opcion_id'))
+        except (TypeError, ValueError):
+            continue
+        if not pauta.contiene_opcion(opcion_id):
+            candidatas.add(opcion_id)
+
+    if not candidatas:
+        return set()
+    return set(Opcion.objects.filter(pk__in=candidatas).values_list('id', flat=True))
+
+
+def calificar(pauta, respuestas_payload):
+    """
+    Valida y califica todo el payload en memoria. Mantiene el reporte de
+    errores por índice del payload original.
+    """
+    calif = Calificacion(pauta.ensayo_id, pauta.total_preguntas)
+    errores = calif.errores
+    elementos = _normalizar(respuestas_payload, errores)
+    externas = _opciones_externas(pauta, elementos)
+
+    for idx, rp in elementos:
+        pregunta_id = rp.get('pregunta_id')
+        opcion_id = rp.get('opcion_id')
+        texto = rp.get('texto', None)
+
+        if pregunta_id is None:
+            errores.append({'index': idx, 'error': 'Falta pregunta_id', 'data': rp})
+            continue
+
+        try:
+            pregunta_id_int = int(pregunta_id)
+        except (TypeError, ValueError):
+            pregunta_id_int = None
+        if pregunta_id_int is None or not pauta.contiene_pregunta(pregunta_id_int):
+            errores.append({'index': idx, 'error': f'Pregunta {pregunta_id} no encontrada en el ensayo {pauta.ensayo_id}.'})
+            continue
+
+        opcion_valida = None
+        correcta = False
+
+        if opcion_id is not None:
+            try:
+                opcion_id_int = int(opcion_id)
+            except Exception:
+                errores.append({'index': idx, 'error': f'opcion_id inválido: {opcion_id}'})
+                continue
+
+            if pauta.opcion_valida(pregunta_id_int, opcion_id_int):
+                opcion_valida = opcion_id_int
+                correcta = pauta.es_correcta(pregunta_id_int, opcion_id_int)
+            elif opcion_id_int in externas or pauta.contiene_opcion(opcion_id_int):
+                errores.append({'index': idx, 'error': f'Opción {opcion_id_int} no pertenece a la pregunta {pregunta_id}.'})
+            else:
+                errores.append({'index': idx, 'error': f'Opción {opcion_id_int} no encontrada.'})
+
+        if correcta:
+            calif.correctas += 1
+
+        calif.respuestas.append((
+            pregunta_id_int,
+            opcion_valida,
+            texto if texto is not None else '',
+            correcta,
+        ))
+
+    return calif
+
+
+@transaction.atomic
+def guardar_lote(envios):
+    """
+    Persiste varias calificaciones en una transacción. `envios` es una lista
+    de pares (alumno_id, Calificacion); devuelve los Resultado en el mismo
+    orden.
+    """
+    # Número de intento: resultados previos del alumno en el ensayo (una consulta por lote).
+    previos = Counter({
+        (fila['alumno_id'], fila['ensayo_id']): fila['n'] for fila in
+        Resultado.objects.filter(
+            alumno_id__in={alumno_id for alumno_id, _ in envios},
+            ensayo_id__in={calif.ensayo_id for _, calif in envios},
+        ).values('alumno_id', 'ensayo_id').annotate(n=Count('id'))
+    })
+    nuevos = []
+    for alumno_id, calif in envios:
+        previos[(alumno_id, calif.ensayo_id)] += 1
+        nuevos.append(Resultado(
+            ensayo_id=calif.ensayo_id, alumno_id=alumno_id, puntaje_total=calif.puntaje,
+            intento=previos[(alumno_id, calif.ensayo_id)],
+        ))
+    resultados = Resultado.objects.bulk_create(nuevos)
+
+    respuestas = []
+    for resultado, (_, calif) in zip(resultados, envios):
+        for pregunta_id, opcion_id, texto, correcta in calif.respuestas:
+            respuestas.append(Respuesta(
+                resultado_id=resultado.id,
+                pregunta_id=pregunta_id,
+                opcion_id=opcion_id,
+                texto=texto,
+                correcta=correcta,
+            ))
+    Respuesta.objects.bulk_create(respuestas)
+    agregados.aplicar(envios)
+
+    idempotencia.registrar([
+        idempotencia.nueva(alumno_id, calif.clave_idempotencia, calif.ensayo_id, 201, resumen(resultado, calif))
+        for resultado, (alumno_id, calif) in zip(resultados, envios)
+        if calif.clave_idempotencia
+    ])
+    ensayo_ids = [calif.ensayo_id for _, calif in envios]
+    transaction.on_commit(lambda: ranking.registrar_envios(ensayo_ids))
+
+    return resultados
+
+
+_escritor = EscritorAgrupado(
+    guardar_lote,
+    ventana_ms=getattr(settings, 'ENSAYOS_ESCRITURA_VENTANA_MS', 5),
+    max_lote=getattr(settings, 'ENSAYOS_ESCRITURA_MAX_LOTE', 200),
+    nombre='escritor-resultados',
+)
+
+
+def guardar(alumno_id, calif):
+    """
+    Guarda una calificación. Con ENSAYOS_ESCRITURA_AGRUPADA los envíos
+    concurrentes se agrupan en una sola transacción (ver ensayos.escritor).
+    Dentro de una transacción abierta se escribe directo, para no sacar la
+    escritura de ella.
+    """
+    if getattr(settings, 'ENSAYOS_ESCRITURA_AGRUPADA', False) and not transaction.get_connection().in_atomic_block:
+        return _escritor.guardar((alumno_id, calif))
+    return guardar_lote([(alumno_id, calif)])[0]
+
+
+def estadisticas_escritor():
+    return _escritor.estadisticas()
+
+
+def resumen(resultado, calif):
+    """Cuerpo de respuesta de submit_ensayo."""
+    resp = {
+        'resultado_id': resultado.id,
+        'puntaje': resultado.puntaje_total,
+        'intento': resultado.intento,
+        'fecha': resultado.fecha.isoformat() if getattr(resultado, 'fecha', None) else None
+    }
+    if calif.errores:
+        resp['errores'] = calif.errores
+    return resp
@@ -0,0 +1,166 @@
+"""
+Cola asíncrona de envíos.
+
+submit_ensayo en modo asíncrono sólo inserta el payload en EnvioPendiente y
+responde 202 con un ticket. Un grupo de workers (hilos del mismo proceso o el
+comando `manage.py procesar_envios`) reclama envíos por lotes, los califica
+en memoria y guarda todos los Resultado del lote en una sola transacción.
+Como la cola vive en la base de datos, los envíos pendientes sobreviven a un
+reinicio del servidor.
+"""
+import logging
+import os
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Ensayo, EnvioPendiente
+from . import calificacion
+
+logger = logging.getLogger(__name__)
+
+WORKERS = getattr(settings, 'ENSAYOS_COLA_WORKERS', 2)
+TAMANO_LOTE = getattr(settings, 'ENSAYOS_COLA_LOTE', 50)
+ESPERA = getattr(settings, 'ENSAYOS_COLA_ESPERA', 1.0)
+MAX_INTENTOS = getattr(settings, 'ENSAYOS_COLA_MAX_INTENTOS', 3)
+# Un envío que lleva más de esto en 'procesando' se considera abandonado
+# (el proceso que lo reclamó murió) y vuelve a la cola.
+TIMEOUT_RECLAMO = getattr(settings, 'ENSAYOS_COLA_TIMEOUT', 300)
+
+_hay_trabajo = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def encolar(ensayo_id, alumno_id, respuestas):
+    envio = EnvioPendiente.objects.create(ensayo_id=ensayo_id, alumno_id=alumno_id, respuestas=respuestas)
+    iniciar_workers()
+    transaction.on_commit(_hay_trabajo.set)
+    return envio
+
+
+def recuperar_abandonados():
+    limite = timezone.now() - timedelta(seconds=TIMEOUT_RECLAMO)
+    return EnvioPendiente.objects.filter(estado='procesando', actualizado__lt=limite) \
+        .update(estado='pendiente', reclamado_por='', actualizado=timezone.now())
+
+
+def reclamar_lote(tamano=TAMANO_LOTE):
+    """
+    Marca hasta `tamano` envíos pendientes como propios. El UPDATE filtra
+    por estado, así dos workers (aunque estén en procesos distintos) nunca
+    reclaman el mismo envío.
+    """
+    token = f'{os.getpid()}-{uuid.uuid4().hex}'
+    ids = list(EnvioPendiente.objects.filter(estado='pendiente')
+               .order_by('id').values_list('id', flat=True)[:tamano])
+    if not ids:
+        return []
+    EnvioPendiente.objects.filter(id__in=ids, estado='pendiente') \
+        .update(estado='procesando', reclamado_por=token, intentos=F('intentos') + 1,
+                actualizado=timezone.now())
+    return list(EnvioPendiente.objects.filter(reclamado_por=token, estado='procesando').order_by('id'))
+
+
+def procesar_lote(envios):
+    """
+    Califica y guarda un lote ya reclamado. Devuelve cuántos se completaron.
+    Si el lote falla se reintenta de a un envío, para que uno malo no arrastre
+    a los demás hasta agotar sus intentos.
+    """
+    if not envios:
+        return 0
+
+    try:
+        _guardar(envios)
+        return len(envios)
+    except Exception:
+        if len(envios) == 1:
+            logger.exception("Error guardando el envío %s", envios[0].id)
+            _devolver_a_la_cola(envios)
+            return 0
+        logger.warning("Error guardando lote de %d envíos; se reintentan de a uno", len(envios), exc_info=True)
+
+    completados = 0
+    for envio in envios:
+        try:
+            _guardar([envio])
+            completados += 1
+        except Exception:
+            logger.exception("Error guardando el envío %s", envio.id)
+            _devolver_a_la_cola([envio])
+    return completados
+
+
+def _guardar(envios):
+    versiones = dict(Ensayo.objects.filter(pk__in={e.ensayo_id for e in envios}).values_list('id', 'version'))
+    calificados = []
+    for envio in envios:
+        pauta = calificacion.obtener_pauta(envio.ensayo_id, versiones.get(envio.ensayo_id))
+        calificados.append((envio.alumno_id, calificacion.calificar(pauta, envio.respuestas)))
+
+    with transaction.atomic():
+        resultados = calificacion.guardar_lote(calificados)
+        ahora = timezone.now()
+        for envio, resultado, (_, calif) in zip(envios, resultados, calificados):
+            envio.estado = 'completado'
+            envio.resultado_id = resultado.id
+            envio.errores = calif.errores
+            envio.actualizado = ahora
+        EnvioPendiente.objects.bulk_update(envios, ['estado', 'resultado', 'errores', 'actualizado'])
+
+
+def _devolver_a_la_cola(envios):
+    agotados = [e.id for e in envios if e.intentos >= MAX_INTENTOS]
+    reintentar = [e.id for e in envios if e.intentos < MAX_INTENTOS]
+    ahora = timezone.now()
+    if agotados:
+        EnvioPendiente.objects.filter(id__in=agotados) \
+            .update(estado='error', reclamado_por='', actualizado=ahora)
+    if reintentar:
+        EnvioPendiente.objects.filter(id__in=reintentar) \
+            .update(estado='pendiente', reclamado_por='', actualizado=ahora)
+
+
+def procesar_pendientes(tamano=TAMANO_LOTE):
+    """Procesa lotes hasta vaciar la cola. Devuelve el total procesado."""
+    total = 0
+    while True:
+        lote = reclamar_lote(tamano)
+        if not lote:
+            return total
+        total += procesar_lote(lote)
+
+
+def bucle_worker(detener=None, tamano=TAMANO_LOTE, espera=ESPERA):
+    detener = detener or threading.Event()
+    while not detener.is_set():
+        close_old_connections()
+        try:
+            recuperar_abandonados()
+            procesar_pendientes(tamano)
+        except Exception:
+            logger.exception("Error en worker de la cola de envíos")
+        finally:
+            close_old_connections()
+        _hay_trabajo.wait(espera)
+        _hay_trabajo.clear()
+
+
+def iniciar_workers(cantidad=None):
+    """Arranca (una sola vez por proceso) los hilos que consumen la cola."""
+    cantidad = WORKERS if cantidad is None else cantidad
+    if _workers or cantidad <= 0:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(cantidad):
+            hilo = threading.Thread(target=bucle_worker, name=f'cola-envios-{i}', daemon=True)
+            hilo.start()
+            _workers.append(hilo)
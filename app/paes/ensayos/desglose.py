@@ -0,0 +1,104 @@
+"""
+Desglose por pregunta para question_breakdown.
+
+Total, correctas e histograma por opción salen de una sola pasada agrupada
+sobre Respuesta. El resultado se guarda en la cache de Django junto con el
+contador `respondidas` de AgregadoPregunta: cuando llegan envíos nuevos para
+la pregunta ese contador cambia y la entrada deja de servir, en cualquier
+proceso. Las ediciones de la pregunta o sus opciones la borran vía señales,
+y también los borrados de respuestas: tras un borrado el contador puede
+volver a un valor ya visto con otras respuestas detrás.
+"""
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import AgregadoPregunta, Respuesta
+
+
+def _clave(pregunta_id):
+    return f'ensayos:desglose:{pregunta_id}'
+
+
+def _porcentaje(cantidad, total):
+    return round((cantidad / total * 100), 1) if total > 0 else 0.0
+
+
+def invalidar(pregunta_id):
+    cache.delete(_clave(pregunta_id))
+
+
+_pendientes = threading.local()
+
+
+def programar(pregunta_ids):
+    """
+    Invalida ahora y de nuevo al confirmar la transacción: un lector
+    concurrente pudo volver a guardar el desglose con las filas sin borrar.
+    """
+    pregunta_ids = set(pregunta_ids)
+    for pregunta_id in pregunta_ids:
+        invalidar(pregunta_id)
+    if getattr(_pendientes, 'ids', None) is None:
+        _pendientes.ids = set()
+    _pendientes.ids.update(pregunta_ids)
+    transaction.on_commit(_vaciar_pendientes)
+
+
+def _vaciar_pendientes():
+    ids = getattr(_pendientes, 'ids', None)
+    if not ids:
+        return
+    _pendientes.ids = set()
+    cache.delete_many([_clave(pregunta_id) for pregunta_id in ids])
+
+
+def calcular(pregunta):
+    opciones = list(pregunta.opciones.values_list('id', 'texto'))
+    ids_validos = {opcion_id for opcion_id, _ in opciones}
+
+    total = correctas = sin_respuesta = invalidas = 0
+    por_opcion = {}
+    filas = Respuesta.objects.filter(pregunta=pregunta).values('opcion_id') \
+        .annotate(n=Count('id'), correctas=Count('id', filter=Q(correcta=True)))
+    for row in filas:
+        total += row['n']
+        correctas += row['correctas']
+        if row['opcion_id'] is None:
+            sin_respuesta += row['n']
+        elif row['opcion_id'] in ids_validos:
+            por_opcion[row['opcion_id']] = row['n']
+        else:
+            invalidas += row['n']
+
+    return {
+        'pregunta_id': pregunta.id,
+        'texto': getattr(pregunta, 'enunciado', ''),
+        'tipo': pregunta.tipo,
+        'total_respondieron': total,
+        'correctas': correctas,
+        'porcentaje_correctos': _porcentaje(correctas, total),
+        'opciones': [{
+            'id': opcion_id,
+            'texto': texto or '',
+            'cantidad': por_opcion.get(opcion_id, 0),
+            'porcentaje': _porcentaje(por_opcion.get(opcion_id, 0), total),
+        } for opcion_id, texto in opciones],
+        # Respuestas sin opción elegida (en blanco o con una opción rechazada al calificar).
+        'sin_respuesta': {'cantidad': sin_respuesta, 'porcentaje': _porcentaje(sin_respuesta, total)},
+        # Respuestas cuya opción ya no pertenece a la pregunta.
+        'opcion_invalida': {'cantidad': invalidas, 'porcentaje': _porcentaje(invalidas, total)},
+    }
+
+
+def obtener(pregunta):
+    version = AgregadoPregunta.objects.filter(pregunta_id=pregunta.id) \
+        .values_list('respondidas', flat=True).first() or 0
+    entrada = cache.get(_clave(pregunta.id))
+    if entrada is not None and entrada[0] == version:
+        return entrada[1]
+    data = calcular(pregunta)
+    cache.set(_clave(pregunta.id), (version, data), None)
+    return data
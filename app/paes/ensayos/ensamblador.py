@@ -0,0 +1,317 @@
+"""
+Generación automática de ensayos desde el banco de preguntas.
+
+El banco son las preguntas originales (sin `origen`). Se carga una vez en
+arreglos de NumPy (materia, tipo, dificultad numérica, raíz) más un índice
+por etiqueta con las posiciones de sus preguntas, y queda en memoria hasta
+que cambie una pregunta o etiqueta (ensayos.signals) o venza
+ENSAYOS_BANCO_TTL. Resolver un pedido no consulta la base salvo para las
+preguntas ya vistas por el curso.
+
+El solver es greedy:
+
+1. cubre los mínimos por etiqueta, empezando por la etiqueta más escasa;
+2. completa el total con preguntas al azar entre las disponibles;
+3. si la dificultad promedio queda fuera de la banda, intercambia preguntas
+   (sin romper los mínimos) eligiendo en cada paso la candidata cuya
+   dificultad acerca más el promedio a la banda, apuntando a su extremo más
+   cercano (así la banda puede ser abierta: un extremo infinito).
+
+La dificultad numérica es el b de la calibración TRI si existe; si no, se
+estima desde la proporción de aciertos (-logit p) y, sin datos, es 0.
+
+El ensayo generado lleva copias de las preguntas (con sus opciones y
+etiquetas), creadas con bulk_create y con `origen` apuntando al banco.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import busqueda
+from .models import Ensayo, Etiqueta, Opcion, Pregunta
+
+TTL = getattr(settings, 'ENSAYOS_BANCO_TTL', 5 * 60)
+MAX_PREGUNTAS = 200
+MIN_RESPUESTAS_DIFICULTAD = 20
+
+_banco = None
+
+
+class Infactible(Exception):
+    """No hay preguntas suficientes para cumplir las restricciones pedidas."""
+
+    def __init__(self, mensaje, detalle=None):
+        super().__init__(mensaje)
+        self.detalle = detalle or {}
+
+
+class Banco:
+    """Preguntas del banco en arreglos paralelos (una posición por pregunta)."""
+
+    def __init__(self, ids, materias, tipos, dificultades, etiquetas_por_pregunta):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.materias_nombres, self.materias = np.unique(np.asarray(materias, dtype=object), return_inverse=True)
+        self.tipos_nombres, self.tipos = np.unique(np.asarray(tipos, dtype=object), return_inverse=True)
+        self.dificultades = np.asarray(dificultades, dtype=np.float64)
+        self.etiquetas_por_pregunta = [tuple(etiquetas) for etiquetas in etiquetas_por_pregunta]
+        posiciones = {}
+        for i, etiquetas in enumerate(self.etiquetas_por_pregunta):
+            for etiqueta_id in etiquetas:
+                posiciones.setdefault(etiqueta_id, []).append(i)
+        self.por_etiqueta = {e: np.asarray(p, dtype=np.int64) for e, p in posiciones.items()}
+        self.cargado = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _codigo(self, nombres, valor):
+        i = np.searchsorted(nombres, valor)
+        return i if i < len(nombres) and nombres[i] == valor else -1
+
+    def mascara(self, materia=None, tipo=None, excluir_ids=()):
+        disponible = np.ones(len(self), dtype=bool)
+        if materia:
+            disponible &= self.materias == self._codigo(self.materias_nombres, materia)
+        if tipo:
+            disponible &= self.tipos == self._codigo(self.tipos_nombres, tipo)
+        if len(excluir_ids):
+            disponible &= ~np.isin(self.ids, np.asarray(list(excluir_ids), dtype=np.int64))
+        return disponible
+
+
+def _dificultad(b, respondidas, correctas):
+    if b is not None:
+        return b
+    if respondidas and respondidas >= MIN_RESPUESTAS_DIFICULTAD:
+        p = min(max(correctas / respondidas, 0.02), 0.98)
+        return -float(np.log(p / (1 - p)))
+    return 0.0
+
+
+def cargar_banco():
+    filas = list(
+        Pregunta.objects.filter(origen__isnull=True).order_by('id')
+        .values_list('id', 'ensayo__materia', 'tipo', 'calibracion__dificultad_b',
+                     'agregado__respondidas', 'agregado__correctas')
+    )
+    etiquetas = {}
+    for pregunta_id, etiqueta_id in Pregunta.etiquetas.through.objects \
+            .filter(pregunta__origen__isnull=True).values_list('pregunta_id', 'etiqueta_id'):
+        etiquetas.setdefault(pregunta_id, []).append(etiqueta_id)
+    return Banco(
+        [f[0] for f in filas],
+        [f[1] for f in filas],
+        [f[2] for f in filas],
+        [_dificultad(f[3], f[4], f[5]) for f in filas],
+        [etiquetas.get(f[0], ()) for f in filas],
+    )
+
+
+def obtener_banco():
+    global _banco
+    banco = _banco
+    if banco is None or time.monotonic() - banco.cargado > TTL:
+        banco = _banco = cargar_banco()
+    return banco
+
+
+def invalidar_banco():
+    global _banco
+    _banco = None
+
+
+def vistas_por_curso(curso, dias):
+    """Preguntas del banco que el curso ya rindió (original o copia) en los últimos `dias`."""
+    desde = timezone.now() - timedelta(days=dias)
+    return set(
+        Pregunta.objects.filter(ensayo__curso=curso, ensayo__resultados__fecha__gte=desde)
+        .annotate(raiz=Coalesce('origen_id', 'id')).values_list('raiz', flat=True).distinct()
+    )
+
+
+def resolver(banco, n, minimos=None, banda=None, disponible=None, semilla=None):
+    """
+    Elige `n` posiciones del banco. `minimos` es {etiqueta_id: cantidad},
+    `banda` (mín, máx) para la dificultad promedio y `disponible` una máscara
+    booleana de las preguntas elegibles. Devuelve un arreglo de posiciones o
+    levanta Infactible.
+    """
+    rng = np.random.default_rng(semilla)
+    minimos = {e: k for e, k in (minimos or {}).items() if k > 0}
+    if disponible is None:
+        disponible = np.ones(len(banco), dtype=bool)
+    vacio = np.zeros(0, dtype=np.int64)
+    elegido = np.zeros(len(banco), dtype=bool)
+
+    # 1. Mínimos por etiqueta, de la más escasa a la más abundante.
+    faltan = {}
+    libres_de = {e: banco.por_etiqueta.get(e, vacio) for e in minimos}
+    for etiqueta_id in sorted(minimos, key=lambda e: int(disponible[libres_de[e]].sum())):
+        posiciones = libres_de[etiqueta_id]
+        falta = minimos[etiqueta_id] - int(elegido[posiciones].sum())
+        if falta <= 0:
+            continue
+        libres = posiciones[disponible[posiciones] & ~elegido[posiciones]]
+        if len(libres) < falta:
+            faltan[etiqueta_id] = falta - len(libres)
+            continue
+        elegido[rng.choice(libres, falta, replace=False)] = True
+    if faltan:
+        raise Infactible('No hay suficientes preguntas para algunas etiquetas.', {'faltan_por_etiqueta': faltan})
+    if elegido.sum() > n:
+        raise Infactible('Los mínimos por etiqueta suman más preguntas que el total pedido.',
+                         {'minimo_necesario': int(elegido.sum())})
+
+    # 2. Completar el total.
+    resto = n - int(elegido.sum())
+    libres = np.flatnonzero(disponible & ~elegido)
+    if len(libres) < resto:
+        raise Infactible('No hay suficientes preguntas disponibles.', {'faltan': resto - len(libres)})
+    elegido[rng.choice(libres, resto, replace=False)] = True
+
+    # 3. Ajuste de dificultad por intercambios.
+    if banda is not None:
+        _ajustar_dificultad(banco, elegido, disponible, minimos, banda)
+    return np.flatnonzero(elegido)
+
+
+def _ajustar_dificultad(banco, elegido, disponible, minimos, banda):
+    bajo, alto = banda
+
+    def fuera(media):
+        # Distancia a la banda (0 dentro); admite un extremo infinito.
+        return max(bajo - media, media - alto, 0.0)
+
+    b = banco.dificultades
+    n = int(elegido.sum())
+    conteo = {e: int(elegido[banco.por_etiqueta.get(e, [])].sum()) for e in minimos}
+
+    candidatas = np.flatnonzero(disponible & ~elegido)
+    candidatas = candidatas[np.argsort(b[candidatas], kind='stable')]
+    b_candidatas = b[candidatas]
+
+    for _ in range(4 * n):
+        media = b[elegido].mean()
+        if bajo <= media <= alto or not len(candidatas):
+            break
+        # Se apunta al extremo más cercano, que es finito aunque la banda sea abierta.
+        necesario = ((bajo if media < bajo else alto) - media) * n
+        mejor = None
+        for i in np.flatnonzero(elegido):
+            if any(conteo[e] <= minimos[e] for e in banco.etiquetas_por_pregunta[i] if e in minimos):
+                continue
+            # La candidata ideal tiene b = b_i + necesario; se busca la más cercana.
+            j = np.searchsorted(b_candidatas, b[i] + necesario)
+            for k in (j - 1, j):
+                if 0 <= k < len(candidatas):
+                    nueva = media + (b_candidatas[k] - b[i]) / n
+                    distancia = fuera(nueva)
+                    if distancia < fuera(media) and (mejor is None or distancia < mejor[0]):
+                        mejor = (distancia, i, k)
+        if mejor is None:
+            break
+        _, sale, k = mejor
+        entra = candidatas[k]
+        elegido[sale] = False
+        elegido[entra] = True
+        for e in banco.etiquetas_por_pregunta[sale]:
+            if e in conteo:
+                conteo[e] -= 1
+        for e in banco.etiquetas_por_pregunta[entra]:
+            if e in conteo:
+                conteo[e] += 1
+        # La que sale no vuelve a entrar, para no ciclar.
+        candidatas = np.delete(candidatas, k)
+        b_candidatas = np.delete(b_candidatas, k)
+
+    media = b[elegido].mean()
+    if not bajo <= media <= alto:
+        raise Infactible('No se pudo llevar la dificultad promedio a la banda pedida.',
+                         {'dificultad_promedio': round(float(media), 3)})
+
+
+@transaction.atomic
+def crear_ensayo(titulo, materia, curso, creador, pregunta_ids):
+    """Crea el ensayo con copias de las preguntas dadas (en ese orden), sus opciones y etiquetas."""
+    ensayo = Ensayo.objects.create(titulo=titulo, materia=materia, curso=curso,
+                                   creador_id=getattr(creador, 'id', None))
+    originales = Pregunta.objects.in_bulk(pregunta_ids)
+    copias = Pregunta.objects.bulk_create([
+        Pregunta(
+            ensayo=ensayo,
+            origen_id=originales[pid].origen_id or pid,
+            enunciado=originales[pid].enunciado,
+            dificultad=originales[pid].dificultad,
+            correct_answer=originales[pid].correct_answer,
+            tipo=originales[pid].tipo,
+            explicacion_texto=originales[pid].explicacion_texto,
+            explicacion_url=originales[pid].explicacion_url,
+            hash_contenido=originales[pid].hash_contenido,
+            imagen_id=originales[pid].imagen_id,
+        ) for pid in pregunta_ids
+    ])
+    copia_de = {pid: copia.id for pid, copia in zip(pregunta_ids, copias)}
+
+    Opcion.objects.bulk_create([
+        Opcion(pregunta_id=copia_de[pregunta_id], texto=texto, es_correcta=es_correcta)
+        for pregunta_id, texto, es_correcta in
+        Opcion.objects.filter(pregunta_id__in=pregunta_ids).order_by('id')
+        .values_list('pregunta_id', 'texto', 'es_correcta')
+    ])
+    relacion = Pregunta.etiquetas.through
+    relacion.objects.bulk_create([
+        relacion(pregunta_id=copia_de[pregunta_id], etiqueta_id=etiqueta_id)
+        for pregunta_id, etiqueta_id in
+        relacion.objects.filter(pregunta_id__in=pregunta_ids).values_list('pregunta_id', 'etiqueta_id')
+    ])
+    # bulk_create no dispara señales: el índice de búsqueda se actualiza aquí.
+    busqueda.programar(copia_de.values())
+    return ensayo
+
+
+def generar(titulo, materia, curso, creador, n, por_etiqueta=None, banda=None, tipo=None,
+            excluir_vistas_dias=None, semilla=None, guardar=True):
+    """
+    Resuelve el pedido sobre el banco y, con `guardar`, crea el ensayo.
+    `por_etiqueta` es {nombre_etiqueta: mínimo}. Devuelve (ensayo o None, resumen).
+    """
+    inicio = time.perf_counter()
+    banco = obtener_banco()
+    por_etiqueta = por_etiqueta or {}
+    etiquetas = dict(Etiqueta.objects.filter(nombre__in=por_etiqueta).values_list('nombre', 'id'))
+    desconocidas = sorted(set(por_etiqueta) - set(etiquetas))
+    if desconocidas:
+        raise Infactible('Etiquetas desconocidas.', {'etiquetas': desconocidas})
+    excluir = vistas_por_curso(curso, excluir_vistas_dias) if excluir_vistas_dias else ()
+
+    disponible = banco.mascara(materia=materia, tipo=tipo, excluir_ids=excluir)
+    nombres = {v: k for k, v in etiquetas.items()}
+    try:
+        posiciones = resolver(banco, n, {etiquetas[nombre]: k for nombre, k in por_etiqueta.items()},
+                              banda, disponible, semilla)
+    except Infactible as e:
+        if 'faltan_por_etiqueta' in e.detalle:
+            e.detalle['faltan_por_etiqueta'] = {nombres[k]: v for k, v in e.detalle['faltan_por_etiqueta'].items()}
+        raise
+    # De más fácil a más difícil.
+    posiciones = posiciones[np.argsort(banco.dificultades[posiciones], kind='stable')]
+    pregunta_ids = [int(pid) for pid in banco.ids[posiciones]]
+
+    resumen = {
+        'n_preguntas': len(pregunta_ids),
+        'dificultad_promedio': round(float(banco.dificultades[posiciones].mean()), 3) if len(posiciones) else None,
+        'por_etiqueta': {
+            nombres[e]: int(np.isin(posiciones, banco.por_etiqueta.get(e, [])).sum()) for e in nombres
+        },
+        'disponibles': int(disponible.sum()),
+        'excluidas_por_curso': len(excluir),
+        'pregunta_ids': pregunta_ids,
+        'segundos_seleccion': round(time.perf_counter() - inicio, 4),
+    }
+    ensayo = crear_ensayo(titulo, materia, curso, creador, pregunta_ids) if guardar else None
+    return ensayo, resumen
@@ -0,0 +1,116 @@
+"""
+Group commit para escrituras concurrentes sobre SQLite.
+
+En SQLite cada transacción de escritura toma el lock de toda la base, así que
+varias peticiones guardando a la vez se serializan y algunas fallan con
+"database is locked". EscritorAgrupado entrega todas las escrituras a un solo
+hilo del proceso: éste junta lo que llega dentro de una ventana de unos pocos
+milisegundos, lo guarda con una sola llamada a `funcion_lote` (una
+transacción, un fsync) y despierta a cada petición con su resultado.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.db import IntegrityError, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class TiempoAgotado(Exception):
+    """El escritor no confirmó la escritura dentro del plazo."""
+
+
+class _Pedido:
+    __slots__ = ('item', 'listo', 'resultado', 'error')
+
+    def __init__(self, item):
+        self.item = item
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class EscritorAgrupado:
+    """
+    `funcion_lote(items)` debe guardar todos los items en una transacción y
+    devolver un resultado por item, en el mismo orden.
+    """
+
+    def __init__(self, funcion_lote, ventana_ms=5, max_lote=200, timeout=30, nombre='escritor'):
+        self.funcion_lote = funcion_lote
+        self.ventana = ventana_ms / 1000.0
+        self.max_lote = max(1, max_lote)
+        self.timeout = timeout
+        self.nombre = nombre
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.lotes = 0
+        self.items = 0
+
+    def guardar(self, item):
+        pedido = _Pedido(item)
+        self._asegurar_hilo()
+        self._cola.put(pedido)
+        if not pedido.listo.wait(self.timeout):
+            raise TiempoAgotado(f'{self.nombre}: la escritura no se confirmó en {self.timeout}s')
+        if pedido.error is not None:
+            raise pedido.error
+        return pedido.resultado
+
+    def estadisticas(self):
+        return {
+            'lotes': self.lotes,
+            'items': self.items,
+            'promedio_por_lote': round(self.items / self.lotes, 2) if self.lotes else 0.0,
+            'en_espera': self._cola.qsize(),
+        }
+
+    def _asegurar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name=self.nombre, daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.ventana
+            while len(lote) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._escribir(lote)
+
+    def _escribir(self, lote):
+        close_old_connections()
+        try:
+            resultados = self.funcion_lote([p.item for p in lote])
+            for pedido, resultado in zip(lote, resultados):
+                pedido.resultado = resultado
+        except IntegrityError:
+            # Un item en conflicto (p.ej. una clave de idempotencia repetida)
+            # no debe hacer fallar a los demás: se reintentan de a uno.
+            for pedido in lote:
+                try:
+                    pedido.resultado = self.funcion_lote([pedido.item])[0]
+                except Exception as exc:
+                    pedido.error = exc
+        except Exception as exc:
+            logger.exception("%s: error guardando lote de %d items", self.nombre, len(lote))
+            for pedido in lote:
+                pedido.error = exc
+        finally:
+            self.lotes += 1
+            self.items += len(lote)
+            for pedido in lote:
+                pedido.listo.set()
+            close_old_connections()
@@ -0,0 +1,184 @@
+"""
+Fórmulas de enunciados, opciones y explicaciones pre-renderizadas a SVG.
+
+Los segmentos `$...$` de los textos se renderizan en el servidor con
+mathtext de matplotlib, para que los equipos de los colegios no tengan que
+hacerlo en el navegador. Cada fórmula se guarda en disco bajo una clave que
+es el hash de su fuente y de los parámetros de render (ENSAYOS_FORMULAS_DIR/
+ab/<clave>.svg): la misma fórmula en cien preguntas es un solo archivo y una
+URL que no cambia nunca, así que se sirve con cache inmutable.
+
+Al guardar una pregunta u opción (ensayos.signals) sus fórmulas se
+registran: se escribe la fuente junto a la clave (<clave>.tex) y el render
+se encarga a un pool de procesos, sin hacer esperar la petición. Si alguien
+pide una fórmula registrada antes de que el pool la termine, la vista la
+renderiza en el momento.
+
+Con ENSAYOS_FORMULAS_PROCESOS = 0 no hay pool y cada fórmula se renderiza
+la primera vez que se pide. matplotlib es opcional: sin él las fórmulas se
+registran igual pero la vista responde 404 y el cliente muestra el texto
+original.
+
+Este módulo no importa modelos: los procesos del pool lo cargan sin django.setup().
+"""
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+
+# Sube cuando cambie la forma de renderizar: todas las claves (y URLs) cambian.
+VERSION = 1
+COLOR = getattr(settings, 'ENSAYOS_FORMULAS_COLOR', '#e7f1ea')
+TAMANO = getattr(settings, 'ENSAYOS_FORMULAS_TAMANO', 16)
+PROCESOS = getattr(settings, 'ENSAYOS_FORMULAS_PROCESOS', 2)
+DIRECTORIO = Path(getattr(settings, 'ENSAYOS_FORMULAS_DIR', Path(settings.BASE_DIR) / 'formulas'))
+
+# Como en pandoc: sin espacio junto a los delimitadores y sin dígito después
+# del cierre, para no confundir montos como "$500 y $300" con una fórmula.
+FORMULA = re.compile(r'(?<![\\$])\$(?=[^\s$])([^$]+?)(?<=[^\s\\])\$(?!\d)')
+
+_pool = None
+_pool_lock = threading.Lock()
+_pendientes = threading.local()
+
+
+def disponible():
+    return importlib.util.find_spec('matplotlib') is not None
+
+
+def extraer(texto):
+    """Fuentes de las fórmulas del texto, sin los `$`, en orden y sin repetir."""
+    return list(dict.fromkeys(m.group(1) for m in FORMULA.finditer(texto or '')))
+
+
+def clave(formula):
+    return hashlib.blake2b(f'{VERSION}|{COLOR}|{TAMANO}|{formula}'.encode(), digest_size=16).hexdigest()
+
+
+def ruta(clave_, extension='.svg'):
+    return DIRECTORIO / clave_[:2] / (clave_ + extension)
+
+
+def url(formula):
+    return reverse('formula_svg', args=[clave(formula)])
+
+
+def mapa(*textos):
+    """{fuente: url} de todas las fórmulas de los textos dados."""
+    return {formula: url(formula) for texto in textos for formula in extraer(texto)}
+
+
+def _escribir(destino, contenido):
+    # Escritura atómica: quien lea nunca ve un archivo a medias.
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, destino)
+
+
+def renderizar(formula, color=COLOR, tamano=TAMANO):
+    """SVG de la fórmula (bytes). Levanta ValueError si mathtext no la entiende."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import mathtext, rc_context
+    from matplotlib.font_manager import FontProperties
+
+    salida = io.BytesIO()
+    opciones = {'svg.fonttype': 'path', 'svg.hashsalt': 'paes', 'savefig.transparent': True}
+    with rc_context(opciones):
+        mathtext.math_to_image(f'${formula}$', salida, prop=FontProperties(size=tamano), format='svg', color=color)
+    return salida.getvalue()
+
+
+def renderizar_a_disco(formula, destino, color=COLOR, tamano=TAMANO):
+    """Lo que corre en el pool. Devuelve False si la fórmula no es válida."""
+    destino = Path(destino)
+    if destino.exists():
+        return True
+    try:
+        contenido = renderizar(formula, color, tamano)
+    except ValueError:
+        # Se deja marcada para no volver a intentarlo en cada petición.
+        _escribir(destino.with_suffix('.err'), formula.encode())
+        return False
+    _escribir(destino, contenido)
+    return True
+
+
+def _encargar(formula, destino):
+    global _pool
+    with _pool_lock:
+        for _ in range(2):
+            if _pool is None:
+                # spawn: el servidor tiene hilos (ensayos.escritor) y hacer fork con hilos no es seguro.
+                _pool = ProcessPoolExecutor(max_workers=PROCESOS, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                return _pool.submit(renderizar_a_disco, formula, destino)
+            except BrokenProcessPool:
+                # Un proceso murió (p.ej. sin memoria): se reemplaza el pool completo.
+                _pool = None
+        raise BrokenProcessPool('No se pudo iniciar el pool de fórmulas.')
+
+
+def registrar(formulas, esperar=False):
+    """
+    Guarda la fuente de cada fórmula nueva y encarga su render al pool (si
+    hay). Con `esperar` bloquea hasta terminar. Devuelve cuántas encargó.
+    """
+    tareas = []
+    for formula in dict.fromkeys(formulas):
+        c = clave(formula)
+        if ruta(c).exists() or ruta(c, '.err').exists():
+            continue
+        fuente = ruta(c, '.tex')
+        if not fuente.exists():
+            _escribir(fuente, formula.encode())
+        if disponible() and PROCESOS > 0:
+            tareas.append(_encargar(formula, str(ruta(c))))
+    if esperar:
+        for tarea in tareas:
+            tarea.result()
+    return len(tareas)
+
+
+def programar(*textos):
+    """Registra las fórmulas de los textos al confirmar la transacción actual."""
+    formulas = [formula for texto in textos for formula in extraer(texto)]
+    if not formulas:
+        return
+    pendientes = getattr(_pendientes, 'formulas', None)
+    if pendientes is None:
+        pendientes = _pendientes.formulas = set()
+    pendientes.update(formulas)
+    transaction.on_commit(_vaciar_pendientes)
+
+
+def _vaciar_pendientes():
+    formulas = getattr(_pendientes, 'formulas', None)
+    if formulas:
+        _pendientes.formulas = set()
+        registrar(formulas)
+
+
+def svg(clave_):
+    """Bytes del SVG de la clave; si sólo está registrada, se renderiza ahora. None si no existe."""
+    destino = ruta(clave_)
+    if not destino.exists():
+        fuente = ruta(clave_, '.tex')
+        if not fuente.exists() or ruta(clave_, '.err').exists() or not disponible():
+            return None
+        if not renderizar_a_disco(fuente.read_text(encoding='utf-8'), destino):
+            return None
+    return destino.read_bytes()
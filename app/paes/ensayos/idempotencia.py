@@ -0,0 +1,89 @@
+"""
+Envíos idempotentes.
+
+El cliente puede mandar un header Idempotency-Key (o un campo submission_id
+en el body). La primera vez la respuesta se guarda en ClaveIdempotencia en la
+misma transacción que el Resultado; los reintentos con la misma clave se
+responden desde ahí. El índice único (alumno, clave) evita que dos reintentos
+concurrentes queden ambos guardados.
+
+Si el cliente no manda clave y el envío pasa por el escritor agrupado,
+submit_ensayo genera una: cuando el escritor no confirma a tiempo responde
+503 con ella (submission_id y header Idempotency-Key), porque el envío
+todavía puede quedar guardado y el reintento tiene que poder reconocerlo.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+TTL = getattr(settings, 'ENSAYOS_IDEMPOTENCIA_TTL', 24 * 60 * 60)
+# Cada cuánto (segundos) un proceso aprovecha un registro para purgar claves vencidas.
+INTERVALO_PURGA = getattr(settings, 'ENSAYOS_IDEMPOTENCIA_PURGA', 10 * 60)
+LARGO_MAXIMO = ClaveIdempotencia._meta.get_field('clave').max_length
+
+_ultima_purga = 0.0
+_purga_lock = threading.Lock()
+
+
+def clave_de_request(request):
+    clave = request.headers.get('Idempotency-Key')
+    if not clave and isinstance(request.data, dict):
+        clave = request.data.get('submission_id')
+    if clave is None or clave == '':
+        return None
+    return str(clave).strip() or None
+
+
+def buscar(alumno_id, clave):
+    return ClaveIdempotencia.objects.filter(
+        alumno_id=alumno_id, clave=clave, expira__gt=timezone.now()
+    ).first()
+
+
+def nueva(alumno_id, clave, ensayo_id, codigo_estado, respuesta):
+    """Instancia sin guardar, para insertarla junto con el resto del envío."""
+    return ClaveIdempotencia(
+        alumno_id=alumno_id,
+        clave=clave,
+        ensayo_id=ensayo_id,
+        codigo_estado=codigo_estado,
+        respuesta=respuesta,
+        expira=timezone.now() + timedelta(seconds=TTL),
+    )
+
+
+def registrar(claves):
+    """
+    Inserta las claves dadas (debe llamarse dentro de la transacción del
+    envío). Antes se borran las versiones vencidas de esas mismas claves para
+    que no choquen con el índice único.
+    """
+    if not claves:
+        return
+    _purgar_si_corresponde()
+    for clave in claves:
+        ClaveIdempotencia.objects.filter(
+            alumno_id=clave.alumno_id, clave=clave.clave, expira__lte=timezone.now()
+        ).delete()
+    ClaveIdempotencia.objects.bulk_create(claves)
+
+
+def purgar_expiradas():
+    """Borra en un solo DELETE todas las claves vencidas."""
+    borradas, _ = ClaveIdempotencia.objects.filter(expira__lte=timezone.now()).delete()
+    return borradas
+
+
+def _purgar_si_corresponde():
+    global _ultima_purga
+    ahora = time.monotonic()
+    with _purga_lock:
+        if ahora - _ultima_purga < INTERVALO_PURGA:
+            return
+        _ultima_purga = ahora
+    purgar_expiradas()
@@ -0,0 +1,258 @@
+"""
+Imágenes de preguntas: originales guardados una vez por contenido y
+variantes redimensionadas.
+
+Al subir un archivo se calcula su hash (blake2b) mientras se lee; si ya hay
+una Imagen con ese hash se devuelve ésa, así que subir diez veces la misma
+figura no deja diez copias en disco. El original queda en
+MEDIA_ROOT/imagenes/ab/<hash>/ y, después de confirmar la transacción, un
+pool de procesos genera ahí las variantes: miniatura, móvil y escritorio,
+cada una en JPEG (PNG si hay transparencia) y en WebP. Las variantes se
+sacan una de otra de mayor a menor, y los JPEG grandes se decodifican ya
+reducidos (Image.draft), que es lo que más tiempo ahorra con fotos.
+
+Las URLs incluyen el hash y VERSION, así que su contenido no cambia y se
+sirven con cache inmutable. Si se pide una variante que el pool aún no
+genera, la vista la genera en el momento.
+
+Como ensayos.formulas, este módulo no importa modelos al cargarse: los
+procesos del pool lo usan sin django.setup().
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+# Sube cuando cambie cómo se generan las variantes: cambian sus nombres y URLs.
+VERSION = 1
+# Ancho máximo de cada variante; nunca se agranda una imagen.
+VARIANTES = {'escritorio': 1280, 'movil': 640, 'miniatura': 160}
+CALIDAD_JPEG = 82
+CALIDAD_WEBP = 80
+FORMATOS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+ORIENTACION = 0x0112  # etiqueta EXIF
+TIPOS = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp', 'gif': 'image/gif'}
+MAX_BYTES = getattr(settings, 'ENSAYOS_IMAGENES_MAX_BYTES', 10 * 1024 * 1024)
+MAX_PIXELES = getattr(settings, 'ENSAYOS_IMAGENES_MAX_PIXELES', 40_000_000)
+PROCESOS = getattr(settings, 'ENSAYOS_IMAGENES_PROCESOS', 2)
+DIRECTORIO = Path(settings.MEDIA_ROOT) / 'imagenes'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ImagenInvalida(Exception):
+    pass
+
+
+def carpeta(hash_):
+    return DIRECTORIO / hash_[:2] / hash_
+
+
+def nombre_variante(variante, extension):
+    return f'{variante}-{VERSION}.{extension}'
+
+
+def dimensiones(ancho, alto):
+    """{variante: (ancho, alto)} tal como las genera generar_variantes."""
+    resultado = {}
+    for variante, maximo in VARIANTES.items():
+        if ancho > maximo:
+            ancho, alto = maximo, max(1, round(alto * maximo / ancho))
+        resultado[variante] = (ancho, alto)
+    return resultado
+
+
+def _escribir(destino, contenido):
+    # Escritura atómica, como en ensayos.formulas.
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, destino)
+
+
+def _codificar(imagen, extension):
+    salida = io.BytesIO()
+    if extension == 'jpg':
+        imagen.save(salida, 'JPEG', quality=CALIDAD_JPEG, optimize=True, progressive=True)
+    elif extension == 'png':
+        imagen.save(salida, 'PNG')
+    else:
+        imagen.save(salida, 'WEBP', quality=CALIDAD_WEBP, method=4)
+    return salida.getvalue()
+
+
+def generar_variantes(origen, destino, draft=True):
+    """
+    Genera en `destino` las variantes que falten del archivo `origen`. Es lo
+    que corre en el pool. Devuelve los bytes escritos por archivo.
+    """
+    destino = Path(destino)
+    escritos = {}
+    with Image.open(origen) as original:
+        alfa = 'A' in original.getbands() or 'transparency' in original.info
+        extensiones = ('png' if alfa else 'jpg', 'webp')
+        faltan = [v for v in VARIANTES for e in extensiones if not (destino / nombre_variante(v, e)).exists()]
+        if not faltan:
+            return escritos
+        if draft and original.format == 'JPEG':
+            # El decodificador JPEG puede reducir 2, 4 u 8 veces al leer.
+            maximo = max(VARIANTES.values())
+            original.draft('RGB', (maximo, max(1, round(original.height * maximo / original.width))))
+        actual = ImageOps.exif_transpose(original).convert('RGBA' if alfa else 'RGB')
+
+    for variante, (ancho, alto) in dimensiones(actual.width, actual.height).items():
+        if actual.size != (ancho, alto):
+            actual = actual.resize((ancho, alto), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for extension in extensiones:
+            ruta = destino / nombre_variante(variante, extension)
+            if not ruta.exists():
+                contenido = _codificar(actual, extension)
+                _escribir(ruta, contenido)
+                escritos[ruta.name] = len(contenido)
+    return escritos
+
+
+def _encargar(origen, destino):
+    global _pool
+    with _pool_lock:
+        for _ in range(2):
+            if _pool is None:
+                # spawn por la misma razón que en ensayos.formulas (el servidor tiene hilos).
+                _pool = ProcessPoolExecutor(max_workers=PROCESOS, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                return _pool.submit(generar_variantes, origen, destino)
+            except BrokenProcessPool:
+                _pool = None
+        raise BrokenProcessPool('No se pudo iniciar el pool de imágenes.')
+
+
+def encargar_variantes(imagen):
+    """
+    Encarga al pool las variantes de la Imagen y devuelve el Future. Sin pool
+    (ENSAYOS_IMAGENES_PROCESOS = 0) no hace nada: se generan al pedirlas.
+    """
+    if PROCESOS < 1:
+        return None
+    return _encargar(imagen.archivo.path, str(carpeta(imagen.hash)))
+
+
+def hash_de(archivo):
+    h = hashlib.blake2b(digest_size=16)
+    archivo.seek(0)
+    for bloque in iter(lambda: archivo.read(64 * 1024), b''):
+        h.update(bloque)
+    archivo.seek(0)
+    return h.hexdigest()
+
+
+def _validar(archivo):
+    tamano = archivo.size if hasattr(archivo, 'size') else os.fstat(archivo.fileno()).st_size
+    if tamano > MAX_BYTES:
+        raise ImagenInvalida(f'La imagen supera los {MAX_BYTES // (1024 * 1024)} MB.')
+    try:
+        with Image.open(archivo) as imagen:
+            # verify() tiene que ir antes de leer cualquier otra cosa del archivo.
+            imagen.verify()
+        archivo.seek(0)
+        with Image.open(archivo) as imagen:
+            formato, (ancho, alto) = imagen.format, imagen.size
+            if formato not in FORMATOS:
+                raise ImagenInvalida(f'Formato no soportado; use {", ".join(FORMATOS)}.')
+            if ancho * alto > MAX_PIXELES:
+                raise ImagenInvalida('La imagen tiene demasiados píxeles.')
+            transparente = 'A' in imagen.getbands() or 'transparency' in imagen.info
+            if imagen.getexif().get(ORIENTACION) in (5, 6, 7, 8):
+                # Fotos de celular giradas: se guardan las medidas ya enderezadas.
+                ancho, alto = alto, ancho
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ImagenInvalida('El archivo no es una imagen válida.') from e
+    finally:
+        archivo.seek(0)
+    return formato, ancho, alto, tamano, transparente
+
+
+def guardar(archivo, variantes=True):
+    """
+    Guarda el archivo (un File de Django o un archivo binario abierto) si su
+    contenido es nuevo y, con `variantes`, encarga sus variantes al confirmar.
+    Devuelve (Imagen, creada). Levanta ImagenInvalida.
+    """
+    from .models import Imagen
+
+    hash_ = hash_de(archivo)
+    existente = Imagen.objects.filter(hash=hash_).first()
+    if existente is not None:
+        return existente, False
+
+    formato, ancho, alto, tamano, transparente = _validar(archivo)
+    imagen = Imagen(hash=hash_, formato=formato, ancho=ancho, alto=alto, bytes=tamano, transparente=transparente)
+    try:
+        with transaction.atomic():
+            imagen.archivo.save(f'original.{FORMATOS[formato]}', File(archivo), save=False)
+            imagen.save()
+    except IntegrityError:
+        # Otra petición subió el mismo contenido al mismo tiempo.
+        imagen.archivo.delete(save=False)
+        return Imagen.objects.get(hash=hash_), False
+    if variantes:
+        transaction.on_commit(lambda: encargar_variantes(imagen))
+    return imagen, True
+
+
+def url(hash_, nombre):
+    return reverse('imagen_archivo', args=[hash_, nombre])
+
+
+def descripcion(imagen):
+    """Lo que ve el cliente: tamaño, original y una URL por variante y formato."""
+    if imagen is None:
+        return None
+    base = 'png' if imagen.transparente else 'jpg'
+    return {
+        'id': imagen.id,
+        'ancho': imagen.ancho,
+        'alto': imagen.alto,
+        'original': url(imagen.hash, os.path.basename(imagen.archivo.name)),
+        'variantes': {
+            variante: {
+                'ancho': ancho,
+                'alto': alto,
+                base: url(imagen.hash, nombre_variante(variante, base)),
+                'webp': url(imagen.hash, nombre_variante(variante, 'webp')),
+            } for variante, (ancho, alto) in dimensiones(imagen.ancho, imagen.alto).items()
+        },
+    }
+
+
+def ruta_archivo(hash_, nombre):
+    """Ruta en disco del original o de una variante (generándola si falta), o None."""
+    directorio = carpeta(hash_)
+    ruta = directorio / nombre
+    if ruta.exists():
+        return ruta
+    variante, _, resto = nombre.partition('-')
+    if variante not in VARIANTES or resto.rsplit('.', 1)[0] != str(VERSION):
+        return None
+    originales = list(directorio.glob('original.*'))
+    if not originales:
+        return None
+    generar_variantes(originales[0], directorio)
+    return ruta if ruta.exists() else None
+
+
+def borrar(hash_):
+    shutil.rmtree(carpeta(hash_), ignore_errors=True)
@@ -0,0 +1,410 @@
+"""
+Importación masiva de bancos de preguntas desde CSV, NDJSON o JSON.
+
+El archivo se lee como flujo: cada formato es un generador que entrega una
+pregunta a la vez y el importador las acumula en lotes de TAMANO_LOTE, que
+se guardan con un bulk_create por modelo en su propia transacción. La
+memoria usada no depende del tamaño del archivo.
+
+Formatos (una pregunta por fila):
+
+- CSV con cabecera: enunciado, opcion_a, opcion_b, ... (las que haya),
+  correcta (letra), y opcionalmente tipo, dificultad, etiquetas (separadas
+  por ';' o '|'), explicacion_texto y explicacion_url.
+- NDJSON: un objeto por línea, con las claves de una pregunta de
+  EnsayoNuevoSerializer (opciones: [{texto, es_correcta}]). También se
+  aceptan opciones como lista de textos más una letra en 'correcta'.
+- JSON: un arreglo de esos mismos objetos, leído elemento por elemento.
+
+Una pregunta es duplicada si ya existe otra con el mismo hash_contenido:
+hash del enunciado y los textos de las opciones normalizados (NFKC,
+minúsculas, espacios colapsados; las opciones sin importar su orden). Las
+filas con errores o duplicadas se informan y no detienen la importación.
+"""
+import csv
+import hashlib
+import json
+import re
+import string
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import reset_queries, transaction
+
+from . import autoria, busqueda, ensamblador, formulas, snapshots
+from .models import Opcion, Pregunta
+
+FORMATOS = ('csv', 'ndjson', 'json')
+TAMANO_LOTE = 1000
+MAX_ERRORES_INFORME = 1000
+# Un elemento JSON más largo que esto se considera archivo corrupto.
+MAX_ELEMENTO_JSON = 1024 * 1024
+# Subido por la API la importación corre dentro de la petición (y del timeout
+# de gunicorn); lo más grande va por el comando importar_preguntas.
+MAX_BYTES_WEB = getattr(settings, 'ENSAYOS_IMPORTACION_WEB_MAX_BYTES', 2 * 1024 * 1024)
+
+TIPOS = {valor for valor, _ in Pregunta._meta.get_field('tipo').choices}
+TIPO_POR_DEFECTO = 'alternativa_simple'
+MAX_TEXTO_OPCION = Opcion._meta.get_field('texto').max_length
+MAX_DIFICULTAD = Pregunta._meta.get_field('dificultad').max_length
+MAX_ETIQUETA = 80
+LETRAS = string.ascii_uppercase
+
+_COLUMNA_OPCION = re.compile(r'opcion_([a-z])')
+_SEPARADOR_ETIQUETAS = re.compile(r'[;|]')
+_validar_url = URLValidator()
+_pendientes = threading.local()
+
+
+class FormatoInvalido(Exception):
+    """El archivo no se puede seguir leyendo (p.ej. JSON mal formado)."""
+
+
+# Hash de contenido
+
+def normalizar(texto):
+    return ' '.join(unicodedata.normalize('NFKC', texto or '').casefold().split())
+
+
+def hash_contenido(enunciado, textos_opciones):
+    h = hashlib.blake2b(normalizar(enunciado).encode(), digest_size=16)
+    for texto in sorted(normalizar(t) for t in textos_opciones):
+        h.update(b'\x1f' + texto.encode())
+    return h.hexdigest()
+
+
+def actualizar_hashes(pregunta_ids):
+    """Recalcula hash_contenido de las preguntas dadas (sin señales)."""
+    contenido = {
+        pid: (enunciado, actual, [])
+        for pid, enunciado, actual in Pregunta.objects.filter(pk__in=list(pregunta_ids))
+        .values_list('id', 'enunciado', 'hash_contenido')
+    }
+    if not contenido:
+        return
+    for pregunta_id, texto in Opcion.objects.filter(pregunta_id__in=contenido).values_list('pregunta_id', 'texto'):
+        contenido[pregunta_id][2].append(texto)
+    cambiadas = []
+    for pid, (enunciado, actual, opciones) in contenido.items():
+        nuevo = hash_contenido(enunciado, opciones)
+        if nuevo != actual:
+            cambiadas.append(Pregunta(id=pid, hash_contenido=nuevo))
+    Pregunta.objects.bulk_update(cambiadas, ['hash_contenido'], batch_size=500)
+
+
+def programar_hashes(pregunta_ids):
+    """Como busqueda.programar: recalcula los hashes una vez al confirmar la transacción."""
+    ids = {pid for pid in pregunta_ids if pid is not None}
+    if not ids:
+        return
+    pendientes = getattr(_pendientes, 'ids', None)
+    if pendientes is None:
+        pendientes = _pendientes.ids = set()
+    pendientes.update(ids)
+    transaction.on_commit(_vaciar_pendientes)
+
+
+def _vaciar_pendientes():
+    ids = getattr(_pendientes, 'ids', None)
+    if ids:
+        _pendientes.ids = set()
+        actualizar_hashes(ids)
+
+
+# Lectores: cada uno entrega (fila, dato, error) con el número de fila
+# que verá quien corrija el archivo.
+
+def filas_csv(texto):
+    lector = csv.DictReader(texto)
+    columnas = sorted(c for c in (lector.fieldnames or []) if c and _COLUMNA_OPCION.fullmatch(c.strip().lower()))
+    # La fila 1 de la planilla es la cabecera.
+    for fila, datos in enumerate(lector, start=2):
+        correcta = (datos.get('correcta') or '').strip().upper()
+        yield fila, {
+            'enunciado': datos.get('enunciado') or '',
+            'tipo': (datos.get('tipo') or '').strip() or TIPO_POR_DEFECTO,
+            'dificultad': (datos.get('dificultad') or '').strip() or None,
+            'explicacion_texto': datos.get('explicacion_texto') or '',
+            'explicacion_url': (datos.get('explicacion_url') or '').strip(),
+            'etiquetas': [e.strip() for e in _SEPARADOR_ETIQUETAS.split(datos.get('etiquetas') or '') if e.strip()],
+            'opciones': [
+                {'texto': datos[c].strip(), 'es_correcta': c.strip()[-1].upper() == correcta}
+                for c in columnas if (datos.get(c) or '').strip()
+            ],
+        }, None
+
+
+def filas_ndjson(texto):
+    for fila, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            yield fila, json.loads(linea), None
+        except ValueError as e:
+            yield fila, None, f'JSON inválido: {e}'
+
+
+def filas_json(texto, tamano_bloque=64 * 1024):
+    """Elementos de un arreglo JSON, sin cargar el arreglo completo."""
+    decodificador = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def saltar_espacios():
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            buffer, pos = texto.read(tamano_bloque), 0
+            eof = not buffer
+
+    saltar_espacios()
+    if buffer[pos:pos + 1] != '[':
+        raise FormatoInvalido('El archivo JSON debe ser un arreglo de preguntas.')
+    pos += 1
+    fila = 0
+    while True:
+        saltar_espacios()
+        if eof:
+            raise FormatoInvalido('El archivo JSON termina antes de cerrar el arreglo.')
+        if buffer[pos] == ']':
+            return
+        if fila:
+            if buffer[pos] != ',':
+                raise FormatoInvalido(f'Se esperaba "," después del elemento {fila}.')
+            pos += 1
+            saltar_espacios()
+        while True:
+            try:
+                dato, fin = decodificador.raw_decode(buffer, pos)
+                # Un valor que llega justo al final del bloque puede estar cortado.
+                if fin < len(buffer) or eof:
+                    break
+            except ValueError:
+                if eof:
+                    raise FormatoInvalido(f'JSON inválido en el elemento {fila + 1}.')
+            if len(buffer) - pos > MAX_ELEMENTO_JSON:
+                raise FormatoInvalido(f'El elemento {fila + 1} es demasiado largo o está mal formado.')
+            bloque = texto.read(tamano_bloque)
+            eof = not bloque
+            buffer, pos = buffer[pos:] + bloque, 0
+        fila += 1
+        pos = fin
+        yield fila, dato, None
+
+
+LECTORES = {'csv': filas_csv, 'ndjson': filas_ndjson, 'json': filas_json}
+
+
+def formato_de(nombre):
+    extension = nombre.rsplit('.', 1)[-1].lower() if '.' in nombre else ''
+    return {'jsonl': 'ndjson'}.get(extension, extension) if extension in (*FORMATOS, 'jsonl') else None
+
+
+# Validación
+
+def validar(dato):
+    """Devuelve (pregunta, []) con los campos listos para guardar, o (None, errores)."""
+    if not isinstance(dato, dict):
+        return None, ['La fila debe ser un objeto.']
+    errores = []
+    enunciado = dato.get('enunciado')
+    if not isinstance(enunciado, str) or not enunciado.strip():
+        errores.append('enunciado: requerido.')
+    tipo = dato.get('tipo') or TIPO_POR_DEFECTO
+    if tipo not in TIPOS:
+        errores.append(f'tipo: "{tipo}" no es válido.')
+    dificultad = dato.get('dificultad')
+    if dificultad is not None and (not isinstance(dificultad, str) or len(dificultad) > MAX_DIFICULTAD):
+        errores.append(f'dificultad: texto de hasta {MAX_DIFICULTAD} caracteres.')
+    explicacion_texto = dato.get('explicacion_texto') or ''
+    if not isinstance(explicacion_texto, str):
+        errores.append('explicacion_texto: debe ser texto.')
+    explicacion_url = dato.get('explicacion_url') or ''
+    if explicacion_url:
+        try:
+            _validar_url(explicacion_url)
+        except ValidationError:
+            errores.append('explicacion_url: URL inválida.')
+
+    etiquetas = dato.get('etiquetas') or []
+    if not isinstance(etiquetas, list) or not all(isinstance(e, str) and 0 < len(e.strip()) <= MAX_ETIQUETA
+                                                  for e in etiquetas):
+        errores.append(f'etiquetas: lista de nombres de hasta {MAX_ETIQUETA} caracteres.')
+        etiquetas = []
+
+    opciones = []
+    crudas = dato.get('opciones')
+    correcta = str(dato.get('correcta') or '').strip().upper()
+    if not isinstance(crudas, list) or not 2 <= len(crudas) <= len(LETRAS):
+        errores.append(f'opciones: entre 2 y {len(LETRAS)}.')
+    else:
+        for letra, opcion in zip(LETRAS, crudas):
+            if isinstance(opcion, str):
+                opcion = {'texto': opcion, 'es_correcta': letra == correcta}
+            texto = opcion.get('texto') if isinstance(opcion, dict) else None
+            if not isinstance(texto, str) or not texto.strip() or len(texto) > MAX_TEXTO_OPCION:
+                errores.append(f'opción {letra}: texto de 1 a {MAX_TEXTO_OPCION} caracteres.')
+                continue
+            opciones.append({'texto': texto, 'es_correcta': opcion.get('es_correcta') is True})
+        if len(opciones) == len(crudas) and sum(o['es_correcta'] for o in opciones) != 1:
+            errores.append('opciones: debe haber exactamente una correcta.')
+    if errores:
+        return None, errores
+
+    return {
+        'enunciado': enunciado,
+        'tipo': tipo,
+        'dificultad': dificultad,
+        'explicacion_texto': explicacion_texto,
+        'explicacion_url': explicacion_url,
+        'etiquetas': list(dict.fromkeys(e.strip() for e in etiquetas)),
+        'opciones': opciones,
+        'correct_answer': LETRAS[next(i for i, o in enumerate(opciones) if o['es_correcta'])],
+        'hash': hash_contenido(enunciado, [o['texto'] for o in opciones]),
+    }, []
+
+
+# Importación
+
+class Informe:
+    """Contadores de la importación y las primeras filas con problemas."""
+
+    def __init__(self, max_errores=MAX_ERRORES_INFORME, al_reportar=None):
+        self.leidas = 0
+        self.creadas = 0
+        self.duplicadas = 0
+        self.con_error = 0
+        self.abortada = None
+        self.errores = []
+        self.max_errores = max_errores
+        # Recibe cada entrada del informe (p.ej. para escribirlas todas a un archivo).
+        self.al_reportar = al_reportar
+        self.inicio = time.perf_counter()
+        self.segundos = 0.0
+
+    def reportar(self, entrada):
+        if len(self.errores) < self.max_errores:
+            self.errores.append(entrada)
+        if self.al_reportar:
+            self.al_reportar(entrada)
+
+    def error(self, fila, mensajes):
+        self.con_error += 1
+        self.reportar({'fila': fila, 'errores': mensajes})
+
+    def duplicada(self, fila, pregunta_id):
+        self.duplicadas += 1
+        self.reportar({'fila': fila, 'duplicada_de': pregunta_id})
+
+    @property
+    def filas_por_segundo(self):
+        return round(self.leidas / self.segundos) if self.segundos else 0
+
+    def como_dict(self):
+        return {
+            'leidas': self.leidas,
+            'creadas': self.creadas,
+            'duplicadas': self.duplicadas,
+            'con_error': self.con_error,
+            'abortada': self.abortada,
+            'segundos': round(self.segundos, 3),
+            'filas_por_segundo': self.filas_por_segundo,
+            'errores': self.errores,
+            'errores_omitidos': max(0, self.duplicadas + self.con_error - len(self.errores)),
+        }
+
+
+def _guardar_lote(ensayo, lote, etiquetas, informe):
+    with transaction.atomic():
+        existentes = dict(
+            Pregunta.objects.filter(hash_contenido__in={p['hash'] for _, p in lote})
+            .values_list('hash_contenido', 'id')
+        )
+        nuevas, repetidas, vistas = [], [], set()
+        for fila, pregunta in lote:
+            if pregunta['hash'] in existentes:
+                informe.duplicada(fila, existentes[pregunta['hash']])
+            elif pregunta['hash'] in vistas:
+                repetidas.append((fila, pregunta['hash']))
+            else:
+                vistas.add(pregunta['hash'])
+                nuevas.append(pregunta)
+
+        faltan = list(dict.fromkeys(n for p in nuevas for n in p['etiquetas'] if n not in etiquetas))
+        etiquetas.update(autoria.resolver_etiquetas(faltan))
+
+        creadas = Pregunta.objects.bulk_create([
+            Pregunta(
+                ensayo_id=ensayo.id,
+                enunciado=p['enunciado'],
+                tipo=p['tipo'],
+                explicacion_texto=p['explicacion_texto'],
+                explicacion_url=p['explicacion_url'],
+                correct_answer=p['correct_answer'],
+                hash_contenido=p['hash'],
+                **({'dificultad': p['dificultad']} if p['dificultad'] else {}),
+            ) for p in nuevas
+        ])
+        Opcion.objects.bulk_create([
+            Opcion(pregunta_id=creada.id, texto=o['texto'], es_correcta=o['es_correcta'])
+            for creada, p in zip(creadas, nuevas) for o in p['opciones']
+        ])
+        relacion = Pregunta.etiquetas.through
+        relacion.objects.bulk_create([
+            relacion(pregunta_id=creada.id, etiqueta_id=etiquetas[nombre])
+            for creada, p in zip(creadas, nuevas) for nombre in p['etiquetas']
+        ])
+        snapshots.nueva_version(ensayo.id)
+        busqueda.programar(creada.id for creada in creadas)
+        formulas.programar(*(texto for p in nuevas for texto in
+                             (p['enunciado'], p['explicacion_texto'], *(o['texto'] for o in p['opciones']))))
+
+    por_hash = {p['hash']: creada.id for creada, p in zip(creadas, nuevas)}
+    for fila, h in repetidas:
+        informe.duplicada(fila, por_hash[h])
+    informe.creadas += len(creadas)
+
+
+def importar(texto, formato, ensayo, tamano_lote=TAMANO_LOTE, informe=None, al_avanzar=None):
+    """
+    Importa las preguntas del flujo de texto `texto` al `ensayo`. Cada lote
+    se confirma por separado: si el archivo se corta a la mitad, lo ya
+    importado queda. Llama a `al_avanzar(informe)` después de cada lote.
+    Devuelve el Informe.
+    """
+    informe = informe or Informe()
+    etiquetas = {}
+    lote = []
+    try:
+        for fila, dato, error in LECTORES[formato](texto):
+            informe.leidas += 1
+            if error:
+                informe.error(fila, [error])
+                continue
+            pregunta, errores = validar(dato)
+            if errores:
+                informe.error(fila, errores)
+                continue
+            lote.append((fila, pregunta))
+            if len(lote) >= tamano_lote:
+                _guardar_lote(ensayo, lote, etiquetas, informe)
+                lote = []
+                # Con DEBUG=True Django guarda el SQL de cada consulta; en una
+                # importación larga eso es lo único que crecería con el archivo.
+                reset_queries()
+                informe.segundos = time.perf_counter() - informe.inicio
+                if al_avanzar:
+                    al_avanzar(informe)
+    except (FormatoInvalido, csv.Error, UnicodeDecodeError) as e:
+        informe.abortada = str(e)
+    if lote:
+        _guardar_lote(ensayo, lote, etiquetas, informe)
+    informe.segundos = time.perf_counter() - informe.inicio
+    ensamblador.invalidar_banco()
+    return informe
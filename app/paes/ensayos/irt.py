@@ -0,0 +1,247 @@
+"""
+Calibración TRI (Rasch / 2PL) de las preguntas de un ensayo.
+
+Se ajusta por máxima verosimilitud marginal con EM (Bock-Aitkin) sobre la
+misma matriz alumnos x ítems de ensayos.analisis:
+
+- la habilidad se integra en una grilla fija de nodos con prior N(0, 1);
+- el paso E son dos productos de matrices (alumnos x ítems) @ (ítems x nodos);
+- el paso M es un paso de Newton vectorizado para todos los ítems a la vez
+  sobre la forma pendiente-intercepto P = sigmoide(a * theta + c), con un
+  prior suave sobre a y c para que los ítems que todos aciertan (o nadie)
+  no diverjan.
+
+En Rasch la pendiente es una sola, común a todos los ítems (equivale a fijar
+a = 1 y estimar la varianza de la población). Cada ajuste parte de los
+parámetros guardados en CalibracionPregunta, así que un recalibrado tras unos
+pocos envíos nuevos converge en pocas iteraciones. La habilidad de cada
+Resultado se guarda como estimación EAP con su error.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+
+from . import analisis, calificacion, ensamblador, snapshots
+from .models import CalibracionEnsayo, CalibracionPregunta, HabilidadResultado, Pregunta
+
+MODELO = getattr(settings, 'ENSAYOS_IRT_MODELO', '2pl')
+MIN_ALUMNOS = getattr(settings, 'ENSAYOS_IRT_MIN_ALUMNOS', 30)
+MAX_ITERACIONES = 500
+TOLERANCIA = 1e-4
+NODOS = np.linspace(-4, 4, 41)
+# Varianza de los priors normales sobre el intercepto c y sobre la pendiente a (centrado en 1).
+VARIANZA_C = 25.0
+VARIANZA_A = 1.0
+LIMITES_A = (0.05, 4.0)
+
+# Etiqueta de Pregunta.dificultad según b (en desviaciones estándar de habilidad).
+CORTES_DIFICULTAD = ((-1.0, 'Fácil'), (1.0, 'Media'))
+DIFICULTAD_MAXIMA = 'Difícil'
+
+
+def etiqueta_dificultad(b):
+    for corte, etiqueta in CORTES_DIFICULTAD:
+        if b < corte:
+            return etiqueta
+    return DIFICULTAD_MAXIMA
+
+
+def _logit(p):
+    p = np.clip(p, 0.02, 0.98)
+    return np.log(p / (1 - p))
+
+
+def ajustar(correctas, modelo='2pl', inicial_a=None, inicial_b=None,
+            max_iteraciones=MAX_ITERACIONES, tolerancia=TOLERANCIA):
+    """
+    Ajusta el modelo sobre la matriz 0/1 `correctas` (alumnos x ítems).
+    `inicial_a`/`inicial_b` son arreglos de largo k con los parámetros de
+    partida (NaN para los ítems sin calibración previa).
+    """
+    if modelo not in ('rasch', '2pl'):
+        raise ValueError(f'modelo TRI desconocido: {modelo}')
+    X = correctas.astype(np.float64)
+    n, k = X.shape
+    nodos = NODOS
+    log_prior = -0.5 * nodos ** 2
+    log_prior -= np.log(np.exp(log_prior).sum())
+
+    # Partida: lo guardado si existe, si no una aproximación desde p.
+    a = np.ones(k)
+    c = _logit(X.mean(axis=0)) if n else np.zeros(k)
+    if inicial_b is not None:
+        previa_a = np.ones(k) if inicial_a is None else np.asarray(inicial_a, dtype=np.float64)
+        previa_b = np.asarray(inicial_b, dtype=np.float64)
+        hay = np.isfinite(previa_b) & np.isfinite(previa_a)
+        a[hay] = previa_a[hay]
+        c[hay] = -previa_a[hay] * previa_b[hay]
+    if modelo == 'rasch':
+        a[:] = np.median(a)
+
+    convergio = False
+    iteraciones = 0
+    for iteraciones in range(1, max_iteraciones + 1):
+        # Paso E: posterior de cada alumno sobre los nodos.
+        z = nodos[:, None] * a[None, :] + c[None, :]
+        log_p = -np.logaddexp(0, -z)
+        log_q = -np.logaddexp(0, z)
+        log_post = X @ log_p.T + (1 - X) @ log_q.T + log_prior
+        maximo = log_post.max(axis=1, keepdims=True)
+        post = np.exp(log_post - maximo)
+        suma = post.sum(axis=1, keepdims=True)
+        post /= suma
+        log_verosimilitud = float((maximo + np.log(suma)).sum())
+
+        # Conteos esperados por nodo.
+        n_nodo = post.sum(axis=0)
+        r = post.T @ X
+
+        # Paso M: un paso de Newton por iteración de EM.
+        P = 1 / (1 + np.exp(-z))
+        residuo = r - n_nodo[:, None] * P
+        W = n_nodo[:, None] * P * (1 - P)
+        g_c = residuo.sum(axis=0) - c / VARIANZA_C
+        h_cc = W.sum(axis=0) + 1 / VARIANZA_C
+        g_a = (residuo * nodos[:, None]).sum(axis=0) - (a - 1) / VARIANZA_A
+        h_aa = (W * nodos[:, None] ** 2).sum(axis=0) + 1 / VARIANZA_A
+        h_ac = (W * nodos[:, None]).sum(axis=0)
+
+        if modelo == 'rasch':
+            delta_c = g_c / h_cc
+            delta_a = np.full(k, g_a.sum() / h_aa.sum())
+        else:
+            det = h_aa * h_cc - h_ac ** 2
+            delta_a = (h_cc * g_a - h_ac * g_c) / det
+            delta_c = (h_aa * g_c - h_ac * g_a) / det
+        delta_a = np.clip(delta_a, -0.5, 0.5)
+        delta_c = np.clip(delta_c, -1.0, 1.0)
+        a = np.clip(a + delta_a, *LIMITES_A)
+        c = c + delta_c
+
+        if max(np.abs(delta_a).max(initial=0), np.abs(delta_c).max(initial=0)) < tolerancia:
+            convergio = True
+            break
+
+    theta = post @ nodos if n else np.zeros(0)
+    error = np.sqrt(np.maximum(post @ nodos ** 2 - theta ** 2, 0)) if n else np.zeros(0)
+    return {
+        'modelo': modelo,
+        'a': a,
+        'b': -c / a,
+        'error_b': 1 / (a * np.sqrt(h_cc)) if n else np.full(k, np.nan),
+        'theta': theta,
+        'error_theta': error,
+        'iteraciones': iteraciones,
+        'convergio': convergio,
+        'log_verosimilitud': log_verosimilitud if n else None,
+    }
+
+
+def calibrar(ensayo_id, modelo=None, forzar=False):
+    """
+    Recalibra el ensayo y guarda los parámetros. Devuelve la CalibracionEnsayo
+    (con `duracion` en segundos), o None si todavía no hay suficientes
+    alumnos. Si los datos no cambiaron desde el último ajuste con el mismo
+    modelo (misma analisis.marca) no hace nada, salvo `forzar`, y `duracion`
+    queda en None.
+    """
+    modelo = modelo or MODELO
+    # Se lee antes del ajuste: un envío que llegue durante el ajuste deja la marca atrás.
+    marca = analisis.marca(ensayo_id)
+    anterior = CalibracionEnsayo.objects.filter(ensayo_id=ensayo_id).first()
+    if anterior and not forzar and anterior.marca == _texto(marca) and anterior.modelo == modelo:
+        anterior.duracion = None
+        return anterior
+
+    pregunta_ids, resultado_ids, correctas, _ = analisis.matriz_respuestas(ensayo_id)
+    if len(resultado_ids) < MIN_ALUMNOS or not len(pregunta_ids):
+        return None
+
+    previas = {
+        pregunta_id: (a, b) for pregunta_id, a, b in
+        CalibracionPregunta.objects.filter(ensayo_id=ensayo_id)
+        .values_list('pregunta_id', 'discriminacion_a', 'dificultad_b')
+    }
+    inicial = np.array([previas.get(int(pid), (np.nan, np.nan)) for pid in pregunta_ids], dtype=np.float64)
+
+    inicio = time.perf_counter()
+    ajuste = ajustar(correctas, modelo, inicial[:, 0], inicial[:, 1])
+    duracion = time.perf_counter() - inicio
+
+    with transaction.atomic():
+        CalibracionPregunta.objects.bulk_create(
+            [CalibracionPregunta(
+                pregunta_id=int(pid), ensayo_id=ensayo_id, modelo=modelo,
+                dificultad_b=float(b), discriminacion_a=float(a), error_b=float(e),
+            ) for pid, a, b, e in zip(pregunta_ids, ajuste['a'], ajuste['b'], ajuste['error_b'])],
+            update_conflicts=True, unique_fields=['pregunta'],
+            update_fields=['ensayo', 'modelo', 'dificultad_b', 'discriminacion_a', 'error_b', 'actualizado'],
+        )
+        HabilidadResultado.objects.bulk_create(
+            [HabilidadResultado(resultado_id=int(rid), ensayo_id=ensayo_id, theta=float(t), error=float(e))
+             for rid, t, e in zip(resultado_ids, ajuste['theta'], ajuste['error_theta'])],
+            update_conflicts=True, unique_fields=['resultado'],
+            update_fields=['theta', 'error', 'actualizado'],
+            batch_size=500,
+        )
+        # Pregunta.dificultad pasa de "Sin definir" a una etiqueta según b, en un solo UPDATE
+        # de las que cambiaron.
+        actuales = dict(Pregunta.objects.filter(pk__in=[int(pid) for pid in pregunta_ids])
+                        .values_list('id', 'dificultad'))
+        nuevas = {int(pid): etiqueta_dificultad(b) for pid, b in zip(pregunta_ids, ajuste['b'])}
+        cambiadas = {pid: etiqueta for pid, etiqueta in nuevas.items()
+                     if pid in actuales and actuales[pid] != etiqueta}
+        if cambiadas:
+            Pregunta.objects.filter(pk__in=cambiadas).update(dificultad=Case(
+                *[When(pk=pid, then=Value(etiqueta)) for pid, etiqueta in cambiadas.items()],
+                output_field=CharField(),
+            ))
+            # update() no envía señales: lo que haría signals._invalidar_ensayo,
+            # más el banco del ensamblador, que filtra por dificultad.
+            snapshots.nueva_version(ensayo_id)
+            calificacion.invalidar_pauta(ensayo_id)
+            analisis.invalidar(ensayo_id)
+            ensamblador.invalidar_banco()
+            # La versión que subió este ajuste no es un cambio de datos.
+            marca = (marca[0] + 1,) + marca[1:]
+        calibracion, _ = CalibracionEnsayo.objects.update_or_create(ensayo_id=ensayo_id, defaults={
+            'modelo': modelo,
+            'marca': _texto(marca),
+            'n_alumnos': len(resultado_ids),
+            'iteraciones': ajuste['iteraciones'],
+            'convergio': ajuste['convergio'],
+            'log_verosimilitud': ajuste['log_verosimilitud'],
+        })
+    calibracion.duracion = duracion
+    return calibracion
+
+
+def _texto(marca):
+    return ':'.join(map(str, marca)) if marca else ''
+
+
+def parametros(ensayo_id):
+    calibracion = CalibracionEnsayo.objects.filter(ensayo_id=ensayo_id).first()
+    if calibracion is None:
+        return None
+    return {
+        'ensayo_id': ensayo_id,
+        'modelo': calibracion.modelo,
+        'n_alumnos': calibracion.n_alumnos,
+        'iteraciones': calibracion.iteraciones,
+        'convergio': calibracion.convergio,
+        'log_verosimilitud': calibracion.log_verosimilitud,
+        'actualizado': calibracion.actualizado,
+        'preguntas': [{
+            'pregunta_id': pregunta_id,
+            'dificultad_b': round(b, 4),
+            'discriminacion_a': round(a, 4),
+            'error_b': round(e, 4) if e is not None else None,
+            'dificultad': etiqueta_dificultad(b),
+        } for pregunta_id, b, a, e in
+            CalibracionPregunta.objects.filter(ensayo_id=ensayo_id).order_by('pregunta_id')
+            .values_list('pregunta_id', 'dificultad_b', 'discriminacion_a', 'error_b')],
+    }
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ensayos import analisis
+
+
+class Command(BaseCommand):
+    help = 'Mide el análisis de ítems sobre una matriz sintética alumnos x ítems (no usa la base de datos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alumnos', type=int, default=5000)
+        parser.add_argument('--items', type=int, default=80)
+        parser.add_argument('--opciones', type=int, default=4)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        n, k, m = options['alumnos'], options['items'], options['opciones']
+        rng = np.random.default_rng(options['semilla'])
+
+        # Respuestas simuladas con un modelo logístico para que haya correlación real.
+        habilidad = rng.normal(size=(n, 1))
+        dificultad = rng.normal(size=(1, k))
+        correctas = (rng.random((n, k)) < 1 / (1 + np.exp(-(habilidad - dificultad)))).astype(np.int8)
+        opcion_ids = np.arange(1, k * m + 1).reshape(k, m)
+        distractor = opcion_ids[np.arange(k), rng.integers(1, m, size=(n, k))]
+        elegidas = np.where(correctas == 1, opcion_ids[:, 0], distractor)
+        opciones_por_item = [[(int(o), i == 0) for i, o in enumerate(opcion_ids[j])] for j in range(k)]
+
+        tiempos = []
+        for _ in range(options['repeticiones']):
+            inicio = time.perf_counter()
+            data = analisis.analizar_matriz(correctas, elegidas, opciones_por_item)
+            tiempos.append(time.perf_counter() - inicio)
+
+        self.stdout.write(
+            f'{n} alumnos x {k} ítems: mejor {min(tiempos) * 1000:.1f} ms, '
+            f'mediana {sorted(tiempos)[len(tiempos) // 2] * 1000:.1f} ms '
+            f'(KR-20 = {data["kr20"]})')
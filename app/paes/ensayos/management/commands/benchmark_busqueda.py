@@ -0,0 +1,97 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from ensayos import busqueda
+
+PALABRAS = (
+    'función cuadrática ecuación recta pendiente triángulo área perímetro círculo radio '
+    'probabilidad muestra promedio mediana porcentaje fracción potencia raíz logaritmo '
+    'vector ángulo seno coseno velocidad fuerza energía célula fotosíntesis molécula átomo '
+    'reacción ácido base texto párrafo autor narrador argumento tesis conector sinónimo '
+    'historia república constitución economía territorio población guerra revolución siglo'
+).split()
+# Vocabulario sintético con frecuencias tipo Zipf, para que haya términos comunes y raros.
+VOCABULARIO = 20_000
+ETIQUETAS = ['Álgebra', 'Geometría', 'Datos', 'Números', 'Biología', 'Química', 'Física', 'Lectura', 'Historia']
+
+
+class Command(BaseCommand):
+    help = ('Compara FTS5 contra LIKE sobre un banco sintético de preguntas, en una base '
+            'SQLite temporal (no toca la base del proyecto).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preguntas', type=int, default=100_000)
+        parser.add_argument('--consultas', type=int, default=50)
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def _texto(self, rng, n):
+        return ' '.join(rng.choices(self.palabras, cum_weights=self.acumulados, k=n))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['semilla'])
+        n = options['preguntas']
+        self.palabras = PALABRAS + [f'{rng.choice(PALABRAS)[:4]}{i}' for i in range(VOCABULARIO - len(PALABRAS))]
+        self.acumulados = []
+        total = 0.0
+        for rango in range(1, len(self.palabras) + 1):
+            total += 1 / rango
+            self.acumulados.append(total)
+        with tempfile.TemporaryDirectory() as carpeta:
+            db = sqlite3.connect(os.path.join(carpeta, 'banco.sqlite3'))
+            db.execute('CREATE TABLE pregunta (id INTEGER PRIMARY KEY, enunciado TEXT, opciones TEXT, '
+                       'explicacion TEXT, etiquetas TEXT)')
+            db.execute(busqueda.DDL)
+
+            inicio = time.perf_counter()
+            filas = [(i, self._texto(rng, 25), '\n'.join(self._texto(rng, 4) for _ in range(4)),
+                      self._texto(rng, 15), rng.choice(ETIQUETAS)) for i in range(1, n + 1)]
+            with db:
+                db.executemany('INSERT INTO pregunta VALUES (?, ?, ?, ?, ?)', filas)
+            t_tabla = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            with db:
+                db.execute(f'INSERT INTO {busqueda.TABLA} (rowid, enunciado, opciones, explicacion, etiquetas) '
+                           'SELECT id, enunciado, opciones, explicacion, etiquetas FROM pregunta')
+                db.execute(f"INSERT INTO {busqueda.TABLA} ({busqueda.TABLA}) VALUES ('optimize')")
+            t_indice = time.perf_counter() - inicio
+            self.stdout.write(f'{n} preguntas: tabla {t_tabla:.1f} s, índice FTS5 {t_indice:.1f} s')
+
+            # Consultas de dos términos de frecuencia media.
+            consultas = [' '.join(rng.sample(self.palabras[50:2000], 2)) for _ in range(options['consultas'])]
+            pesos = ', '.join(str(p) for p in busqueda.PESOS)
+
+            def medir(sql, parametros):
+                tiempos = []
+                for params in parametros:
+                    inicio = time.perf_counter()
+                    db.execute(sql, params).fetchall()
+                    tiempos.append(time.perf_counter() - inicio)
+                return statistics.median(tiempos) * 1000, max(tiempos) * 1000
+
+            casos = [
+                ('FTS5 ranking (top 20)',
+                 f'SELECT rowid, bm25({busqueda.TABLA}, {pesos}) AS r FROM {busqueda.TABLA} '
+                 f'WHERE {busqueda.TABLA} MATCH ? ORDER BY r LIMIT 20',
+                 [(busqueda.consulta_fts(c),) for c in consultas]),
+                ('FTS5 con prefijo (top 20)',
+                 f'SELECT rowid FROM {busqueda.TABLA} WHERE {busqueda.TABLA} MATCH ? ORDER BY rank LIMIT 20',
+                 [(busqueda.consulta_fts(c[:-2]),) for c in consultas]),
+                ('LIKE enunciado (top 20)',
+                 'SELECT id FROM pregunta WHERE enunciado LIKE ? AND enunciado LIKE ? LIMIT 20',
+                 [tuple(f'%{p}%' for p in c.split()) for c in consultas]),
+                ('LIKE todas las columnas',
+                 'SELECT id FROM pregunta WHERE (enunciado || opciones || explicacion || etiquetas) LIKE ? '
+                 'AND (enunciado || opciones || explicacion || etiquetas) LIKE ?',
+                 [tuple(f'%{p}%' for p in c.split()) for c in consultas]),
+            ]
+            for nombre, sql, parametros in casos:
+                mediana, maximo = medir(sql, parametros)
+                self.stdout.write(f'{nombre:<26} mediana {mediana:8.2f} ms   máx {maximo:8.2f} ms')
+            db.close()
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ensayos import ensamblador
+
+
+class Command(BaseCommand):
+    help = ('Mide cuánto tarda el generador en elegir las preguntas de un ensayo sobre un '
+            'banco sintético (no usa la base de datos).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', type=int, default=50000)
+        parser.add_argument('--etiquetas', type=int, default=200)
+        parser.add_argument('--preguntas', type=int, default=80)
+        parser.add_argument('--minimos', type=int, default=10,
+                            help='Cantidad de etiquetas con mínimo (5 preguntas cada una).')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['semilla'])
+        n_banco = options['banco']
+        n_etiquetas = options['etiquetas']
+        # Etiquetas con frecuencia tipo Zipf: unas pocas muy comunes, muchas escasas.
+        pesos = 1 / np.arange(1, n_etiquetas + 1)
+        pesos /= pesos.sum()
+        etiquetas = [
+            tuple(rng.choice(n_etiquetas, size=rng.integers(1, 4), replace=False, p=pesos))
+            for _ in range(n_banco)
+        ]
+        inicio = time.perf_counter()
+        banco = ensamblador.Banco(
+            np.arange(1, n_banco + 1),
+            rng.choice(['Matemática', 'Lenguaje', 'Ciencias', 'Historia'], size=n_banco),
+            ['alternativa_simple'] * n_banco,
+            rng.normal(size=n_banco),
+            etiquetas,
+        )
+        self.stdout.write(f'banco de {n_banco} preguntas armado en {(time.perf_counter() - inicio) * 1000:.0f} ms')
+
+        minimos = {int(e): 5 for e in rng.choice(np.arange(5, 60), options['minimos'], replace=False)}
+        disponible = banco.mascara(materia='Matemática')
+        escenarios = [
+            ('sin restricciones', {}, None),
+            ('mínimos por etiqueta', minimos, None),
+            ('mínimos + banda [0.3, 0.5]', minimos, (0.3, 0.5)),
+            ('mínimos + banda [1.0, 1.1]', minimos, (1.0, 1.1)),
+        ]
+        self.stdout.write(f'{"escenario":<28} {"ms prom":>8} {"ms máx":>8} {"b prom":>7}')
+        for nombre, mins, banda in escenarios:
+            tiempos = []
+            for i in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                try:
+                    elegidas = ensamblador.resolver(banco, options['preguntas'], mins, banda, disponible, semilla=i)
+                except ensamblador.Infactible as e:
+                    self.stdout.write(f'{nombre:<28} infactible: {e}')
+                    break
+                tiempos.append(time.perf_counter() - inicio)
+            else:
+                self.stdout.write(
+                    f'{nombre:<28} {np.mean(tiempos) * 1000:>8.1f} {max(tiempos) * 1000:>8.1f} '
+                    f'{banco.dificultades[elegidas].mean():>7.2f}')
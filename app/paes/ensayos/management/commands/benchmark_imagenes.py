@@ -0,0 +1,79 @@
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from ensayos import imagenes
+
+
+def _sintetica(ruta, ancho, alto, rng):
+    # Degradados y figuras con algo de ruido: se comprime parecido a una foto o un escaneo.
+    y, x = np.mgrid[0:alto, 0:ancho].astype(np.float32)
+    canales = [
+        128 + 100 * np.sin(x / rng.uniform(40, 200) + rng.uniform(0, 6)) * np.cos(y / rng.uniform(40, 200)),
+        128 + 100 * np.sin((x + y) / rng.uniform(60, 300)),
+        128 + 100 * np.cos(np.hypot(x - ancho / 2, y - alto / 2) / rng.uniform(30, 120)),
+    ]
+    pixeles = np.stack(canales, axis=-1) + rng.normal(0, 8, size=(alto, ancho, 3))
+    Image.fromarray(np.clip(pixeles, 0, 255).astype(np.uint8)).save(ruta, 'JPEG', quality=92)
+
+
+class Command(BaseCommand):
+    help = ('Mide cuántas imágenes por segundo pasan por la generación de variantes con 1..N '
+            'procesos, y compara el peso de las variantes JPEG y WebP (no usa la base de datos).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--imagenes', type=int, default=24)
+        parser.add_argument('--ancho', type=int, default=3000)
+        parser.add_argument('--alto', type=int, default=2000)
+        parser.add_argument('--procesos', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['semilla'])
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            origenes = []
+            for i in range(options['imagenes']):
+                ruta = tmp / f'{i}.jpg'
+                _sintetica(ruta, options['ancho'], options['alto'], rng)
+                origenes.append(ruta)
+            peso = sum(r.stat().st_size for r in origenes) / len(origenes) / 1024
+            self.stdout.write(f'{len(origenes)} imágenes {options["ancho"]}x{options["alto"]} '
+                              f'de {peso:.0f} KB en promedio')
+
+            # Sin pool: cuánto ahorra decodificar el JPEG ya reducido (Image.draft).
+            for draft in (False, True):
+                destino = tmp / f'draft-{draft}'
+                inicio = time.perf_counter()
+                for i, origen in enumerate(origenes[:4]):
+                    imagenes.generar_variantes(origen, destino / str(i), draft=draft)
+                ms = (time.perf_counter() - inicio) / min(4, len(origenes)) * 1000
+                self.stdout.write(f'{"con" if draft else "sin"} draft: {ms:.0f} ms por imagen')
+
+            self.stdout.write(f'{"procesos":>8} {"img/s":>8} {"s total":>8}')
+            contexto = multiprocessing.get_context('spawn')
+            procesos = 1
+            while True:
+                with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+                    # Se arranca el pool antes de medir.
+                    list(pool.map(abs, range(procesos)))
+                    inicio = time.perf_counter()
+                    destinos = [tmp / f'p{procesos}' / str(i) for i in range(len(origenes))]
+                    escritos = list(pool.map(imagenes.generar_variantes, origenes, destinos))
+                    segundos = time.perf_counter() - inicio
+                self.stdout.write(f'{procesos:>8} {len(origenes) / segundos:>8.1f} {segundos:>8.2f}')
+                if procesos >= options['procesos']:
+                    break
+                procesos = min(procesos * 2, options['procesos'])
+
+            self.stdout.write(f'{"variante":<12} {"JPEG KB":>8} {"WebP KB":>8}')
+            for variante in imagenes.VARIANTES:
+                jpg = np.mean([e[imagenes.nombre_variante(variante, 'jpg')] for e in escritos]) / 1024
+                webp = np.mean([e[imagenes.nombre_variante(variante, 'webp')] for e in escritos]) / 1024
+                self.stdout.write(f'{variante:<12} {jpg:>8.1f} {webp:>8.1f}')
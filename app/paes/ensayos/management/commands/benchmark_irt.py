@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ensayos import irt
+
+
+class Command(BaseCommand):
+    help = ('Mide el tiempo de ajuste TRI según la cantidad de alumnos, en frío y con '
+            'arranque desde el ajuste anterior (no usa la base de datos).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alumnos', type=int, nargs='+', default=[500, 1000, 5000, 20000])
+        parser.add_argument('--items', type=int, default=80)
+        parser.add_argument('--modelo', choices=['rasch', '2pl'], default='2pl')
+        parser.add_argument('--nuevos', type=float, default=0.05,
+                            help='Fracción de alumnos nuevos para el reajuste incremental.')
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['semilla'])
+        k = options['items']
+        a_real = rng.lognormal(0, 0.3, size=k) if options['modelo'] == '2pl' else np.ones(k)
+        b_real = rng.normal(size=k)
+
+        def simular(n):
+            theta = rng.normal(size=(n, 1))
+            return (rng.random((n, k)) < 1 / (1 + np.exp(-a_real * (theta - b_real)))).astype(np.int8)
+
+        self.stdout.write(f'{"alumnos":>8} {"frío ms":>9} {"iter":>5} {"incremental ms":>15} {"iter":>5} {"rmse b":>7}')
+        for n in options['alumnos']:
+            base = simular(n)
+            inicio = time.perf_counter()
+            frio = irt.ajustar(base, options['modelo'])
+            t_frio = time.perf_counter() - inicio
+
+            ampliada = np.vstack([base, simular(max(1, int(n * options['nuevos'])))])
+            inicio = time.perf_counter()
+            tibio = irt.ajustar(ampliada, options['modelo'], frio['a'], frio['b'])
+            t_tibio = time.perf_counter() - inicio
+
+            rmse = float(np.sqrt(((tibio['b'] - b_real) ** 2).mean()))
+            self.stdout.write(
+                f'{n:>8} {t_frio * 1000:>9.0f} {frio["iteraciones"]:>5} '
+                f'{t_tibio * 1000:>15.0f} {tibio["iteraciones"]:>5} {rmse:>7.3f}')
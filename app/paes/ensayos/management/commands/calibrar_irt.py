@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ensayos import irt
+from ensayos.models import Ensayo
+
+
+class Command(BaseCommand):
+    help = ('Calibra con TRI (Rasch o 2PL) las preguntas de los ensayos con envíos nuevos. '
+            'Pensado para correr periódicamente (p.ej. cada noche).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ensayos', nargs='*', type=int,
+                            help='Ids de ensayo a calibrar (por defecto, todos).')
+        parser.add_argument('--modelo', choices=['rasch', '2pl'], default=None)
+        parser.add_argument('--forzar', action='store_true',
+                            help='Recalibra aunque no haya envíos desde el último ajuste.')
+
+    def handle(self, *args, **options):
+        ids = options['ensayos'] or list(Ensayo.objects.order_by('id').values_list('id', flat=True))
+        for ensayo_id in ids:
+            calibracion = irt.calibrar(ensayo_id, options['modelo'], forzar=options['forzar'])
+            if calibracion is None:
+                self.stdout.write(f'Ensayo {ensayo_id}: menos de {irt.MIN_ALUMNOS} alumnos, se omite.')
+            elif calibracion.duracion is None:
+                self.stdout.write(f'Ensayo {ensayo_id}: sin envíos nuevos.')
+            else:
+                estado = 'convergió' if calibracion.convergio else 'NO convergió'
+                self.stdout.write(
+                    f'Ensayo {ensayo_id}: {calibracion.modelo}, {calibracion.n_alumnos} alumnos, '
+                    f'{calibracion.iteraciones} iteraciones ({estado}) en {calibracion.duracion * 1000:.0f} ms.')
@@ -0,0 +1,62 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ensayos import imagenes
+from ensayos.models import Pregunta
+
+EXTENSIONES = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+class Command(BaseCommand):
+    help = ('Importa imágenes desde archivos o carpetas (por ejemplo la antigua carpeta '
+            'preguntas/), sin duplicar las que tienen el mismo contenido, y genera sus variantes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('rutas', nargs='+')
+        parser.add_argument('--pregunta', type=int,
+                            help='Asocia la imagen a esta pregunta (sólo con un archivo).')
+
+    def handle(self, *args, **options):
+        archivos = []
+        for ruta in map(Path, options['rutas']):
+            if ruta.is_dir():
+                archivos.extend(sorted(p for p in ruta.rglob('*') if p.suffix.lower() in EXTENSIONES))
+            elif ruta.is_file():
+                archivos.append(ruta)
+            else:
+                raise CommandError(f'No existe {ruta}.')
+        pregunta = None
+        if options['pregunta']:
+            if len(archivos) != 1:
+                raise CommandError('--pregunta requiere exactamente un archivo.')
+            pregunta = Pregunta.objects.filter(pk=options['pregunta']).first()
+            if pregunta is None:
+                raise CommandError(f'No existe la pregunta {options["pregunta"]}.')
+
+        inicio = time.perf_counter()
+        nuevas, repetidas = [], 0
+        for ruta in archivos:
+            with open(ruta, 'rb') as archivo:
+                try:
+                    imagen, creada = imagenes.guardar(archivo, variantes=False)
+                except imagenes.ImagenInvalida as e:
+                    self.stdout.write(self.style.WARNING(f'  {ruta}: {e}'))
+                    continue
+            if creada:
+                nuevas.append(imagen)
+            else:
+                repetidas += 1
+                self.stdout.write(f'  {ruta}: igual a la imagen {imagen.id}')
+            if pregunta is not None:
+                pregunta.imagen = imagen
+                pregunta.save(update_fields=['imagen'])
+
+        if imagenes.PROCESOS < 1:
+            imagenes.PROCESOS = 1
+        for tarea in [imagenes.encargar_variantes(imagen) for imagen in nuevas]:
+            tarea.result()
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(archivos)} archivos: {len(nuevas)} imágenes nuevas, {repetidas} repetidas, '
+            f'variantes generadas en {time.perf_counter() - inicio:.1f} s con {imagenes.PROCESOS} procesos.'))
@@ -0,0 +1,70 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ensayos import importacion
+from ensayos.models import Ensayo
+
+
+class Command(BaseCommand):
+    help = ('Importa un banco de preguntas desde CSV, NDJSON o JSON a un ensayo, leyendo el '
+            'archivo por partes. Ver ensayos/importacion.py para el formato de cada tipo.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=importacion.FORMATOS,
+                            help='Por defecto se deduce de la extensión.')
+        parser.add_argument('--ensayo', type=int, help='Id de un ensayo existente.')
+        parser.add_argument('--titulo', help='Crea un ensayo nuevo con este título.')
+        parser.add_argument('--materia', default='Materia')
+        parser.add_argument('--curso', default='Curso')
+        parser.add_argument('--lote', type=int, default=importacion.TAMANO_LOTE)
+        parser.add_argument('--reporte', help='Escribe aquí (CSV) todas las filas con errores o duplicadas.')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or importacion.formato_de(options['archivo'])
+        if formato is None:
+            raise CommandError('No se reconoce el formato; use --formato.')
+        if options['ensayo']:
+            ensayo = Ensayo.objects.filter(pk=options['ensayo']).first()
+            if ensayo is None:
+                raise CommandError(f'No existe el ensayo {options["ensayo"]}.')
+        elif options['titulo']:
+            ensayo = Ensayo.objects.create(titulo=options['titulo'], materia=options['materia'],
+                                           curso=options['curso'])
+        else:
+            raise CommandError('Indique --ensayo o --titulo.')
+
+        reporte = open(options['reporte'], 'w', newline='', encoding='utf-8') if options['reporte'] else None
+        try:
+            if reporte:
+                escritor = csv.writer(reporte)
+                escritor.writerow(['fila', 'duplicada_de', 'errores'])
+                al_reportar = lambda e: escritor.writerow(
+                    [e['fila'], e.get('duplicada_de', ''), ' | '.join(e.get('errores', []))])
+            else:
+                al_reportar = None
+            informe = importacion.Informe(al_reportar=al_reportar)
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as texto:
+                importacion.importar(texto, formato, ensayo, options['lote'], informe, self._avance)
+        finally:
+            if reporte:
+                reporte.close()
+
+        resumen = informe.como_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ensayo {ensayo.id}: {resumen["creadas"]} creadas, {resumen["duplicadas"]} duplicadas, '
+            f'{resumen["con_error"]} con error de {resumen["leidas"]} filas en {resumen["segundos"]:.1f} s '
+            f'({resumen["filas_por_segundo"]} filas/s).'))
+        if not reporte:
+            for entrada in resumen['errores'][:20]:
+                self.stdout.write(f'  fila {entrada["fila"]}: '
+                                  + (f'duplicada de la pregunta {entrada["duplicada_de"]}' if 'duplicada_de' in entrada
+                                     else '; '.join(entrada['errores'])))
+            if resumen['duplicadas'] + resumen['con_error'] > 20:
+                self.stdout.write('  ... (use --reporte para ver todas)')
+        if informe.abortada:
+            raise CommandError(f'Importación interrumpida: {informe.abortada}')
+
+    def _avance(self, informe):
+        self.stdout.write(f'{informe.leidas} filas, {informe.creadas} creadas ({informe.filas_por_segundo} filas/s)')
@@ -0,0 +1,42 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ensayos import cola
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de envíos asíncronos (EnvioPendiente) por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=cola.WORKERS,
+                            help='Cantidad de hilos consumidores.')
+        parser.add_argument('--lote', type=int, default=cola.TAMANO_LOTE,
+                            help='Envíos reclamados por lote.')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Vacía la cola y termina en vez de quedar escuchando.')
+
+    def handle(self, *args, **options):
+        recuperados = cola.recuperar_abandonados()
+        if recuperados:
+            self.stdout.write(f'{recuperados} envíos abandonados devueltos a la cola.')
+
+        if options['una_vez']:
+            total = cola.procesar_pendientes(options['lote'])
+            self.stdout.write(self.style.SUCCESS(f'{total} envíos procesados.'))
+            return
+
+        detener = threading.Event()
+        hilos = [
+            threading.Thread(target=cola.bucle_worker, args=(detener, options['lote']), daemon=True)
+            for _ in range(max(1, options['workers']))
+        ]
+        for hilo in hilos:
+            hilo.start()
+        self.stdout.write(f'Procesando envíos con {len(hilos)} workers (Ctrl+C para salir).')
+        try:
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(1)
+        except KeyboardInterrupt:
+            detener.set()
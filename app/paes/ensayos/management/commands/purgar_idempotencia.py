@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ensayos import idempotencia
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves de idempotencia de envíos que ya vencieron.'
+
+    def handle(self, *args, **options):
+        borradas = idempotencia.purgar_expiradas()
+        self.stdout.write(self.style.SUCCESS(f'{borradas} claves vencidas borradas.'))
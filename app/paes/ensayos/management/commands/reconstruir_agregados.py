@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ensayos import agregados
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los agregados de results_summary.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ensayos', nargs='*', type=int,
+                            help='Ids de ensayo a reconstruir (por defecto, todos).')
+
+    def handle(self, *args, **options):
+        total = agregados.reconstruir(options['ensayos'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Agregados reconstruidos para {total} ensayos.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ensayos import busqueda
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero el índice de búsqueda de preguntas (FTS5).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=busqueda.TAMANO_LOTE)
+
+    def handle(self, *args, **options):
+        if not busqueda.disponible():
+            raise CommandError('La búsqueda requiere SQLite con FTS5.')
+        total = busqueda.reindexar_todo(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} preguntas indexadas.'))
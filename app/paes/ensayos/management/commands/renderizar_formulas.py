@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ensayos import formulas
+from ensayos.models import Opcion, Pregunta
+
+
+class Command(BaseCommand):
+    help = ('Renderiza a SVG todas las fórmulas $...$ del banco de preguntas que aún no '
+            'estén en disco (por ejemplo después de un despliegue nuevo).')
+
+    def handle(self, *args, **options):
+        if not formulas.disponible():
+            raise CommandError('Se necesita matplotlib para renderizar fórmulas.')
+        if formulas.PROCESOS < 1:
+            formulas.PROCESOS = 1
+        inicio = time.perf_counter()
+        encontradas = set()
+        for enunciado, explicacion in Pregunta.objects.values_list('enunciado', 'explicacion_texto').iterator(2000):
+            encontradas.update(formulas.extraer(enunciado), formulas.extraer(explicacion))
+        for texto in Opcion.objects.values_list('texto', flat=True).iterator(2000):
+            encontradas.update(formulas.extraer(texto))
+        nuevas = formulas.registrar(encontradas, esperar=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(encontradas)} fórmulas distintas, {nuevas} renderizadas en '
+            f'{time.perf_counter() - inicio:.1f} s con {formulas.PROCESOS} procesos.'))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 10:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0003_remove_pregunta_enunciado_img_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('respuestas', models.JSONField(default=list)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=12)),
+                ('reclamado_por', models.CharField(blank=True, default='', max_length=64)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('errores', models.JSONField(blank=True, default=list)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='envios_pendientes', to='ensayos.ensayo')),
+                ('resultado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='ensayos.resultado')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'id'], name='ensayos_env_estado_16e087_idx')],
+            },
+        ),
+    ]
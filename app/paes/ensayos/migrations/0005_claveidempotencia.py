@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 10:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0004_enviopendiente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100)),
+                ('codigo_estado', models.PositiveSmallIntegerField()),
+                ('respuesta', models.JSONField(default=dict)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ensayos.ensayo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('alumno', 'clave'), name='ensayos_idempotencia_alumno_clave')],
+            },
+        ),
+    ]
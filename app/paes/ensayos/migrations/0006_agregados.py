@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-18 10:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def reconstruir_agregados(apps, schema_editor):
+    from ensayos import agregados
+    agregados.reconstruir(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0005_claveidempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgregadoEnsayo',
+            fields=[
+                ('ensayo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='agregado', serialize=False, to='ensayos.ensayo')),
+                ('envios', models.PositiveIntegerField(default=0)),
+                ('participantes', models.PositiveIntegerField(default=0)),
+                ('sin_etiqueta_respondidas', models.PositiveIntegerField(default=0)),
+                ('sin_etiqueta_correctas', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AgregadoPregunta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('respondidas', models.PositiveIntegerField(default=0)),
+                ('correctas', models.PositiveIntegerField(default=0)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregados_pregunta', to='ensayos.ensayo')),
+                ('pregunta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='agregado', to='ensayos.pregunta')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AgregadoEtiqueta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('respondidas', models.PositiveIntegerField(default=0)),
+                ('correctas', models.PositiveIntegerField(default=0)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregados_etiqueta', to='ensayos.ensayo')),
+                ('etiqueta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ensayos.etiqueta')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ensayo', 'etiqueta'), name='ensayos_agregado_etiqueta_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgregadoTipo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('respondidas', models.PositiveIntegerField(default=0)),
+                ('correctas', models.PositiveIntegerField(default=0)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregados_tipo', to='ensayos.ensayo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ensayo', 'tipo'), name='ensayos_agregado_tipo_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ParticipanteEnsayo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participantes', to='ensayos.ensayo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ensayo', 'alumno'), name='ensayos_participante_unico')],
+            },
+        ),
+        migrations.RunPython(reconstruir_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0006_agregados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalibracionEnsayo',
+            fields=[
+                ('ensayo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calibracion', serialize=False, to='ensayos.ensayo')),
+                ('modelo', models.CharField(choices=[('rasch', 'Rasch'), ('2pl', '2PL')], max_length=10)),
+                ('envios', models.PositiveIntegerField(default=0)),
+                ('n_alumnos', models.PositiveIntegerField(default=0)),
+                ('iteraciones', models.PositiveIntegerField(default=0)),
+                ('convergio', models.BooleanField(default=False)),
+                ('log_verosimilitud', models.FloatField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalibracionPregunta',
+            fields=[
+                ('pregunta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calibracion', serialize=False, to='ensayos.pregunta')),
+                ('modelo', models.CharField(choices=[('rasch', 'Rasch'), ('2pl', '2PL')], max_length=10)),
+                ('dificultad_b', models.FloatField()),
+                ('discriminacion_a', models.FloatField(default=1.0)),
+                ('error_b', models.FloatField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calibraciones_pregunta', to='ensayos.ensayo')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HabilidadResultado',
+            fields=[
+                ('resultado', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='habilidad', serialize=False, to='ensayos.resultado')),
+                ('theta', models.FloatField()),
+                ('error', models.FloatField()),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='habilidades', to='ensayos.ensayo')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 10:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0007_calibracion_irt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ensayo',
+            index=models.Index(fields=['-fecha', '-id'], name='ensayos_ensayo_fecha_id'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 10:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0008_ensayo_indice_fecha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ensayo',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='SnapshotEnsayo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('contenido', models.BinaryField()),
+                ('contenido_gzip', models.BinaryField()),
+                ('etag', models.CharField(max_length=80)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('ensayo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='ensayos.ensayo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ensayo', 'version'), name='ensayos_snapshot_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0009_snapshots'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='snapshotensayo',
+            name='ensayos_snapshot_version',
+        ),
+        migrations.AddField(
+            model_name='snapshotensayo',
+            name='variante',
+            field=models.CharField(choices=[('completo', 'Completo'), ('alumno', 'Alumno')], default='completo', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='snapshotensayo',
+            constraint=models.UniqueConstraint(fields=('ensayo', 'version', 'variante'), name='ensayos_snapshot_version_variante'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+def numerar_intentos(apps, schema_editor):
+    # Los resultados existentes se numeran por alumno y ensayo en orden de creación.
+    Resultado = apps.get_model('ensayos', 'Resultado')
+    contadores = {}
+    cambiados = []
+    for resultado in Resultado.objects.order_by('id').only('id', 'alumno_id', 'ensayo_id'):
+        clave = (resultado.alumno_id, resultado.ensayo_id)
+        contadores[clave] = contadores.get(clave, 0) + 1
+        if contadores[clave] > 1:
+            resultado.intento = contadores[clave]
+            cambiados.append(resultado)
+    Resultado.objects.bulk_update(cambiados, ['intento'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0010_snapshot_variante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultado',
+            name='intento',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(numerar_intentos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+CREAR = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ensayos_pregunta_fts USING fts5("
+    "enunciado, opciones, explicacion, etiquetas, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+POBLAR = """
+INSERT INTO ensayos_pregunta_fts (rowid, enunciado, opciones, explicacion, etiquetas)
+SELECT p.id,
+       p.enunciado,
+       coalesce((SELECT group_concat(o.texto, char(10)) FROM ensayos_opcion o WHERE o.pregunta_id = p.id), ''),
+       trim(p.explicacion_texto || ' ' || p.explicacion_url),
+       coalesce((SELECT group_concat(e.nombre, ' ')
+                 FROM ensayos_pregunta_etiquetas pe JOIN ensayos_etiqueta e ON e.id = pe.etiqueta_id
+                 WHERE pe.pregunta_id = p.id), '')
+FROM ensayos_pregunta p
+"""
+
+
+def crear_indice(apps, schema_editor):
+    # FTS5 es propio de SQLite; con otra base la búsqueda queda deshabilitada.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREAR)
+    schema_editor.execute(POBLAR)
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS ensayos_pregunta_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0011_resultado_intento'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0012_pregunta_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pregunta',
+            name='origen',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copias', to='ensayos.pregunta'),
+        ),
+    ]
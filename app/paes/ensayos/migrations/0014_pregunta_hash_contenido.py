@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 11:04
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalizar(texto):
+    return ' '.join(unicodedata.normalize('NFKC', texto or '').casefold().split())
+
+
+def calcular_hashes(apps, schema_editor):
+    # Mismo cálculo que ensayos.importacion.hash_contenido, copiado para que la
+    # migración no dependa del código actual de la app.
+    Pregunta = apps.get_model('ensayos', 'Pregunta')
+    Opcion = apps.get_model('ensayos', 'Opcion')
+    ids = list(Pregunta.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(ids), 500):
+        lote = {pid: (enunciado, []) for pid, enunciado in
+                Pregunta.objects.filter(pk__in=ids[i:i + 500]).values_list('id', 'enunciado')}
+        for pregunta_id, texto in Opcion.objects.filter(pregunta_id__in=lote).values_list('pregunta_id', 'texto'):
+            lote[pregunta_id][1].append(texto)
+        cambiadas = []
+        for pid, (enunciado, opciones) in lote.items():
+            h = hashlib.blake2b(_normalizar(enunciado).encode(), digest_size=16)
+            for texto in sorted(_normalizar(t) for t in opciones):
+                h.update(b'\x1f' + texto.encode())
+            cambiadas.append(Pregunta(id=pid, hash_contenido=h.hexdigest()))
+        Pregunta.objects.bulk_update(cambiadas, ['hash_contenido'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0013_pregunta_origen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pregunta',
+            name='hash_contenido',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=32),
+        ),
+        migrations.RunPython(calcular_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def borrar_snapshots(apps, schema_editor):
+    # EnsayoSerializer ahora incluye las fórmulas de cada pregunta; los
+    # snapshots guardados se vuelven a generar en la primera lectura.
+    apps.get_model('ensayos', 'SnapshotEnsayo').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0014_pregunta_hash_contenido'),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_snapshots, migrations.RunPython.noop),
+    ]
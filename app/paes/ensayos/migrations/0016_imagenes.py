@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 11:25
+
+import django.db.models.deletion
+import ensayos.models
+from django.db import migrations, models
+
+
+def borrar_snapshots(apps, schema_editor):
+    # EnsayoSerializer ahora incluye la imagen de cada pregunta.
+    apps.get_model('ensayos', 'SnapshotEnsayo').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0015_snapshots_formulas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Imagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=32, unique=True)),
+                ('archivo', models.FileField(max_length=200, upload_to=ensayos.models.ruta_imagen)),
+                ('formato', models.CharField(max_length=10)),
+                ('ancho', models.PositiveIntegerField()),
+                ('alto', models.PositiveIntegerField()),
+                ('bytes', models.PositiveIntegerField()),
+                ('transparente', models.BooleanField(default=False)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pregunta',
+            name='imagen',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='preguntas', to='ensayos.imagen'),
+        ),
+        migrations.RunPython(borrar_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ensayos', '0016_imagenes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='calibracionensayo',
+            name='envios',
+        ),
+        migrations.AddField(
+            model_name='calibracionensayo',
+            name='marca',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
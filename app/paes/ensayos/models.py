@@ -12,8 +12,43 @@ class Ensayo(models.Model):
     curso = models.CharField(max_length=50, default="Curso")
     fecha = models.DateTimeField(auto_now_add=True)
     creador = models.ForeignKey(Usuario, on_delete=models.CASCADE, null=True, blank=True, default=None)
+    # Sube con cada cambio del ensayo, sus preguntas u opciones (ensayos.signals);
+    # identifica el snapshot servido y la pauta cacheada.
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # Orden del listado paginado por cursor de /api/exams/.
+        indexes = [models.Index(fields=['-fecha', '-id'], name='ensayos_ensayo_fecha_id')]
+
     def __str__(self):
         return self.titulo
+
+
+def ruta_imagen(instance, filename):
+    # Una carpeta por contenido; ahí mismo ensayos.imagenes deja las variantes.
+    extension = filename.rsplit('.', 1)[-1].lower()
+    return f'imagenes/{instance.hash[:2]}/{instance.hash}/original.{extension}'
+
+
+class Imagen(models.Model):
+    """
+    Imagen de preguntas, guardada una sola vez por contenido: subir el mismo
+    archivo otra vez devuelve la misma Imagen (ensayos.imagenes).
+    """
+    hash = models.CharField(max_length=32, unique=True)
+    archivo = models.FileField(upload_to=ruta_imagen, max_length=200)
+    formato = models.CharField(max_length=10)
+    ancho = models.PositiveIntegerField()
+    alto = models.PositiveIntegerField()
+    bytes = models.PositiveIntegerField()
+    # Con transparencia las variantes son PNG en vez de JPEG (además de WebP).
+    transparente = models.BooleanField(default=False)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.hash[:12]} ({self.ancho}x{self.alto} {self.formato})'
+
+
 class Pregunta(models.Model):
     ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='preguntas')
     enunciado = models.TextField()
@@ -25,6 +60,11 @@ class Pregunta(models.Model):
     etiquetas = models.ManyToManyField(Etiqueta, blank=True, related_name='preguntas')
     explicacion_texto = models.TextField(blank=True, default='')
     explicacion_url = models.URLField(blank=True, default='')
+    # Pregunta del banco de la que es copia (ensayos generados por ensayos.ensamblador).
+    origen = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='copias')
+    # Hash del enunciado y las opciones normalizados (ensayos.importacion), para detectar duplicados.
+    hash_contenido = models.CharField(max_length=32, blank=True, default='', db_index=True, editable=False)
+    imagen = models.ForeignKey(Imagen, on_delete=models.SET_NULL, null=True, blank=True, related_name='preguntas')
 
     def __str__(self):
         return (self.enunciado[:80] + '...') if len(self.enunciado) > 80 else self.enunciado
@@ -49,6 +89,9 @@ class Resultado(models.Model):
     alumno = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     puntaje_total = models.IntegerField(default=0)
     fecha = models.DateTimeField(auto_now_add=True)
+    # Número de intento del alumno en este ensayo (1, 2, ...); fija el orden
+    # de preguntas y opciones que vio (ensayos.barajado).
+    intento = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return f"Resultado de {self.alumno.username} en {self.ensayo.titulo}"
@@ -63,3 +106,174 @@ class Respuesta(models.Model):
     def __str__(self):
         return f"Resp. {self.pregunta.id} por {self.resultado.alumno.username}"
 
+
+
+class EnvioPendiente(models.Model):
+    """
+    Cola durable de envíos en modo asíncrono. El payload crudo se guarda aquí
+    y los workers de ensayos.cola lo califican por lotes.
+    """
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    )
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='envios_pendientes')
+    alumno = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    respuestas = models.JSONField(default=list)
+    estado = models.CharField(max_length=12, choices=ESTADOS, default='pendiente')
+    reclamado_por = models.CharField(max_length=64, blank=True, default='')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    resultado = models.ForeignKey(Resultado, null=True, blank=True, on_delete=models.SET_NULL)
+    errores = models.JSONField(default=list, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['estado', 'id'])]
+
+    def __str__(self):
+        return f"Envío {self.id} ({self.estado})"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de un envío identificado por una clave del cliente
+    (header Idempotency-Key o campo submission_id). Los reintentos con la
+    misma clave se responden desde aquí sin volver a calificar.
+    """
+    alumno = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    clave = models.CharField(max_length=100)
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE)
+    codigo_estado = models.PositiveSmallIntegerField()
+    respuesta = models.JSONField(default=dict)
+    creado = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['alumno', 'clave'], name='ensayos_idempotencia_alumno_clave'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} ({self.alumno_id})"
+
+
+# Agregados materializados para results_summary. Se actualizan en la misma
+# transacción que guarda cada envío (ensayos.agregados) y se pueden
+# reconstruir con `manage.py reconstruir_agregados`.
+
+class AgregadoEnsayo(models.Model):
+    ensayo = models.OneToOneField(Ensayo, on_delete=models.CASCADE, primary_key=True, related_name='agregado')
+    envios = models.PositiveIntegerField(default=0)
+    participantes = models.PositiveIntegerField(default=0)
+    # Respuestas a preguntas sin etiquetas (el "Sin etiqueta" de by_tag).
+    sin_etiqueta_respondidas = models.PositiveIntegerField(default=0)
+    sin_etiqueta_correctas = models.PositiveIntegerField(default=0)
+
+
+class ParticipanteEnsayo(models.Model):
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='participantes')
+    alumno = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ensayo', 'alumno'], name='ensayos_participante_unico'),
+        ]
+
+
+class AgregadoPregunta(models.Model):
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='agregados_pregunta')
+    pregunta = models.OneToOneField(Pregunta, on_delete=models.CASCADE, related_name='agregado')
+    respondidas = models.PositiveIntegerField(default=0)
+    correctas = models.PositiveIntegerField(default=0)
+
+
+class AgregadoTipo(models.Model):
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='agregados_tipo')
+    tipo = models.CharField(max_length=50)
+    respondidas = models.PositiveIntegerField(default=0)
+    correctas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ensayo', 'tipo'], name='ensayos_agregado_tipo_unico'),
+        ]
+
+
+class AgregadoEtiqueta(models.Model):
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='agregados_etiqueta')
+    etiqueta = models.ForeignKey(Etiqueta, on_delete=models.CASCADE)
+    respondidas = models.PositiveIntegerField(default=0)
+    correctas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ensayo', 'etiqueta'], name='ensayos_agregado_etiqueta_unico'),
+        ]
+
+
+# Calibración TRI (ensayos.irt). Se recalcula con `manage.py calibrar_irt`;
+# cada ajuste parte de los parámetros anteriores.
+
+MODELOS_IRT = (
+    ('rasch', 'Rasch'),
+    ('2pl', '2PL'),
+)
+
+
+class CalibracionEnsayo(models.Model):
+    ensayo = models.OneToOneField(Ensayo, on_delete=models.CASCADE, primary_key=True, related_name='calibracion')
+    modelo = models.CharField(max_length=10, choices=MODELOS_IRT)
+    # analisis.marca() de los datos ajustados (versión, resultados, último id): si no
+    # cambió, no hay nada que recalibrar. Borrar y reenviar sí la cambia.
+    marca = models.CharField(max_length=64, blank=True, default='')
+    n_alumnos = models.PositiveIntegerField(default=0)
+    iteraciones = models.PositiveIntegerField(default=0)
+    convergio = models.BooleanField(default=False)
+    log_verosimilitud = models.FloatField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+
+class CalibracionPregunta(models.Model):
+    pregunta = models.OneToOneField(Pregunta, on_delete=models.CASCADE, primary_key=True, related_name='calibracion')
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='calibraciones_pregunta')
+    modelo = models.CharField(max_length=10, choices=MODELOS_IRT)
+    dificultad_b = models.FloatField()
+    discriminacion_a = models.FloatField(default=1.0)
+    error_b = models.FloatField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+
+class HabilidadResultado(models.Model):
+    """Habilidad estimada (EAP) del alumno en un Resultado."""
+    resultado = models.OneToOneField(Resultado, on_delete=models.CASCADE, primary_key=True, related_name='habilidad')
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='habilidades')
+    theta = models.FloatField()
+    error = models.FloatField()
+    actualizado = models.DateTimeField(auto_now=True)
+
+
+class SnapshotEnsayo(models.Model):
+    """
+    JSON ya serializado (y comprimido con gzip) de una versión del ensayo,
+    para servir GET /api/exams/<id>/ sin pasar por los serializers. La
+    variante 'alumno' no incluye es_correcta ni las explicaciones.
+    """
+    VARIANTES = (
+        ('completo', 'Completo'),
+        ('alumno', 'Alumno'),
+    )
+    ensayo = models.ForeignKey(Ensayo, on_delete=models.CASCADE, related_name='snapshots')
+    version = models.PositiveIntegerField()
+    variante = models.CharField(max_length=10, choices=VARIANTES, default='completo')
+    contenido = models.BinaryField()
+    contenido_gzip = models.BinaryField()
+    etag = models.CharField(max_length=80)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ensayo', 'version', 'variante'], name='ensayos_snapshot_version_variante'),
+        ]
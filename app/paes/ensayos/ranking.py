@@ -0,0 +1,304 @@
+"""
+Ránking de alumnos por ensayo y por curso.
+
+Cada tablero guarda un puntaje por alumno (su mejor Resultado en el ensayo;
+en el curso, el promedio de sus mejores puntajes en los ensayos de ese curso)
+y un árbol de Fenwick con la cantidad de alumnos por puntaje 0..1000. Con eso
+la posición y el percentil de un alumno, y la página k del top, salen en
+O(log 1000) sin ordenar todos los resultados.
+
+Los tableros viven en memoria (CacheLRU) y se construyen la primera vez que
+se piden. Para ponerse al día leen sólo los Resultado con id mayor al último
+visto, así que también ven los envíos guardados por otros procesos: como
+SQLite serializa las escrituras, los ids se confirman en orden. Tras cada
+envío se sincronizan los tableros cargados del ensayo. Un borrado se nota en
+la base: cada tablero cuenta los Resultado que leyó y, si ya hay menos con id
+hasta el último visto (se borró uno, en este proceso o en otro), se vacía y
+se reconstruye. En el proceso que borra, la señal además lo descarta.
+
+Docentes y staff ven la página pedida con nombres (`respuesta`); un alumno
+sólo ve su posición y los ENSAYOS_RANKING_VECINOS puestos a cada lado, sin
+nombres ni ids (`respuesta_alumno`).
+"""
+import bisect
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .cache import CacheLRU
+from .models import Resultado
+from usuarios.models import Usuario
+
+PUNTAJE_MAXIMO = 1000
+VECINOS = getattr(settings, 'ENSAYOS_RANKING_VECINOS', 2)
+
+_tableros = CacheLRU(getattr(settings, 'ENSAYOS_RANKING_CACHE_MAX', 128))
+
+
+class Fenwick:
+    """Árbol de Fenwick de conteos sobre las posiciones 0..tamano-1."""
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self.arbol = [0] * (tamano + 1)
+        self.total = 0
+        self._paso_alto = 1 << (tamano.bit_length() - 1)
+
+    def sumar(self, i, delta):
+        self.total += delta
+        i += 1
+        while i <= self.tamano:
+            self.arbol[i] += delta
+            i += i & -i
+
+    def prefijo(self, i):
+        """Suma de las posiciones 0..i (inclusive)."""
+        suma = 0
+        i += 1
+        while i > 0:
+            suma += self.arbol[i]
+            i -= i & -i
+        return suma
+
+    def k_esimo(self, k):
+        """Menor posición i con prefijo(i) >= k (k parte en 1)."""
+        i = 0
+        paso = self._paso_alto
+        while paso:
+            siguiente = i + paso
+            if siguiente <= self.tamano and self.arbol[siguiente] < k:
+                i = siguiente
+                k -= self.arbol[siguiente]
+            paso >>= 1
+        return i
+
+
+class Tablero:
+    """
+    Puntaje por alumno con consultas de orden. Internamente el Fenwick se
+    indexa por PUNTAJE_MAXIMO - puntaje, para que el prefijo cuente a los
+    alumnos con puntaje mayor o igual.
+    """
+
+    # Campos por los que se agrupan los Resultado nuevos al sincronizar.
+    agrupar = ('alumno_id',)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vaciar()
+
+    def vaciar(self):
+        self.puntajes = {}
+        self.por_puntaje = {}
+        self.fenwick = Fenwick(PUNTAJE_MAXIMO + 1)
+        self.ultimo_resultado = 0
+        # Cuántos Resultado con id <= ultimo_resultado se han leído.
+        self.leidos = 0
+
+    def __len__(self):
+        return len(self.puntajes)
+
+    def resultados(self):
+        raise NotImplementedError
+
+    def aplicar(self, filas):
+        raise NotImplementedError
+
+    def sincronizar(self):
+        with self.lock:
+            resultados = self.resultados()
+            if self.leidos and resultados.filter(id__lte=self.ultimo_resultado).count() != self.leidos:
+                self.vaciar()
+            filas = list(
+                resultados.filter(id__gt=self.ultimo_resultado).values(*self.agrupar)
+                .annotate(mejor=Max('puntaje_total'), ultimo=Max('id'), n=Count('id'))
+            )
+            self.aplicar(filas)
+            for fila in filas:
+                self.ultimo_resultado = max(self.ultimo_resultado, fila['ultimo'])
+                self.leidos += fila['n']
+        return self
+
+    def fijar(self, alumno_id, puntaje):
+        puntaje = max(0, min(PUNTAJE_MAXIMO, int(puntaje)))
+        anterior = self.puntajes.get(alumno_id)
+        if anterior == puntaje:
+            return
+        if anterior is not None:
+            self.fenwick.sumar(PUNTAJE_MAXIMO - anterior, -1)
+            grupo = self.por_puntaje[anterior]
+            del grupo[bisect.bisect_left(grupo, alumno_id)]
+        self.puntajes[alumno_id] = puntaje
+        self.fenwick.sumar(PUNTAJE_MAXIMO - puntaje, 1)
+        bisect.insort(self.por_puntaje.setdefault(puntaje, []), alumno_id)
+
+    def posicion(self, alumno_id):
+        """Posición (1 = mejor; empates comparten posición), puntaje y percentil."""
+        puntaje = self.puntajes.get(alumno_id)
+        if puntaje is None:
+            return None
+        i = PUNTAJE_MAXIMO - puntaje
+        mayores = self.fenwick.prefijo(i - 1) if i > 0 else 0
+        iguales = self.fenwick.prefijo(i) - mayores
+        total = self.fenwick.total
+        menores = total - mayores - iguales
+        return {
+            'posicion': mayores + 1,
+            'puntaje': puntaje,
+            # Percentil de rango: % de alumnos bajo el puntaje, más la mitad de los empatados.
+            'percentil': round((menores + 0.5 * iguales) / total * 100, 1),
+        }
+
+    def indice(self, alumno_id):
+        """Lugar del alumno (desde 0) en el orden de `pagina`, o None si no está."""
+        puntaje = self.puntajes.get(alumno_id)
+        if puntaje is None:
+            return None
+        i = PUNTAJE_MAXIMO - puntaje
+        mayores = self.fenwick.prefijo(i - 1) if i > 0 else 0
+        return mayores + bisect.bisect_left(self.por_puntaje[puntaje], alumno_id)
+
+    def pagina(self, desde, cantidad):
+        """Alumnos en las posiciones desde..desde+cantidad-1 (desde parte en 0), de mayor a menor."""
+        filas = []
+        total = self.fenwick.total
+        k = desde + 1
+        while len(filas) < cantidad and k <= total:
+            i = self.fenwick.k_esimo(k)
+            mayores = self.fenwick.prefijo(i - 1) if i > 0 else 0
+            puntaje = PUNTAJE_MAXIMO - i
+            grupo = self.por_puntaje[puntaje]
+            for alumno_id in grupo[k - 1 - mayores:]:
+                filas.append((alumno_id, puntaje, mayores + 1))
+                if len(filas) == cantidad:
+                    break
+            k = mayores + len(grupo) + 1
+        return filas
+
+
+class TableroEnsayo(Tablero):
+    def __init__(self, ensayo_id):
+        super().__init__()
+        self.ensayo_id = ensayo_id
+
+    def resultados(self):
+        return Resultado.objects.filter(ensayo_id=self.ensayo_id)
+
+    def aplicar(self, filas):
+        for fila in filas:
+            if fila['mejor'] > self.puntajes.get(fila['alumno_id'], -1):
+                self.fijar(fila['alumno_id'], fila['mejor'])
+
+
+class TableroCurso(Tablero):
+    agrupar = ('alumno_id', 'ensayo_id')
+
+    def __init__(self, curso):
+        self.curso = curso
+        super().__init__()
+
+    def vaciar(self):
+        super().vaciar()
+        # alumno_id -> {ensayo_id: mejor puntaje}
+        self.mejores = {}
+
+    def resultados(self):
+        return Resultado.objects.filter(ensayo__curso=self.curso)
+
+    def aplicar(self, filas):
+        cambiados = set()
+        for fila in filas:
+            mejores = self.mejores.setdefault(fila['alumno_id'], {})
+            if fila['mejor'] > mejores.get(fila['ensayo_id'], -1):
+                mejores[fila['ensayo_id']] = fila['mejor']
+                cambiados.add(fila['alumno_id'])
+        for alumno_id in cambiados:
+            mejores = self.mejores[alumno_id]
+            self.fijar(alumno_id, round(sum(mejores.values()) / len(mejores)))
+
+
+def _clave_ensayo(ensayo_id):
+    return ('ensayo', ensayo_id)
+
+
+def _clave_curso(curso):
+    return ('curso', curso)
+
+
+def tablero_ensayo(ensayo_id):
+    tablero = _tableros.obtener_o_cargar(_clave_ensayo(ensayo_id), lambda: TableroEnsayo(ensayo_id))
+    return tablero.sincronizar()
+
+
+def tablero_curso(curso):
+    tablero = _tableros.obtener_o_cargar(_clave_curso(curso), lambda: TableroCurso(curso))
+    return tablero.sincronizar()
+
+
+def registrar_envios(ensayo_ids):
+    """
+    Pone al día los tableros ya cargados de los ensayos con envíos nuevos.
+    Los de curso se ponen al día en su próxima consulta.
+    """
+    for ensayo_id in set(ensayo_ids):
+        tablero = _tableros.obtener(_clave_ensayo(ensayo_id))
+        if tablero is not None:
+            tablero.sincronizar()
+
+
+def invalidar(ensayo_id, curso=None):
+    _tableros.invalidar(_clave_ensayo(ensayo_id))
+    if curso is not None:
+        _tableros.invalidar(_clave_curso(curso))
+
+
+def estadisticas():
+    return _tableros.estadisticas()
+
+
+def _nombre(usuario):
+    completo = f'{usuario.nombre} {usuario.apellidos}'.strip()
+    return completo or usuario.username
+
+
+def respuesta(tablero, alumno_id, desde, cantidad):
+    with tablero.lock:
+        filas = tablero.pagina(desde, cantidad)
+        propia = tablero.posicion(alumno_id)
+        total = len(tablero)
+    usuarios = Usuario.objects.in_bulk([alumno_id for alumno_id, _, _ in filas])
+    return {
+        'total': total,
+        'desde': desde,
+        'cantidad': cantidad,
+        'top': [{
+            'posicion': posicion,
+            'alumno_id': alumno_id,
+            'nombre': _nombre(usuarios[alumno_id]) if alumno_id in usuarios else '',
+            'puntaje': puntaje,
+        } for alumno_id, puntaje, posicion in filas],
+        'yo': propia,
+    }
+
+
+def respuesta_alumno(tablero, alumno_id, vecinos=VECINOS):
+    """Posición del alumno y los puestos a su alrededor, anónimos."""
+    with tablero.lock:
+        propia = tablero.posicion(alumno_id)
+        indice = tablero.indice(alumno_id)
+        if indice is None:
+            filas = []
+        else:
+            desde = max(0, indice - vecinos)
+            filas = tablero.pagina(desde, indice + vecinos + 1 - desde)
+        total = len(tablero)
+    return {
+        'total': total,
+        'vecinos': [{
+            'posicion': posicion,
+            'puntaje': puntaje,
+            'yo': otro_id == alumno_id,
+        } for otro_id, puntaje, posicion in filas],
+        'yo': propia,
+    }
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Ensayo, Pregunta, Opcion, Resultado, Respuesta, Intento
 from usuarios.serializers import UserSerializer
+from . import formulas, imagenes
 
 class OpcionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,9 +10,25 @@ class OpcionSerializer(serializers.ModelSerializer):
 
 class PreguntaSerializer(serializers.ModelSerializer):
     opciones = OpcionSerializer(many=True, read_only=True)
+    # {fuente: url del SVG} de las fórmulas $...$ (ensayos.formulas). Las de la
+    # explicación van aparte para que la variante alumno pueda quitarlas.
+    formulas = serializers.SerializerMethodField()
+    formulas_explicacion = serializers.SerializerMethodField()
+    # Tamaño y URLs de las variantes de la imagen (ensayos.imagenes), o null.
+    imagen = serializers.SerializerMethodField()
     class Meta:
         model = Pregunta
-        fields = ('id', 'enunciado', 'tipo', 'opciones', 'explicacion_texto', 'explicacion_url')
+        fields = ('id', 'enunciado', 'tipo', 'opciones', 'explicacion_texto', 'explicacion_url',
+                  'formulas', 'formulas_explicacion', 'imagen')
+
+    def get_formulas(self, obj):
+        return formulas.mapa(obj.enunciado, *(opcion.texto for opcion in obj.opciones.all()))
+
+    def get_formulas_explicacion(self, obj):
+        return formulas.mapa(obj.explicacion_texto)
+
+    def get_imagen(self, obj):
+        return imagenes.descripcion(obj.imagen)
 
 class EnsayoSerializer(serializers.ModelSerializer):
     preguntas = PreguntaSerializer(many=True, read_only=True)
@@ -19,6 +36,38 @@ class EnsayoSerializer(serializers.ModelSerializer):
         model = Ensayo
         fields = ('id', 'titulo', 'materia', 'curso', 'fecha', 'preguntas')
 
+class EnsayoResumenSerializer(serializers.ModelSerializer):
+    """Para el listado: sin preguntas, sólo cuántas tiene (anotado en el queryset)."""
+    n_preguntas = serializers.IntegerField(read_only=True)
+    class Meta:
+        model = Ensayo
+        fields = ('id', 'titulo', 'materia', 'curso', 'fecha', 'n_preguntas')
+
+class OpcionNuevaSerializer(serializers.Serializer):
+    texto = serializers.CharField(max_length=Opcion._meta.get_field('texto').max_length)
+    es_correcta = serializers.BooleanField(default=False)
+
+class PreguntaNuevaSerializer(serializers.Serializer):
+    enunciado = serializers.CharField()
+    tipo = serializers.ChoiceField(choices=Pregunta._meta.get_field('tipo').choices, default='alternativa_simple')
+    dificultad = serializers.CharField(max_length=50, required=False)
+    explicacion_texto = serializers.CharField(required=False, allow_blank=True, default='')
+    explicacion_url = serializers.URLField(required=False, allow_blank=True, default='')
+    etiquetas = serializers.ListField(child=serializers.CharField(max_length=80), required=False, default=list)
+    opciones = OpcionNuevaSerializer(many=True, min_length=2, max_length=26)
+
+    def validate_opciones(self, opciones):
+        if sum(opcion['es_correcta'] for opcion in opciones) != 1:
+            raise serializers.ValidationError('Debe haber exactamente una opción correcta.')
+        return opciones
+
+class EnsayoNuevoSerializer(serializers.Serializer):
+    """Documento completo para crear un ensayo con sus preguntas (ensayos.autoria)."""
+    titulo = serializers.CharField(max_length=200)
+    materia = serializers.CharField(max_length=100)
+    curso = serializers.CharField(max_length=50, required=False)
+    preguntas = PreguntaNuevaSerializer(many=True, required=False, default=list, max_length=300)
+
 class RespuestaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Respuesta
@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Ensayo, Etiqueta, Imagen, Pregunta, Opcion, Resultado, Respuesta
+from . import agregados, analisis, busqueda, calificacion, desglose, ensamblador, formulas, imagenes, importacion, ranking, snapshots
+
+
+def _ensayo_de_pregunta(pregunta_id):
+    return Pregunta.objects.filter(pk=pregunta_id).values_list('ensayo_id', flat=True).first()
+
+
+def _invalidar_ensayo(ensayo_id):
+    """
+    Registra que cambió el contenido del ensayo: sube Ensayo.version (lo que
+    deja obsoletos el snapshot y las pautas de todos los procesos) y descarta
+    lo cacheado en este proceso.
+    """
+    if ensayo_id is None:
+        return
+    snapshots.nueva_version(ensayo_id)
+    calificacion.invalidar_pauta(ensayo_id)
+    analisis.invalidar(ensayo_id)
+
+
+@receiver(pre_save, sender=Ensayo)
+def subir_version_ensayo(sender, instance, raw=False, **kwargs):
+    # Se sube en el mismo UPDATE, sin pisar las subidas hechas por las señales
+    # de Pregunta/Opcion mientras la instancia estaba en memoria.
+    if not raw and not instance._state.adding:
+        instance.version = F('version') + 1
+        # La materia del ensayo es la de sus preguntas en el banco.
+        ensamblador.invalidar_banco()
+
+
+@receiver(post_save, sender=Ensayo)
+def refrescar_version_ensayo(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        instance.refresh_from_db(fields=['version'])
+
+
+@receiver(pre_save, sender=Pregunta)
+def recordar_ensayo_anterior(sender, instance, **kwargs):
+    # Si la pregunta cambia de ensayo hay que invalidar también el ensayo
+    # anterior; si cambia de ensayo o de tipo, sus agregados.
+    anterior = Pregunta.objects.filter(pk=instance.pk).values_list('ensayo_id', 'tipo').first() if instance.pk else None
+    instance._ensayo_id_anterior, instance._tipo_anterior = anterior or (None, None)
+
+
+@receiver(post_save, sender=Pregunta)
+@receiver(post_delete, sender=Pregunta)
+def invalidar_por_pregunta(sender, instance, **kwargs):
+    _invalidar_ensayo(instance.ensayo_id)
+    desglose.invalidar(instance.pk)
+    busqueda.programar([instance.pk])
+    importacion.programar_hashes([instance.pk])
+    ensamblador.invalidar_banco()
+    anterior = getattr(instance, '_ensayo_id_anterior', None)
+    if anterior != instance.ensayo_id:
+        _invalidar_ensayo(anterior)
+
+
+@receiver(post_save, sender=Pregunta)
+def reagregar_por_pregunta(sender, instance, created, raw=False, **kwargs):
+    anterior = getattr(instance, '_ensayo_id_anterior', None)
+    if not created and not raw and (anterior != instance.ensayo_id
+                                    or getattr(instance, '_tipo_anterior', None) != instance.tipo):
+        agregados.programar(ensayo_ids=[anterior, instance.ensayo_id])
+
+
+@receiver(post_delete, sender=Pregunta)
+def reagregar_por_pregunta_borrada(sender, instance, **kwargs):
+    # Sus respuestas se borran en cascada; los totales del ensayo cambian.
+    agregados.programar(ensayo_ids=[instance.ensayo_id])
+
+
+@receiver(pre_save, sender=Opcion)
+def recordar_pregunta_anterior(sender, instance, **kwargs):
+    instance._pregunta_id_anterior = (
+        Opcion.objects.filter(pk=instance.pk).values_list('pregunta_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Pregunta)
+def renderizar_formulas_pregunta(sender, instance, raw=False, **kwargs):
+    if not raw:
+        formulas.programar(instance.enunciado, instance.explicacion_texto)
+
+
+@receiver(post_save, sender=Opcion)
+def renderizar_formulas_opcion(sender, instance, raw=False, **kwargs):
+    if not raw:
+        formulas.programar(instance.texto)
+
+
+@receiver(post_save, sender=Opcion)
+@receiver(post_delete, sender=Opcion)
+def invalidar_por_opcion(sender, instance, **kwargs):
+    # En un borrado en cascada la pregunta ya puede no existir; en ese caso
+    # la señal de la propia Pregunta invalida la pauta.
+    _invalidar_ensayo(_ensayo_de_pregunta(instance.pregunta_id))
+    desglose.invalidar(instance.pregunta_id)
+    busqueda.programar([instance.pregunta_id])
+    importacion.programar_hashes([instance.pregunta_id])
+    anterior = getattr(instance, '_pregunta_id_anterior', None)
+    if anterior is not None and anterior != instance.pregunta_id:
+        _invalidar_ensayo(_ensayo_de_pregunta(anterior))
+        desglose.invalidar(anterior)
+        busqueda.programar([anterior])
+        importacion.programar_hashes([anterior])
+
+
+# Índice de búsqueda: las etiquetas de cada pregunta también se indexan.
+
+@receiver(m2m_changed, sender=Pregunta.etiquetas.through)
+def reindexar_por_etiquetas(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        ensamblador.invalidar_banco()
+    # Preguntas cuyas etiquetas cambiaron: se reindexan y se reagregan sus ensayos.
+    if not reverse:
+        preguntas = [instance.pk] if action in ('post_add', 'post_remove', 'post_clear') else []
+    elif action == 'pre_clear':
+        instance._preguntas_antes = busqueda.preguntas_de_etiqueta(instance.pk)
+        preguntas = []
+    elif action == 'post_clear':
+        preguntas = getattr(instance, '_preguntas_antes', [])
+    else:
+        preguntas = (pk_set or []) if action in ('post_add', 'post_remove') else []
+    if preguntas:
+        busqueda.programar(preguntas)
+        agregados.programar(pregunta_ids=preguntas)
+
+
+@receiver(post_save, sender=Etiqueta)
+def reindexar_por_etiqueta_renombrada(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        busqueda.programar(busqueda.preguntas_de_etiqueta(instance.pk))
+
+
+@receiver(pre_delete, sender=Etiqueta)
+def recordar_preguntas_de_etiqueta(sender, instance, **kwargs):
+    instance._preguntas_antes = busqueda.preguntas_de_etiqueta(instance.pk)
+
+
+@receiver(post_delete, sender=Etiqueta)
+def reindexar_por_etiqueta_borrada(sender, instance, **kwargs):
+    # El borrado en cascada de la tabla intermedia no envía m2m_changed.
+    busqueda.programar(getattr(instance, '_preguntas_antes', []))
+    agregados.programar(pregunta_ids=getattr(instance, '_preguntas_antes', []))
+
+
+@receiver(post_delete, sender=Resultado)
+def invalidar_ranking(sender, instance, **kwargs):
+    # Los tableros sólo se ponen al día con resultados nuevos; un borrado obliga a reconstruirlos.
+    curso = Ensayo.objects.filter(pk=instance.ensayo_id).values_list('curso', flat=True).first()
+    ranking.invalidar(instance.ensayo_id, curso)
+
+
+@receiver(post_delete, sender=Resultado)
+def reagregar_por_resultado(sender, instance, **kwargs):
+    agregados.programar(ensayo_ids=[instance.ensayo_id])
+    analisis.invalidar(instance.ensayo_id)
+
+
+@receiver(post_delete, sender=Respuesta)
+def reagregar_por_respuesta(sender, instance, **kwargs):
+    # Si la pregunta también se está borrando, su propia señal programa el ensayo.
+    agregados.programar(pregunta_ids=[instance.pregunta_id])
+    desglose.programar([instance.pregunta_id])
+
+
+@receiver(post_delete, sender=Imagen)
+def borrar_archivos_imagen(sender, instance, **kwargs):
+    # El original y todas sus variantes; sólo si el borrado se confirma.
+    hash_ = instance.hash
+    transaction.on_commit(lambda: imagenes.borrar(hash_))
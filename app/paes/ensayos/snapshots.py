@@ -0,0 +1,166 @@
+"""
+Snapshots versionados del detalle de un ensayo.
+
+Cada versión del ensayo (Ensayo.version, que suben las señales al editar el
+ensayo, sus preguntas u opciones) se serializa una sola vez con
+EnsayoSerializer a bytes JSON, más una variante gzip, y se guarda en
+SnapshotEnsayo. Servir el detalle es entonces leer la versión actual (una
+consulta por pk) y buscar los bytes en la cache del proceso; el ETag fuerte
+permite responder 304 a los clientes que ya tienen esa versión.
+
+Hay dos variantes por versión: 'completo' (docentes) y 'alumno', que se
+deriva una vez de los bytes del completo quitando es_correcta y las
+explicaciones, para que los alumnos no descarguen la pauta.
+"""
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from rest_framework.renderers import JSONRenderer
+
+from .cache import CacheLRU
+from .models import Ensayo, SnapshotEnsayo
+
+_snapshots = CacheLRU(getattr(settings, 'ENSAYOS_SNAPSHOTS_CACHE_MAX', 256))
+
+COMPLETO = 'completo'
+ALUMNO = 'alumno'
+# Campos que la variante alumno no debe incluir.
+CAMPOS_PREGUNTA_OCULTOS = ('explicacion_texto', 'explicacion_url', 'formulas_explicacion')
+CAMPOS_OPCION_OCULTOS = ('es_correcta',)
+
+
+class Snapshot:
+    __slots__ = ('ensayo_id', 'version', 'variante', 'contenido', 'contenido_gzip', 'etag', 'fragmentos')
+
+    def __init__(self, ensayo_id, version, variante, contenido, contenido_gzip, etag):
+        self.ensayo_id = ensayo_id
+        self.version = version
+        self.variante = variante
+        self.contenido = bytes(contenido)
+        self.contenido_gzip = bytes(contenido_gzip)
+        self.etag = etag
+        # ensayos.barajado los calcula la primera vez que se baraja este snapshot.
+        self.fragmentos = None
+
+
+def nueva_version(ensayo_id):
+    """Marca que el contenido del ensayo cambió (un UPDATE, sin señales)."""
+    if ensayo_id is not None:
+        Ensayo.objects.filter(pk=ensayo_id).update(version=F('version') + 1)
+
+
+def _etag(contenido):
+    return '"%s"' % hashlib.blake2b(contenido, digest_size=16).hexdigest()
+
+
+def _fila(ensayo_id, version, variante, contenido):
+    return SnapshotEnsayo(
+        ensayo_id=ensayo_id,
+        version=version,
+        variante=variante,
+        contenido=contenido,
+        contenido_gzip=gzip.compress(contenido, mtime=0),
+        etag=_etag(contenido),
+    )
+
+
+def _a_snapshot(fila):
+    return Snapshot(fila.ensayo_id, fila.version, fila.variante, fila.contenido, fila.contenido_gzip, fila.etag)
+
+
+def contenido_alumno(contenido):
+    """Deriva los bytes de la variante alumno desde los del snapshot completo."""
+    data = json.loads(contenido)
+    for pregunta in data.get('preguntas', []):
+        for campo in CAMPOS_PREGUNTA_OCULTOS:
+            pregunta.pop(campo, None)
+        for opcion in pregunta.get('opciones', []):
+            for campo in CAMPOS_OPCION_OCULTOS:
+                opcion.pop(campo, None)
+    return JSONRenderer().render(data)
+
+
+def _guardar(filas):
+    try:
+        with transaction.atomic():
+            SnapshotEnsayo.objects.bulk_create(filas)
+            SnapshotEnsayo.objects.filter(ensayo_id=filas[0].ensayo_id, version__lt=filas[0].version).delete()
+    except IntegrityError:
+        # Otro proceso generó la misma versión al mismo tiempo; el contenido es el mismo.
+        pass
+
+
+def generar(ensayo_id):
+    """
+    Serializa la versión actual del ensayo y guarda sus dos variantes;
+    devuelve {variante: Snapshot}. La versión y el contenido se leen en la
+    misma transacción, así que el snapshot nunca queda con un contenido de
+    otra versión.
+    """
+    from .serializers import EnsayoSerializer
+
+    with transaction.atomic():
+        ensayo = Ensayo.objects.prefetch_related('preguntas__opciones', 'preguntas__imagen').filter(pk=ensayo_id).first()
+        if ensayo is None:
+            return None
+        contenido = JSONRenderer().render(EnsayoSerializer(ensayo).data)
+    filas = [
+        _fila(ensayo_id, ensayo.version, COMPLETO, contenido),
+        _fila(ensayo_id, ensayo.version, ALUMNO, contenido_alumno(contenido)),
+    ]
+    _guardar(filas)
+    return {fila.variante: _a_snapshot(fila) for fila in filas}
+
+
+def _cargar(ensayo_id, version, variante):
+    guardados = {
+        fila.variante: fila for fila in
+        SnapshotEnsayo.objects.filter(ensayo_id=ensayo_id, version=version, variante__in=[variante, COMPLETO])
+    }
+    if variante in guardados:
+        return _a_snapshot(guardados[variante])
+    if COMPLETO in guardados:
+        # Snapshots de antes de existir la variante alumno: se deriva del completo.
+        fila = _fila(ensayo_id, version, ALUMNO, contenido_alumno(bytes(guardados[COMPLETO].contenido)))
+        _guardar([fila])
+        return _a_snapshot(fila)
+    generados = generar(ensayo_id)
+    if generados is None:
+        return None
+    # Guardar en memoria también la otra variante evita releerla de la base.
+    for otra, snapshot in generados.items():
+        if otra != variante:
+            _snapshots.guardar((ensayo_id, snapshot.version, otra), snapshot)
+    return generados[variante]
+
+
+def obtener(ensayo_id, variante=COMPLETO):
+    """Snapshot de la versión actual del ensayo en la variante pedida, o None si no existe."""
+    version = Ensayo.objects.filter(pk=ensayo_id).values_list('version', flat=True).first()
+    if version is None:
+        return None
+    return _snapshots.obtener_o_cargar((ensayo_id, version, variante), lambda: _cargar(ensayo_id, version, variante))
+
+
+def obtener_para_alumno(ensayo_id, alumno_id):
+    """
+    Variante alumno de la versión actual y el número del intento que el
+    alumno está por rendir (sus resultados previos + 1), en una sola consulta.
+    Devuelve (None, None) si el ensayo no existe.
+    """
+    fila = Ensayo.objects.filter(pk=ensayo_id).annotate(
+        previos=Count('resultados', filter=Q(resultados__alumno_id=alumno_id)),
+    ).values_list('version', 'previos').first()
+    if fila is None:
+        return None, None
+    version, previos = fila
+    snapshot = _snapshots.obtener_o_cargar((ensayo_id, version, ALUMNO), lambda: _cargar(ensayo_id, version, ALUMNO))
+    return snapshot, previos + 1
+
+
+def estadisticas():
+    return _snapshots.estadisticas()
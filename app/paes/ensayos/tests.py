@@ -0,0 +1,1021 @@
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from usuarios.models import Usuario
+from . import analisis, busqueda, calificacion, cola, ensamblador, formulas, imagenes, importacion, irt, ranking, snapshots
+from .cache import CacheLRU
+from .escritor import TiempoAgotado
+from .models import Ensayo, EnvioPendiente, Etiqueta, Imagen, Opcion, Pregunta, Respuesta, Resultado
+
+
+def crear_ensayo(titulo='Ensayo de prueba', n_preguntas=3, n_opciones=4, curso='4M'):
+    """Ensayo con `n_preguntas` preguntas; la primera opción de cada una es la correcta."""
+    ensayo = Ensayo.objects.create(titulo=titulo, materia='Matemática', curso=curso)
+    for i in range(n_preguntas):
+        pregunta = Pregunta.objects.create(ensayo=ensayo, enunciado=f'Pregunta {i + 1}', tipo='alternativa_simple',
+                                           explicacion_texto=f'Explicación {i + 1}')
+        for j in range(n_opciones):
+            Opcion.objects.create(pregunta=pregunta, texto=f'Opción {i + 1}.{j + 1}', es_correcta=(j == 0))
+    return ensayo
+
+
+def cliente(usuario=None):
+    client = APIClient()
+    if usuario is not None:
+        client.force_authenticate(user=usuario)
+    return client
+
+
+def contenido(response):
+    return json.loads(response.content)
+
+
+def respuestas_de(ensayo, correctas):
+    """Payload de envío: las primeras `correctas` preguntas bien, el resto mal."""
+    respuestas = []
+    for i, pregunta in enumerate(ensayo.preguntas.order_by('id')):
+        opciones = list(pregunta.opciones.order_by('id'))
+        opcion = opciones[0] if i < correctas else opciones[1]
+        respuestas.append({'pregunta_id': pregunta.id, 'opcion_id': opcion.id})
+    return {'respuestas': respuestas}
+
+
+class DetalleEnsayoAPITest(TestCase):
+    """
+    Pruebas del detalle y las escrituras de /api/exams/<id>/: la pauta sólo
+    llega a docentes y staff, también en las respuestas de escritura.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_detalle', email='alumno@detalle.cl',
+                                                 password='password', rol='alumno')
+        cls.docente = Usuario.objects.create_user(username='docente_detalle', email='docente@detalle.cl',
+                                                  password='password', rol='docente')
+        cls.ensayo = crear_ensayo()
+
+    def url(self):
+        return reverse('ensayo-detail', args=[self.ensayo.id])
+
+    def test_alumno_no_recibe_pauta(self):
+        """Prueba 1: el detalle para un alumno no trae es_correcta ni explicaciones."""
+        data = contenido(cliente(self.alumno).get(self.url()))
+        self.assertEqual(len(data['preguntas']), 3)
+        for pregunta in data['preguntas']:
+            self.assertNotIn('explicacion_texto', pregunta)
+            for opcion in pregunta['opciones']:
+                self.assertNotIn('es_correcta', opcion)
+
+    def test_docente_recibe_pauta(self):
+        """Prueba 2: el detalle para un docente trae la pauta completa."""
+        data = contenido(cliente(self.docente).get(self.url()))
+        self.assertTrue(all('es_correcta' in o for p in data['preguntas'] for o in p['opciones']))
+
+    def test_alumno_no_puede_escribir(self):
+        """Prueba 3: un alumno no puede editar, crear ni borrar ensayos."""
+        client = cliente(self.alumno)
+        response = client.patch(self.url(), {'titulo': 'Cambiado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertNotIn(b'es_correcta', response.content)
+        self.assertEqual(client.delete(self.url()).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(client.post(reverse('ensayo-list'), {'titulo': 'Nuevo'}, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.ensayo.refresh_from_db()
+        self.assertEqual(self.ensayo.titulo, 'Ensayo de prueba')
+
+    def test_anonimo_no_puede_escribir(self):
+        """Prueba 4: sin autenticación tampoco se puede editar."""
+        response = cliente().patch(self.url(), {'titulo': 'Cambiado'}, format='json')
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_docente_edita_y_recibe_el_snapshot(self):
+        """Prueba 5: la respuesta de una edición es el detalle nuevo de la variante del rol."""
+        response = cliente(self.docente).patch(self.url(), {'titulo': 'Cambiado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = contenido(response)
+        self.assertEqual(data['titulo'], 'Cambiado')
+        self.assertIn('ETag', response)
+        # El alumno ve el título nuevo, sin la pauta.
+        data = contenido(cliente(self.alumno).get(self.url()))
+        self.assertEqual(data['titulo'], 'Cambiado')
+        self.assertNotIn('es_correcta', data['preguntas'][0]['opciones'][0])
+
+    def test_docente_crea(self):
+        """Prueba 6: crear responde 201 con el detalle del ensayo nuevo."""
+        response = cliente(self.docente).post(reverse('ensayo-list'),
+                                              {'titulo': 'Nuevo', 'materia': 'Historia', 'curso': '3M'},
+                                              format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(contenido(response)['preguntas'], [])
+
+
+class AgregadosEnsayoTest(TestCase):
+    """
+    Pruebas de results_summary: los agregados siguen a los envíos, a los
+    borrados y a las reclasificaciones de preguntas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_agregados', email='alumno@agregados.cl',
+                                                 password='password', rol='alumno')
+        cls.docente = Usuario.objects.create_user(username='docente_agregados', email='docente@agregados.cl',
+                                                  password='password', rol='docente')
+        cls.ensayo = crear_ensayo()
+
+    def enviar(self, correctas):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = cliente(self.alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]),
+                                                 respuestas_de(self.ensayo, correctas), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return contenido(response)
+
+    def resumen(self):
+        return contenido(cliente(self.docente).get(reverse('results_summary', args=[self.ensayo.id])))
+
+    def test_envio_suma(self):
+        """Prueba 1: cada envío suma sus respuestas; los participantes son alumnos distintos."""
+        self.enviar(2)
+        self.enviar(3)
+        data = self.resumen()
+        self.assertEqual(data['total_participantes'], 1)
+        self.assertEqual(data['by_type'], [{'tipo': 'alternativa_simple', 'respondidas': 6, 'correctas': 5,
+                                            'porcentaje_correctas': 83.3}])
+
+    def test_borrar_resultado_resta(self):
+        """Prueba 2: borrar un resultado lo saca de los agregados al confirmar."""
+        self.enviar(3)
+        self.enviar(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Resultado.objects.filter(puntaje_total=0).delete()
+        data = self.resumen()
+        self.assertEqual(data['total_participantes'], 1)
+        self.assertEqual(data['by_type'][0]['respondidas'], 3)
+        self.assertEqual(data['by_type'][0]['correctas'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Resultado.objects.all().delete()
+        data = self.resumen()
+        self.assertEqual(data['total_participantes'], 0)
+        self.assertEqual(data['by_question'], [])
+
+    def test_borrar_pregunta_resta(self):
+        """Prueba 3: borrar una pregunta saca sus respuestas de los totales del ensayo."""
+        self.enviar(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ensayo.preguntas.order_by('id').first().delete()
+        data = self.resumen()
+        self.assertEqual(data['by_type'][0]['respondidas'], 2)
+        self.assertEqual(len(data['by_question']), 2)
+
+    def test_cambio_de_tipo(self):
+        """Prueba 4: cambiar el tipo de una pregunta mueve sus respuestas de grupo."""
+        self.enviar(3)
+        pregunta = self.ensayo.preguntas.order_by('id').first()
+        pregunta.tipo = 'verdadero_falso'
+        with self.captureOnCommitCallbacks(execute=True):
+            pregunta.save()
+        tipos = {t['tipo']: t['respondidas'] for t in self.resumen()['by_type']}
+        self.assertEqual(tipos, {'alternativa_simple': 2, 'verdadero_falso': 1})
+
+    def test_cambio_de_etiquetas(self):
+        """Prueba 5: etiquetar, desetiquetar y borrar etiquetas actualiza by_tag."""
+        self.enviar(3)
+        pregunta = self.ensayo.preguntas.order_by('id').first()
+        algebra = Etiqueta.objects.create(nombre='Álgebra')
+        with self.captureOnCommitCallbacks(execute=True):
+            pregunta.etiquetas.add(algebra)
+        etiquetas = {t['tag']: t['respondidas'] for t in self.resumen()['by_tag']}
+        self.assertEqual(etiquetas, {'Álgebra': 1, 'Sin etiqueta': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            algebra.delete()
+        etiquetas = {t['tag']: t['respondidas'] for t in self.resumen()['by_tag']}
+        self.assertEqual(etiquetas, {'Sin etiqueta': 3})
+
+
+class DesglosePreguntaTest(TestCase):
+    """Pruebas de question_breakdown: la cache sigue a envíos y borrados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_desglose', email='alumno@desglose.cl',
+                                                 password='password', rol='alumno')
+        cls.docente = Usuario.objects.create_user(username='docente_desglose', email='docente@desglose.cl',
+                                                  password='password', rol='docente')
+        cls.ensayo = crear_ensayo(n_preguntas=1)
+        cls.pregunta = cls.ensayo.preguntas.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def enviar(self, correctas):
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente(self.alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]),
+                                      respuestas_de(self.ensayo, correctas), format='json')
+
+    def desglose(self):
+        return contenido(cliente(self.docente).get(
+            reverse('question_breakdown', args=[self.ensayo.id, self.pregunta.id])))
+
+    def test_envio_y_borrado(self):
+        """Prueba 1: el desglose cuenta los envíos nuevos y descuenta los borrados."""
+        self.enviar(1)
+        data = self.desglose()
+        self.assertEqual((data['total_respondieron'], data['correctas']), (1, 1))
+        self.enviar(0)
+        data = self.desglose()
+        self.assertEqual((data['total_respondieron'], data['correctas']), (2, 1))
+        self.assertEqual([o['cantidad'] for o in data['opciones']], [1, 1, 0, 0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Resultado.objects.filter(puntaje_total__gt=0).delete()
+        data = self.desglose()
+        self.assertEqual((data['total_respondieron'], data['correctas']), (1, 0))
+
+    def test_borrado_y_reenvio_con_el_mismo_total(self):
+        """Prueba 2: tras borrar y reenviar, el mismo total no devuelve el desglose viejo."""
+        self.enviar(1)
+        self.assertEqual(self.desglose()['correctas'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Resultado.objects.all().delete()
+        self.enviar(0)
+        data = self.desglose()
+        self.assertEqual((data['total_respondieron'], data['correctas']), (1, 0))
+
+
+class CacheLRUTest(SimpleTestCase):
+    """Pruebas de CacheLRU: desalojo, invalidación durante una carga y generaciones acotadas."""
+
+    def test_desalojo_lru(self):
+        """Prueba 1: al pasar el máximo se desaloja la clave usada hace más tiempo."""
+        lru = CacheLRU(2)
+        lru.guardar('a', 1)
+        lru.guardar('b', 2)
+        lru.obtener('a')
+        lru.guardar('c', 3)
+        self.assertIsNone(lru.obtener('b'))
+        self.assertEqual((lru.obtener('a'), lru.obtener('c')), (1, 3))
+        self.assertEqual(lru.desalojos, 1)
+
+    def test_invalidar_durante_la_carga(self):
+        """Prueba 2: un valor cargado antes de una invalidación no se guarda."""
+        lru = CacheLRU(10)
+
+        def cargar():
+            lru.invalidar('a')
+            return 'viejo'
+
+        self.assertEqual(lru.obtener_o_cargar('a', cargar), 'viejo')
+        self.assertIsNone(lru.obtener('a'))
+        self.assertEqual(lru.obtener_o_cargar('a', lambda: 'nuevo'), 'nuevo')
+        self.assertEqual(lru.obtener('a'), 'nuevo')
+
+    def test_generaciones_acotadas(self):
+        """Prueba 3: las claves que pasan por la cache no dejan generaciones atrás."""
+        lru = CacheLRU(10, ttl=60)
+        for i in range(1000):
+            lru.obtener_o_cargar(i, lambda: i)
+            lru.invalidar(i)
+        self.assertEqual(lru._cargas, {})
+        self.assertEqual(lru.estadisticas()['entradas'], 0)
+
+    def test_carga_fallida(self):
+        """Prueba 4: si la carga lanza una excepción no queda registrada como en curso."""
+        lru = CacheLRU(10)
+
+        def cargar():
+            raise RuntimeError('base de datos caída')
+
+        with self.assertRaises(RuntimeError):
+            lru.obtener_o_cargar('a', cargar)
+        self.assertEqual(lru._cargas, {})
+
+
+@override_settings(ENSAYOS_ESCRITURA_AGRUPADA=True)
+class EnvioOcupadoTest(TestCase):
+    """Pruebas del 503 de submit cuando el escritor agrupado no confirma a tiempo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_ocupado', email='alumno@ocupado.cl',
+                                                 password='password', rol='alumno')
+        cls.ensayo = crear_ensayo()
+
+    def enviar(self, **extra):
+        return cliente(self.alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]),
+                                         respuestas_de(self.ensayo, 2), format='json', **extra)
+
+    def test_503_devuelve_una_clave_para_reintentar(self):
+        """Prueba 1: sin clave del cliente, el 503 trae la que generó el servidor."""
+        with mock.patch.object(calificacion, 'guardar', side_effect=TiempoAgotado()), \
+                self.assertLogs('ensayos.views', 'WARNING'):
+            response = self.enviar()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        clave = contenido(response)['submission_id']
+        self.assertTrue(clave)
+        self.assertEqual(response['Idempotency-Key'], clave)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.enviar(HTTP_IDEMPOTENCY_KEY=clave)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.enviar(HTTP_IDEMPOTENCY_KEY=clave)['Idempotent-Replayed'], 'true')
+        self.assertEqual(Resultado.objects.filter(alumno=self.alumno).count(), 1)
+
+    def test_503_conserva_la_clave_del_cliente(self):
+        """Prueba 2: si el cliente mandó clave, el 503 la repite."""
+        with mock.patch.object(calificacion, 'guardar', side_effect=TiempoAgotado()), \
+                self.assertLogs('ensayos.views', 'WARNING'):
+            response = self.enviar(HTTP_IDEMPOTENCY_KEY='envio-1')
+        self.assertEqual(contenido(response)['submission_id'], 'envio-1')
+
+
+class EnvioIdempotenteTest(TestCase):
+    """Pruebas de submit con Idempotency-Key: los reintentos no duplican el envío."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_idem', email='alumno@idem.cl',
+                                                 password='password', rol='alumno')
+        cls.ensayo = crear_ensayo()
+
+    def enviar(self, ensayo=None, clave='envio-1', **extra):
+        ensayo = ensayo or self.ensayo
+        with self.captureOnCommitCallbacks(execute=True):
+            return cliente(self.alumno).post(reverse('submit_ensayo', args=[ensayo.id]), respuestas_de(ensayo, 2),
+                                             format='json', HTTP_IDEMPOTENCY_KEY=clave, **extra)
+
+    def test_reintento_devuelve_lo_guardado(self):
+        """Prueba 1: el reintento responde lo mismo, marcado como repetido, sin otro resultado."""
+        primero = self.enviar()
+        self.assertEqual(primero.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', primero)
+        segundo = self.enviar()
+        self.assertEqual(segundo.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(segundo['Idempotent-Replayed'], 'true')
+        self.assertEqual(contenido(segundo), contenido(primero))
+        self.assertEqual(Resultado.objects.filter(alumno=self.alumno).count(), 1)
+
+    def test_claves_distintas_son_envios_distintos(self):
+        """Prueba 2: otra clave es otro intento."""
+        self.enviar(clave='envio-1')
+        self.enviar(clave='envio-2')
+        self.assertEqual(list(Resultado.objects.filter(alumno=self.alumno).order_by('intento')
+                              .values_list('intento', flat=True)), [1, 2])
+
+    def test_clave_en_el_body(self):
+        """Prueba 3: submission_id en el body sirve igual que el header."""
+        client = cliente(self.alumno)
+        url = reverse('submit_ensayo', args=[self.ensayo.id])
+        payload = {**respuestas_de(self.ensayo, 1), 'submission_id': 'body-1'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(url, payload, format='json').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(client.post(url, payload, format='json')['Idempotent-Replayed'], 'true')
+        self.assertEqual(Resultado.objects.filter(alumno=self.alumno).count(), 1)
+
+    def test_misma_clave_otro_ensayo(self):
+        """Prueba 4: reutilizar la clave en otro ensayo es un conflicto."""
+        self.enviar()
+        response = self.enviar(ensayo=crear_ensayo(titulo='Otro'))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_clave_demasiado_larga(self):
+        """Prueba 5: una clave más larga que la columna se rechaza con 400."""
+        response = self.enviar(clave='x' * 500)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', contenido(response))
+
+
+class ColaEnviosTest(TestCase):
+    """Pruebas del envío asíncrono: ticket, consulta de estado y procesamiento de la cola."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumnos = [Usuario.objects.create_user(username=f'alumno_cola_{i}', email=f'alumno{i}@cola.cl',
+                                                   password='password', rol='alumno') for i in range(3)]
+        cls.ensayo = crear_ensayo()
+
+    def setUp(self):
+        # Sin hilos: la cola se procesa a mano en cada prueba.
+        parche = mock.patch.object(cola, 'WORKERS', 0)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def encolar(self, alumno, correctas=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return cliente(alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]) + '?modo=async',
+                                        respuestas_de(self.ensayo, correctas), format='json')
+
+    def test_ticket_y_estado(self):
+        """Prueba 1: el envío responde 202 con un ticket cuyo estado pasa a completado al procesarse."""
+        alumno = self.alumnos[0]
+        response = self.encolar(alumno)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        data = contenido(response)
+        self.assertEqual(data['estado'], 'pendiente')
+        self.assertFalse(Resultado.objects.exists())
+        self.assertEqual(contenido(cliente(alumno).get(data['estado_url']))['estado'], 'pendiente')
+        self.assertEqual(cliente(self.alumnos[1]).get(data['estado_url']).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.assertEqual(cola.procesar_pendientes(), 1)
+        estado = contenido(cliente(alumno).get(data['estado_url']))
+        self.assertEqual(estado['estado'], 'completado')
+        self.assertEqual(estado['resultado_id'], Resultado.objects.get(alumno=alumno).id)
+
+    def test_un_envio_malo_no_arrastra_al_lote(self):
+        """Prueba 2: si un envío del lote falla, los demás se guardan y sólo él vuelve a la cola."""
+        for i, alumno in enumerate(self.alumnos):
+            self.encolar(alumno, correctas=i)
+        roto = respuestas_de(self.ensayo, 1)['respuestas']
+        calificar = calificacion.calificar
+
+        def calificar_o_fallar(pauta, respuestas):
+            if respuestas == roto:
+                raise ValueError('payload roto')
+            return calificar(pauta, respuestas)
+
+        with mock.patch.object(calificacion, 'calificar', side_effect=calificar_o_fallar), \
+                self.assertLogs('ensayos.cola', 'WARNING'):
+            self.assertEqual(cola.procesar_lote(cola.reclamar_lote()), 2)
+            estados = dict(EnvioPendiente.objects.values_list('alumno_id', 'estado'))
+            self.assertEqual(estados, {self.alumnos[0].id: 'completado', self.alumnos[1].id: 'pendiente',
+                                       self.alumnos[2].id: 'completado'})
+            for _ in range(cola.MAX_INTENTOS):
+                cola.procesar_pendientes()
+        malo = EnvioPendiente.objects.get(alumno=self.alumnos[1])
+        self.assertEqual((malo.estado, malo.intentos), ('error', cola.MAX_INTENTOS))
+        self.assertEqual(Resultado.objects.count(), 2)
+
+    def test_recuperar_abandonados(self):
+        """Prueba 3: lo que quedó en 'procesando' tras un reinicio vuelve a la cola y se completa."""
+        self.encolar(self.alumnos[0])
+        self.assertEqual(len(cola.reclamar_lote()), 1)
+        # El proceso que lo reclamó murió: nadie lo termina.
+        self.assertEqual(cola.recuperar_abandonados(), 0)
+        EnvioPendiente.objects.update(actualizado=timezone.now() - timedelta(seconds=cola.TIMEOUT_RECLAMO + 1))
+        self.assertEqual(cola.recuperar_abandonados(), 1)
+        self.assertEqual(cola.procesar_pendientes(), 1)
+        envio = EnvioPendiente.objects.get()
+        self.assertEqual((envio.estado, envio.intentos), ('completado', 2))
+
+
+class MatrizRespuestasTest(TestCase):
+    """Pruebas de analisis.matriz_respuestas: una fila por resultado, aunque no tenga respuestas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_matriz', email='alumno@matriz.cl',
+                                                 password='password', rol='alumno')
+        cls.ensayo = crear_ensayo()
+
+    def test_resultado_sin_respuestas(self):
+        """Prueba 1: un resultado sin respuestas es una fila de ceros, no desaparece."""
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente(self.alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]),
+                                      respuestas_de(self.ensayo, 3), format='json')
+        vacio = Resultado.objects.create(ensayo=self.ensayo, alumno=self.alumno, puntaje_total=0)
+
+        pregunta_ids, resultado_ids, correctas, elegidas = analisis.matriz_respuestas(self.ensayo.id)
+        self.assertEqual(len(pregunta_ids), 3)
+        self.assertEqual(list(resultado_ids)[-1], vacio.id)
+        self.assertEqual(correctas.tolist(), [[1, 1, 1], [0, 0, 0]])
+        self.assertEqual(elegidas[1].tolist(), [0, 0, 0])
+        self.assertEqual(analisis.analizar(self.ensayo.id)['n_alumnos'], 2)
+
+    def enviar(self, correctas):
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente(self.alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]),
+                                      respuestas_de(self.ensayo, correctas), format='json')
+
+    def test_borrado_y_reenvio(self):
+        """Prueba 2: tras borrar un resultado y reenviar, el análisis cacheado no se reutiliza."""
+        cache.clear()
+        self.enviar(3)
+        self.assertEqual(analisis.obtener(self.ensayo.id)['media'], 3)
+        # Como si el borrado ocurriera en otro proceso: la cache local no se entera.
+        with mock.patch.object(analisis, 'invalidar'), self.captureOnCommitCallbacks(execute=True):
+            Resultado.objects.all().delete()
+        self.enviar(0)
+        data = analisis.obtener(self.ensayo.id)
+        self.assertEqual((data['n_alumnos'], data['media']), (1, 0))
+
+    def test_preguntas_nuevas_sin_senales(self):
+        """Prueba 3: preguntas agregadas sin señales (sólo nueva_version) cambian las columnas."""
+        cache.clear()
+        self.enviar(3)
+        self.assertEqual(analisis.obtener(self.ensayo.id)['n_items'], 3)
+        Pregunta.objects.bulk_create([Pregunta(ensayo=self.ensayo, enunciado='Nueva', tipo='alternativa_simple')])
+        snapshots.nueva_version(self.ensayo.id)
+        self.assertEqual(analisis.obtener(self.ensayo.id)['n_items'], 4)
+
+
+class CalibracionIRTTest(TestCase):
+    """Pruebas de irt.calibrar: la dificultad nueva invalida lo que depende del ensayo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ensayo = crear_ensayo(n_preguntas=4)
+        preguntas = list(cls.ensayo.preguntas.order_by('id').prefetch_related('opciones'))
+        alumnos = Usuario.objects.bulk_create([
+            Usuario(username=f'alumno_irt_{i}', email=f'alumno{i}@irt.cl', rol='alumno') for i in range(40)])
+        resultados = Resultado.objects.bulk_create([Resultado(ensayo=cls.ensayo, alumno=a) for a in alumnos])
+        # La pregunta j la acierta quien tiene i suficientemente alto: de fácil a difícil.
+        Respuesta.objects.bulk_create([
+            Respuesta(resultado=resultado, pregunta=pregunta, correcta=correcta,
+                      opcion=list(pregunta.opciones.all())[0 if correcta else 1])
+            for i, resultado in enumerate(resultados)
+            for j, pregunta in enumerate(preguntas)
+            for correcta in [(i * 7 + j * 3) % 40 >= 10 * j]])
+
+    def test_calibrar_sube_la_version(self):
+        """Prueba 1: si cambian las dificultades se sube la versión; si no, no."""
+        self.ensayo.refresh_from_db()
+        version = self.ensayo.version
+        self.assertIsNotNone(irt.calibrar(self.ensayo.id, forzar=True))
+        self.ensayo.refresh_from_db()
+        self.assertEqual(self.ensayo.version, version + 1)
+        self.assertNotIn('Sin definir', set(self.ensayo.preguntas.values_list('dificultad', flat=True)))
+
+        irt.calibrar(self.ensayo.id, forzar=True)
+        self.ensayo.refresh_from_db()
+        self.assertEqual(self.ensayo.version, version + 1)
+
+    def test_no_recalibra_sin_cambios(self):
+        """Prueba 2: sin datos nuevos no se reajusta; borrar y reenviar sí obliga a reajustar."""
+        self.assertIsNotNone(irt.calibrar(self.ensayo.id).duracion)
+        self.assertIsNone(irt.calibrar(self.ensayo.id).duracion)
+
+        resultado = Resultado.objects.filter(ensayo=self.ensayo).order_by('id').first()
+        respuestas = list(resultado.respuestas.all())
+        resultado.delete()
+        nuevo = Resultado.objects.create(ensayo=self.ensayo, alumno_id=resultado.alumno_id)
+        for respuesta in respuestas:
+            respuesta.pk, respuesta.resultado = None, nuevo
+        Respuesta.objects.bulk_create(respuestas)
+        self.assertIsNotNone(irt.calibrar(self.ensayo.id).duracion)
+
+
+class RankingTest(TestCase):
+    """Pruebas del ránking: docentes ven nombres; un alumno, sólo su puesto y vecinos anónimos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ensayo = crear_ensayo(n_preguntas=5)
+        cls.docente = Usuario.objects.create_user(username='docente_ranking', email='docente@ranking.cl',
+                                                  password='password', rol='docente')
+        cls.alumnos = [Usuario.objects.create_user(username=f'alumno_ranking_{i}', email=f'alumno{i}@ranking.cl',
+                                                   password='password', rol='alumno') for i in range(6)]
+
+    def setUp(self):
+        # Los tableros viven en memoria y los ids se repiten entre pruebas.
+        ranking._tableros.limpiar()
+        for correctas, alumno in enumerate(self.alumnos):
+            with self.captureOnCommitCallbacks(execute=True):
+                cliente(alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]),
+                                     respuestas_de(self.ensayo, correctas), format='json')
+
+    def url(self):
+        return reverse('ranking_ensayo', args=[self.ensayo.id])
+
+    def test_docente_ve_nombres(self):
+        """Prueba 1: el docente recibe la página con nombres, de mayor a menor."""
+        data = contenido(cliente(self.docente).get(self.url(), {'cantidad': 3}))
+        self.assertEqual(data['total'], 6)
+        self.assertEqual([f['nombre'] for f in data['top']],
+                         ['alumno_ranking_5', 'alumno_ranking_4', 'alumno_ranking_3'])
+
+    def test_alumno_ve_vecinos_anonimos(self):
+        """Prueba 2: el alumno ve su puesto y dos a cada lado, sin nombres ni ids."""
+        response = cliente(self.alumnos[3]).get(self.url(), {'cantidad': 100})
+        data = contenido(response)
+        self.assertNotIn('top', data)
+        self.assertNotIn(b'alumno_ranking', response.content)
+        self.assertEqual(data['yo']['posicion'], 3)
+        self.assertEqual([(f['posicion'], f['yo']) for f in data['vecinos']],
+                         [(1, False), (2, False), (3, True), (4, False), (5, False)])
+        self.assertTrue(all(set(f) == {'posicion', 'puntaje', 'yo'} for f in data['vecinos']))
+
+    def test_alumno_en_el_borde(self):
+        """Prueba 3: el primero ve sólo a los que vienen después."""
+        data = contenido(cliente(self.alumnos[5]).get(self.url()))
+        self.assertEqual([f['posicion'] for f in data['vecinos']], [1, 2, 3])
+
+    def test_alumno_sin_envios(self):
+        """Prueba 4: quien no rindió el ensayo no ve a nadie."""
+        otro = Usuario.objects.create_user(username='sin_envios', email='sin@ranking.cl', password='password')
+        data = contenido(cliente(otro).get(self.url()))
+        self.assertEqual((data['yo'], data['vecinos'], data['total']), (None, [], 6))
+
+    def test_ranking_curso(self):
+        """Prueba 5: el ránking por curso aplica la misma regla."""
+        url = reverse('ranking_curso', args=[self.ensayo.curso])
+        self.assertIn('top', contenido(cliente(self.docente).get(url)))
+        self.assertNotIn('top', contenido(cliente(self.alumnos[0]).get(url)))
+
+    def test_borrado_en_otro_proceso(self):
+        """Prueba 6: un Resultado borrado sin avisar a este proceso igual sale del tablero."""
+        url = reverse('ranking_curso', args=[self.ensayo.curso])
+        self.assertEqual(contenido(cliente(self.docente).get(self.url()))['total'], 6)
+        self.assertEqual(contenido(cliente(self.docente).get(url))['total'], 6)
+        # Como si el borrado ocurriera en otro worker: la señal no llega a estos tableros.
+        with mock.patch.object(ranking, 'invalidar'):
+            Resultado.objects.filter(alumno=self.alumnos[5]).delete()
+        data = contenido(cliente(self.docente).get(self.url(), {'cantidad': 1}))
+        self.assertEqual((data['total'], data['top'][0]['nombre']), (5, 'alumno_ranking_4'))
+        self.assertEqual(contenido(cliente(self.docente).get(url))['total'], 5)
+
+
+class CrearEnsayoTest(TestCase):
+    """Pruebas de la creación de un ensayo completo en un solo POST (ensayos.autoria)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.docente = Usuario.objects.create_user(username='docente_autoria', email='docente@autoria.cl',
+                                                  password='password', rol='docente')
+        cls.alumno = Usuario.objects.create_user(username='alumno_autoria', email='alumno@autoria.cl',
+                                                 password='password', rol='alumno')
+
+    def documento(self, **cambios):
+        pregunta = {
+            'enunciado': 'Si $x^2 = 9$, ¿cuánto vale x positivo?',
+            'explicacion_texto': 'Raíz cuadrada.',
+            'etiquetas': ['Álgebra', 'Ecuaciones'],
+            'opciones': [{'texto': '2'}, {'texto': '3', 'es_correcta': True}, {'texto': '4'}],
+            **cambios,
+        }
+        return {'titulo': 'Ensayo nuevo', 'materia': 'Matemática', 'curso': '4M', 'preguntas': [
+            pregunta,
+            {'enunciado': '¿Capital de Chile?', 'etiquetas': ['Geografía'],
+             'opciones': [{'texto': 'Santiago', 'es_correcta': True}, {'texto': 'Lima'}]},
+        ]}
+
+    def crear(self, documento, usuario=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return cliente(usuario or self.docente).post(reverse('crear_ensayo'), documento, format='json')
+
+    def test_documento_valido(self):
+        """Prueba 1: se crean preguntas, opciones y etiquetas; quedan indexadas y con sus fórmulas."""
+        with mock.patch.object(formulas, 'registrar') as registrar:
+            response = self.crear(self.documento())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = contenido(response)
+        ensayo = Ensayo.objects.get(pk=data['id'])
+        self.assertEqual(ensayo.creador_id, self.docente.id)
+        preguntas = list(ensayo.preguntas.order_by('id'))
+        self.assertEqual(data['pregunta_ids'], [p.id for p in preguntas])
+        self.assertEqual([p.correct_answer for p in preguntas], ['B', 'A'])
+        self.assertEqual(preguntas[0].opciones.get(es_correcta=True).texto, '3')
+        self.assertTrue(preguntas[0].hash_contenido)
+        self.assertEqual(set(preguntas[0].etiquetas.values_list('nombre', flat=True)), {'Álgebra', 'Ecuaciones'})
+        self.assertEqual(Etiqueta.objects.count(), 3)
+
+        self.assertEqual([r['pregunta_id'] for r in busqueda.buscar('capital')[0]], [preguntas[1].id])
+        registrar.assert_called_once()
+        self.assertEqual(set(registrar.call_args.args[0]), {'x^2 = 9'})
+
+    def test_documentos_invalidos(self):
+        """Prueba 2: dos correctas, ninguna correcta o un tipo desconocido dan 400 sin crear nada."""
+        dos = [{'texto': '2', 'es_correcta': True}, {'texto': '3', 'es_correcta': True}]
+        ninguna = [{'texto': '2'}, {'texto': '3'}]
+        for documento in (self.documento(opciones=dos), self.documento(opciones=ninguna),
+                          self.documento(tipo='ensayo_libre')):
+            response = self.crear(documento)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('detalle', contenido(response))
+        self.assertFalse(Ensayo.objects.exists())
+
+    def test_alumno_no_crea(self):
+        """Prueba 3: un alumno no puede crear ensayos."""
+        self.assertEqual(self.crear(self.documento(), usuario=self.alumno).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BusquedaPreguntasTest(TestCase):
+    """Pruebas de la búsqueda de texto completo: orden por relevancia y un índice al día."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.docente = Usuario.objects.create_user(username='docente_busqueda', email='docente@busqueda.cl',
+                                                  password='password', rol='docente')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ensayo = Ensayo.objects.create(titulo='Banco', materia='Ciencias', curso='4M')
+            self.en_enunciado = Pregunta.objects.create(ensayo=ensayo, enunciado='¿Qué órgano bombea la sangre?')
+            Opcion.objects.create(pregunta=self.en_enunciado, texto='El corazón', es_correcta=True)
+            self.en_opcion = Pregunta.objects.create(ensayo=ensayo, enunciado='¿Qué transporta el oxígeno?')
+            Opcion.objects.create(pregunta=self.en_opcion, texto='La sangre', es_correcta=True)
+            self.etiqueta = Etiqueta.objects.create(nombre='Biología')
+            self.en_enunciado.etiquetas.add(self.etiqueta)
+
+    def buscar(self, q):
+        response = cliente(self.docente).get(reverse('buscar_preguntas'), {'q': q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [r['pregunta_id'] for r in contenido(response)['resultados']]
+
+    def test_busqueda_y_orden(self):
+        """Prueba 1: sin tildes ni mayúsculas, y el enunciado pesa más que las opciones."""
+        self.assertEqual(self.buscar('SANGRE'), [self.en_enunciado.id, self.en_opcion.id])
+        self.assertEqual(self.buscar('organo'), [self.en_enunciado.id])
+        self.assertEqual(self.buscar('oxig'), [self.en_opcion.id])
+        self.assertEqual(self.buscar('biologia'), [self.en_enunciado.id])
+
+    def test_reindexa_al_editar(self):
+        """Prueba 2: editar el enunciado, una opción o una etiqueta actualiza el índice."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.en_opcion.enunciado = '¿Qué transporta el dióxido de carbono?'
+            self.en_opcion.save()
+        self.assertEqual(self.buscar('oxigeno'), [])
+        self.assertEqual(self.buscar('dioxido'), [self.en_opcion.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Opcion.objects.filter(pregunta=self.en_opcion).get().delete()
+            Opcion.objects.create(pregunta=self.en_opcion, texto='La hemoglobina', es_correcta=True)
+        self.assertEqual(self.buscar('sangre'), [self.en_enunciado.id])
+        self.assertEqual(self.buscar('hemoglobina'), [self.en_opcion.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.etiqueta.nombre = 'Fisiología'
+            self.etiqueta.save()
+        self.assertEqual(self.buscar('biologia'), [])
+        self.assertEqual(self.buscar('fisiologia'), [self.en_enunciado.id])
+
+    def test_borrar_la_quita_del_indice(self):
+        """Prueba 3: una pregunta borrada deja de aparecer."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.en_enunciado.delete()
+        self.assertEqual(self.buscar('sangre'), [self.en_opcion.id])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {busqueda.TABLA}')
+            self.assertEqual([fila[0] for fila in cursor.fetchall()], [self.en_opcion.id])
+
+
+class ImportarPreguntasTest(TestCase):
+    """Pruebas de la importación de preguntas por la API: duplicadas, errores y tamaño."""
+
+    CSV = (
+        'enunciado,opcion_a,opcion_b,opcion_c,correcta,etiquetas\n'
+        '¿Cuánto es 2 + 2?,3,4,5,B,Aritmética\n'
+        '¿Capital de Chile?,Lima,Santiago,Quito,B,Geografía;Sudamérica\n'
+        '¿cuánto  es 2 + 2?,5,4,3,B,\n'
+        ',sin,enunciado,aquí,A,\n'
+        '¿Letra inválida?,uno,dos,tres,Z,\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.docente = Usuario.objects.create_user(username='docente_importar', email='docente@importar.cl',
+                                                  password='password', rol='docente')
+        cls.alumno = Usuario.objects.create_user(username='alumno_importar', email='alumno@importar.cl',
+                                                 password='password', rol='alumno')
+
+    def importar(self, usuario, contenido_csv, **datos):
+        archivo = SimpleUploadedFile('banco.csv', contenido_csv.encode('utf-8'), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            return cliente(usuario).post(reverse('importar_preguntas'),
+                                         {'archivo': archivo, 'titulo': 'Importado', **datos}, format='multipart')
+
+    def test_duplicadas_y_errores(self):
+        """Prueba 1: se crean las válidas; las duplicadas y las con error se informan por fila."""
+        response = self.importar(self.docente, self.CSV)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = contenido(response)
+        self.assertEqual((data['leidas'], data['creadas'], data['duplicadas'], data['con_error']), (5, 2, 1, 2))
+        self.assertEqual(len(data['errores']), 3)
+        ensayo = Ensayo.objects.get(pk=data['ensayo_id'])
+        self.assertEqual(ensayo.preguntas.count(), 2)
+        capital = ensayo.preguntas.get(enunciado='¿Capital de Chile?')
+        self.assertEqual(capital.opciones.get(es_correcta=True).texto, 'Santiago')
+        self.assertEqual(set(capital.etiquetas.values_list('nombre', flat=True)), {'Geografía', 'Sudamérica'})
+
+    def test_reimportar_no_duplica(self):
+        """Prueba 2: importar el mismo archivo otra vez no crea nada."""
+        self.importar(self.docente, self.CSV)
+        data = contenido(self.importar(self.docente, self.CSV))
+        self.assertEqual((data['creadas'], data['duplicadas']), (0, 3))
+        self.assertEqual(Pregunta.objects.count(), 2)
+
+    def test_alumno_no_importa(self):
+        """Prueba 3: un alumno no puede importar."""
+        self.assertEqual(self.importar(self.alumno, self.CSV).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_archivo_grande_va_por_el_comando(self):
+        """Prueba 4: un archivo sobre el máximo web se rechaza con 413 sin crear el ensayo."""
+        with mock.patch.object(importacion, 'MAX_BYTES_WEB', 100):
+            response = self.importar(self.docente, self.CSV)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn('importar_preguntas', contenido(response)['error'])
+        self.assertFalse(Ensayo.objects.filter(titulo='Importado').exists())
+
+
+class GenerarEnsayoTest(TestCase):
+    """Pruebas del ensamblador: bandas de dificultad abiertas y validación del pedido."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.docente = Usuario.objects.create_user(username='docente_generar', email='docente@generar.cl',
+                                                  password='password', rol='docente')
+        crear_ensayo('Banco', n_preguntas=6)
+
+    def setUp(self):
+        ensamblador.invalidar_banco()
+
+    def banco(self):
+        return ensamblador.Banco(range(100), ['Matemática'] * 100, ['alternativa_simple'] * 100,
+                                 np.linspace(-2, 2, 100), [()] * 100)
+
+    def test_banda_con_un_solo_extremo(self):
+        """Prueba 1: una banda con un extremo infinito se cumple apuntando al extremo finito."""
+        banco = self.banco()
+        elegidas = ensamblador.resolver(banco, 20, banda=(0.5, float('inf')), semilla=1)
+        self.assertEqual(len(elegidas), 20)
+        self.assertGreaterEqual(banco.dificultades[elegidas].mean(), 0.5)
+        elegidas = ensamblador.resolver(banco, 20, banda=(float('-inf'), -1.0), semilla=1)
+        self.assertLessEqual(banco.dificultades[elegidas].mean(), -1.0)
+
+    def generar(self, dificultad):
+        return cliente(self.docente).post(reverse('generar_ensayo'), {
+            'titulo': 'Generado', 'materia': 'Matemática', 'curso': '4M',
+            'n_preguntas': 3, 'dificultad': dificultad, 'semilla': 1,
+        }, format='json')
+
+    def test_vista_banda_abierta(self):
+        """Prueba 2: la vista acepta dificultad sólo con min."""
+        response = self.generar({'min': -1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Ensayo.objects.get(pk=contenido(response)['ensayo_id']).preguntas.count(), 3)
+
+    def test_vista_banda_invalida(self):
+        """Prueba 3: min mayor que max o NaN responden 400."""
+        for dificultad in ({'min': 1, 'max': -1}, {'min': 'nan'}, {'max': 'NaN'}):
+            self.assertEqual(self.generar(dificultad).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Ensayo.objects.filter(titulo='Generado').exists())
+
+
+class RevisionBarajadaTest(TestCase):
+    """Pruebas del barajado: la revisión de cada intento muestra el orden que vio el alumno."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = Usuario.objects.create_user(username='alumno_barajado', email='alumno@barajado.cl',
+                                                 password='password', rol='alumno')
+        cls.docente = Usuario.objects.create_user(username='docente_barajado', email='docente@barajado.cl',
+                                                  password='password', rol='docente')
+        cls.ensayo = crear_ensayo(n_preguntas=8)
+
+    def orden_visto(self):
+        data = contenido(cliente(self.alumno).get(reverse('ensayo-detail', args=[self.ensayo.id])))
+        return [(p['id'], [o['id'] for o in p['opciones']]) for p in data['preguntas']]
+
+    def rendir(self, orden):
+        # Contesta la primera opción que ve en cada pregunta.
+        payload = {'respuestas': [{'pregunta_id': pid, 'opcion_id': opciones[0]} for pid, opciones in orden]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = cliente(self.alumno).post(reverse('submit_ensayo', args=[self.ensayo.id]), payload,
+                                                 format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Resultado.objects.filter(alumno=self.alumno).latest('id')
+
+    def orden_revisado(self, resultado, usuario=None):
+        data = contenido(cliente(usuario or self.alumno).get(
+            reverse('review_resultado', args=[self.ensayo.id, resultado.id])))
+        self.assertEqual(data['intento'], resultado.intento)
+        preguntas = data['preguntas']
+        return [(p['pregunta_id'], [o['id'] for o in p['all_options']]) for p in preguntas], preguntas
+
+    def test_revision_con_el_orden_visto(self):
+        """Prueba 1: cada intento se revisa en su orden, también por el docente."""
+        primero = self.orden_visto()
+        self.assertNotEqual(primero, sorted((pid, sorted(ops)) for pid, ops in primero))
+        resultado_1 = self.rendir(primero)
+
+        segundo = self.orden_visto()
+        self.assertNotEqual(segundo, primero)
+        resultado_2 = self.rendir(segundo)
+
+        self.assertEqual(self.orden_revisado(resultado_1)[0], primero)
+        self.assertEqual(self.orden_revisado(resultado_2)[0], segundo)
+        self.assertEqual(self.orden_revisado(resultado_1, self.docente)[0], primero)
+
+    def test_calificacion_no_depende_del_orden(self):
+        """Prueba 2: la opción elegida y si fue correcta salen por id, no por posición."""
+        orden = self.orden_visto()
+        resultado = self.rendir(orden)
+        _, preguntas = self.orden_revisado(resultado)
+        correctas = set(Opcion.objects.filter(es_correcta=True).values_list('id', flat=True))
+        for (_, opciones), pregunta in zip(orden, preguntas):
+            self.assertEqual(pregunta['opcion_elegida_id'], opciones[0])
+            self.assertEqual(pregunta['correcta'], opciones[0] in correctas)
+        self.assertEqual(resultado.puntaje_total, int(sum(p['correcta'] for p in preguntas) / 8 * 1000))
+
+
+def imagen_de_prueba(ancho=800, alto=600, formato='JPEG', modo='RGB'):
+    contenido = io.BytesIO()
+    Image.new(modo, (ancho, alto), (200, 30, 30, 128)[:len(modo)]).save(contenido, formato)
+    extension = {'JPEG': 'jpg', 'PNG': 'png'}[formato]
+    return SimpleUploadedFile(f'figura.{extension}', contenido.getvalue(), content_type=f'image/{formato.lower()}')
+
+
+class ImagenesTest(TestCase):
+    """Pruebas de la subida de imágenes y de las variantes que se sirven."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.docente = Usuario.objects.create_user(username='docente_imagenes', email='docente@imagenes.cl',
+                                                  password='password', rol='docente')
+        cls.alumno = Usuario.objects.create_user(username='alumno_imagenes', email='alumno@imagenes.cl',
+                                                 password='password', rol='alumno')
+        cls.pregunta = crear_ensayo(n_preguntas=1).preguntas.get()
+
+    def setUp(self):
+        # Archivos en una carpeta temporal; las variantes se generan al pedirlas, sin pool.
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        for parche in (mock.patch.object(imagenes, 'DIRECTORIO', Path(media) / 'imagenes'),
+                       mock.patch.object(imagenes, 'PROCESOS', 0)):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def subir(self, archivo, usuario=None, **datos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return cliente(usuario or self.docente).post(reverse('subir_imagen'), {'archivo': archivo, **datos},
+                                                         format='multipart')
+
+    def test_subir_y_asociar(self):
+        """Prueba 1: la imagen queda asociada a la pregunta, con sus variantes descritas."""
+        response = self.subir(imagen_de_prueba(), pregunta_id=self.pregunta.id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = contenido(response)
+        self.assertEqual((data['ancho'], data['alto'], data['pregunta_id']), (800, 600, self.pregunta.id))
+        self.assertEqual(data['variantes']['movil']['ancho'], 640)
+        self.assertEqual(data['variantes']['escritorio']['ancho'], 800)
+        self.assertEqual(set(data['variantes']['miniatura']), {'ancho', 'alto', 'jpg', 'webp'})
+        self.pregunta.refresh_from_db()
+        self.assertEqual(self.pregunta.imagen_id, data['id'])
+
+    def test_mismo_contenido_se_reutiliza(self):
+        """Prueba 2: subir el mismo contenido otra vez responde 200 con la misma imagen."""
+        primera = contenido(self.subir(imagen_de_prueba()))
+        response = self.subir(imagen_de_prueba())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(contenido(response)['id'], primera['id'])
+        self.assertEqual(Imagen.objects.count(), 1)
+
+    def test_rechazos(self):
+        """Prueba 3: un alumno no sube imágenes y un archivo que no es imagen da 400."""
+        self.assertEqual(self.subir(imagen_de_prueba(), usuario=self.alumno).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        falso = SimpleUploadedFile('figura.png', b'no soy una imagen', content_type='image/png')
+        response = self.subir(falso)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', contenido(response))
+
+    def test_variante_bajo_demanda(self):
+        """Prueba 4: una variante que aún no existe se genera al pedirla y se sirve inmutable."""
+        url = contenido(self.subir(imagen_de_prueba()))['variantes']['movil']['webp']
+        response = Client().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as variante:
+            self.assertEqual(variante.size, (640, 480))
+
+        repetida = Client().get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+    def test_transparente_en_png(self):
+        """Prueba 5: con transparencia las variantes van en PNG en vez de JPEG."""
+        data = contenido(self.subir(imagen_de_prueba(formato='PNG', modo='RGBA')))
+        url = data['variantes']['miniatura']['png']
+        self.assertEqual(Client().get(url)['Content-Type'], 'image/png')
+
+    def test_variante_desconocida(self):
+        """Prueba 6: un nombre que no es variante de la versión actual da 404."""
+        original = contenido(self.subir(imagen_de_prueba()))['original']
+        self.assertEqual(Client().get(original.replace('original', 'gigante-1')).status_code, 404)
+        self.assertEqual(Client().get(original).status_code, 200)
+
+    def test_copia_generada_conserva_imagen(self):
+        """Prueba 7: la copia que arma el ensamblador apunta a la misma imagen."""
+        imagen_id = contenido(self.subir(imagen_de_prueba(), pregunta_id=self.pregunta.id))['id']
+        ensayo = ensamblador.crear_ensayo('Generado', 'Matemática', '4M', self.docente, [self.pregunta.id])
+        copia = ensayo.preguntas.get()
+        self.assertEqual((copia.origen_id, copia.imagen_id), (self.pregunta.id, imagen_id))
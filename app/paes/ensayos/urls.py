@@ -1,15 +1,29 @@
 # app/paes/ensayos/urls.py
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     # rutas relativas a /api/ensayos/ (porque paes.urls hace include('ensayos.urls') en 'api/ensayos/')
     path('<int:ensayo_id>/submit/', views.submit_ensayo, name='submit_ensayo'),
+    path('envios/<int:ticket>/', views.estado_envio, name='estado_envio'),
     path('<int:ensayo_id>/results/summary/', views.results_summary, name='results_summary'),
+    path('<int:ensayo_id>/results/items/', views.item_analysis, name='item_analysis'),
+    path('<int:ensayo_id>/results/irt/', views.irt_parametros, name='irt_parametros'),
+    path('<int:ensayo_id>/ranking/', views.ranking_ensayo, name='ranking_ensayo'),
+    path('ranking/curso/<str:curso>/', views.ranking_curso, name='ranking_curso'),
     path('<int:ensayo_id>/questions/<int:pregunta_id>/breakdown/', views.question_breakdown, name='question_breakdown'),
 
     # nuevos endpoints
     path('completados/', views.ensayos_completados, name='ensayos_completados'),
     path('<int:ensayo_id>/results/<int:resultado_id>/review/', views.review_resultado, name='review_resultado'),
+    path('crear/', views.crear_ensayo, name='crear_ensayo'),
+    path('importar/', views.importar_preguntas, name='importar_preguntas'),
+    path('generar/', views.generar_ensayo, name='generar_ensayo'),
+    path('preguntas/buscar/', views.buscar_preguntas, name='buscar_preguntas'),
     path('preguntas/<int:pregunta_id>/explicacion/', views.editar_explicacion, name='editar_explicacion'),
+    re_path(r'^formulas/(?P<clave>[0-9a-f]{32})\.svg$', views.formula_svg, name='formula_svg'),
+    path('imagenes/', views.subir_imagen, name='subir_imagen'),
+    re_path(r'^imagenes/(?P<hash_>[0-9a-f]{32})/(?P<nombre>[a-z]+(?:-\d+)?\.(?:jpg|png|webp|gif))$',
+            views.imagen_archivo, name='imagen_archivo'),
+    path('cache/', views.estadisticas_cache, name='estadisticas_cache'),
 ]
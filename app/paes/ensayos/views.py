@@ -1,28 +1,171 @@
 from rest_framework import viewsets
-from .serializers import EnsayoSerializer
+from rest_framework.pagination import CursorPagination
+from .serializers import EnsayoSerializer, EnsayoResumenSerializer, EnsayoNuevoSerializer
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import SAFE_METHODS, BasePermission
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q
-from .models import Ensayo, Pregunta, Opcion, Resultado, Respuesta
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+from django.db.models import Count
+from .models import Ensayo, Pregunta, Resultado, Respuesta, EnvioPendiente
+from . import agregados, analisis, autoria, barajado, busqueda, calificacion, cola, desglose, ensamblador, formulas, idempotencia, imagenes, importacion, irt, ranking, snapshots
+from .escritor import TiempoAgotado
+from usuarios import autenticacion
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.urls import reverse
+import io
 import logging
-import json
+import re
+import uuid
 
 logger = logging.getLogger(__name__)
 
 PERMISO_INSUF = 'Permisos insuficientes'
 
 
+class DocenteOSoloLectura(BasePermission):
+    """Cualquiera puede leer; crear, editar o borrar, sólo docentes y staff."""
+    message = PERMISO_INSUF
+
+    def has_permission(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        user = request.user
+        return bool(user and user.is_authenticated and (getattr(user, 'rol', None) == 'docente' or user.is_staff))
+
+
+ACEPTA_GZIP = re.compile(r'\bgzip\b')
+
+
+def _servir_snapshot(request, snapshot, intento=None):
+    """
+    Bytes del snapshot tal cual (gzip si el cliente lo acepta), o 304 si ya
+    tiene esa versión. Con `intento`, preguntas y opciones van en el orden
+    del alumno para ese intento.
+    """
+    etag = snapshot.etag
+    semilla = None
+    if intento is not None:
+        semilla = barajado.semilla(request.user.id, snapshot.ensayo_id, intento)
+        etag = barajado.etag(snapshot, semilla)
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    elif semilla is not None:
+        response = HttpResponse(barajado.fragmentos(snapshot).render(semilla, intento), content_type='application/json')
+    elif ACEPTA_GZIP.search(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(snapshot.contenido_gzip, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(snapshot.contenido, content_type='application/json')
+    response['ETag'] = etag
+    # La variante depende del usuario autenticado.
+    response['Vary'] = 'Accept-Encoding, Authorization'
+    # El cliente puede guardarlo, pero debe revalidar con If-None-Match.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class EnsayoCursorPagination(CursorPagination):
+    ordering = ('-fecha', '-id')
+    page_size = 50
+    page_size_query_param = 'cantidad'
+    max_page_size = 200
+
+
 class ExamViewSet(viewsets.ModelViewSet):
     """
     ViewSet mínimo para exponer Ensayo vía /api/exams/
+
+    El listado usa EnsayoResumenSerializer (sin preguntas, con n_preguntas
+    anotado) y paginación por cursor; el detalle se sirve desde el snapshot
+    de la versión actual del ensayo (ensayos.snapshots). Las escrituras son
+    sólo para docentes y staff, y responden con ese mismo detalle.
     """
-    queryset = Ensayo.objects.all().order_by('-fecha')
+    queryset = Ensayo.objects.all().order_by('-fecha', '-id')
     serializer_class = EnsayoSerializer
-    permission_classes = [IsAuthenticatedOrReadOnly]
+    permission_classes = [DocenteOSoloLectura]
+    pagination_class = EnsayoCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return queryset.annotate(n_preguntas=Count('preguntas'))
+        return queryset.prefetch_related('preguntas__opciones', 'preguntas__imagen')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return EnsayoResumenSerializer
+        return super().get_serializer_class()
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            ensayo_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        return self._detalle(request, ensayo_id)
+
+    def create(self, request, *args, **kwargs):
+        creado = super().create(request, *args, **kwargs)
+        return self._detalle(request, creado.data['id'], status.HTTP_201_CREATED)
+
+    def update(self, request, *args, **kwargs):
+        # También cubre partial_update. La respuesta de EnsayoSerializer se
+        # descarta: trae la pauta y la variante debe depender del rol.
+        actualizado = super().update(request, *args, **kwargs)
+        return self._detalle(request, actualizado.data['id'])
+
+    def _detalle(self, request, ensayo_id, codigo=status.HTTP_200_OK):
+        # Sólo docentes y staff reciben es_correcta y las explicaciones; los
+        # alumnos autenticados reciben además su propio orden de preguntas.
+        user = request.user
+        intento = None
+        if user.is_staff or getattr(user, 'rol', None) == 'docente':
+            snapshot = snapshots.obtener(ensayo_id, snapshots.COMPLETO)
+        elif user.is_authenticated and barajado.ACTIVO:
+            snapshot, intento = snapshots.obtener_para_alumno(ensayo_id, user.id)
+        else:
+            snapshot = snapshots.obtener(ensayo_id, snapshots.ALUMNO)
+        if snapshot is None:
+            raise Http404
+        response = _servir_snapshot(request, snapshot, intento)
+        if response.status_code == status.HTTP_200_OK:
+            response.status_code = codigo
+        return response
+
+
+def _repetir_envio(previa, ensayo):
+    if previa.ensayo_id != ensayo.id:
+        return Response({'error': 'La clave de idempotencia ya se usó para otro ensayo.'},
+                        status=status.HTTP_409_CONFLICT)
+    return Response(previa.respuesta, status=previa.codigo_estado, headers={'Idempotent-Replayed': 'true'})
+
+
+def _modo_asincrono(request):
+    modo = request.query_params.get('modo')
+    if modo is None and isinstance(request.data, dict):
+        modo = request.data.get('modo')
+    if modo is None:
+        return getattr(settings, 'ENSAYOS_ENVIO_ASINCRONO', False)
+    return modo == 'async'
+
+
+POR_PAGINA = 20
+MAX_POR_PAGINA = 100
+
+
+def _paginacion(request):
+    try:
+        desde = max(0, int(request.query_params.get('desde', 0)))
+        cantidad = int(request.query_params.get('cantidad', POR_PAGINA))
+    except ValueError:
+        return None
+    return desde, max(1, min(cantidad, MAX_POR_PAGINA))
 
 
 @api_view(['POST'])
@@ -44,91 +187,81 @@ def submit_ensayo(request, ensayo_id):
         return Response({'error': 'Campo "respuestas" debe ser una lista.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    resultado = Resultado.objects.create(ensayo=ensayo, alumno=alumno, puntaje_total=0)
-
-    total_preguntas = ensayo.preguntas.count()
-    correctas = 0
-    errores = []
-
-    for idx, rp in enumerate(respuestas_payload):
-        if isinstance(rp, str):
-            try:
-                rp = json.loads(rp)
-            except Exception:
-                errores.append({'index': idx, 'error': 'Elemento no parseable como JSON', 'raw': str(rp)})
-                continue
-
-        if not isinstance(rp, dict):
-            errores.append({'index': idx, 'error': 'Elemento debe ser un objeto con keys pregunta_id/opcion_id/texto', 'raw': str(rp)})
-            continue
+    clave = idempotencia.clave_de_request(request)
+    if clave is not None:
+        if len(clave) > idempotencia.LARGO_MAXIMO:
+            return Response({'error': f'La clave de idempotencia no puede superar {idempotencia.LARGO_MAXIMO} caracteres.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        previa = idempotencia.buscar(alumno.id, clave)
+        if previa:
+            return _repetir_envio(previa, ensayo)
 
-        pregunta_id = rp.get('pregunta_id')
-        opcion_id = rp.get('opcion_id')
-        texto = rp.get('texto', None)
-
-        if pregunta_id is None:
-            errores.append({'index': idx, 'error': 'Falta pregunta_id', 'data': rp})
-            continue
-
-        try:
-            pregunta = Pregunta.objects.get(pk=int(pregunta_id), ensayo=ensayo)
-        except (Pregunta.DoesNotExist, ValueError):
-            errores.append({'index': idx, 'error': f'Pregunta {pregunta_id} no encontrada en el ensayo {ensayo_id}.'})
-            continue
-
-        opcion_obj = None
-        correcta = False
-
-        if opcion_id is not None:
-            try:
-                opcion_id_int = int(opcion_id)
-            except Exception:
-                errores.append({'index': idx, 'error': f'opcion_id inválido: {opcion_id}'})
-                continue
-
-            try:
-                opcion_obj = Opcion.objects.get(pk=opcion_id_int)
-                if opcion_obj.pregunta_id != pregunta.id:
-                    errores.append({'index': idx, 'error': f'Opción {opcion_id_int} no pertenece a la pregunta {pregunta_id}.'})
-                    opcion_obj = None
-                    correcta = False
-                else:
-                    correcta = bool(opcion_obj.es_correcta)
-            except Opcion.DoesNotExist:
-                errores.append({'index': idx, 'error': f'Opción {opcion_id_int} no encontrada.'})
-                opcion_obj = None
-                correcta = False
-        else:
-            correcta = False
-
-        if correcta:
-            correctas += 1
+    try:
+        if _modo_asincrono(request):
+            with transaction.atomic():
+                envio = cola.encolar(ensayo.id, alumno.id, respuestas_payload)
+                encolado = {
+                    'ticket': envio.id,
+                    'estado': envio.estado,
+                    'estado_url': reverse('estado_envio', args=[envio.id]),
+                }
+                if clave is not None:
+                    idempotencia.registrar([
+                        idempotencia.nueva(alumno.id, clave, ensayo.id, status.HTTP_202_ACCEPTED, encolado)
+                    ])
+            return Response(encolado, status=status.HTTP_202_ACCEPTED)
+
+        if clave is None and getattr(settings, 'ENSAYOS_ESCRITURA_AGRUPADA', False):
+            # Si el escritor no confirma a tiempo el envío igual puede quedar
+            # guardado: con una clave propia el cliente reintenta sin duplicarlo.
+            clave = uuid.uuid4().hex
+        pauta = calificacion.obtener_pauta(ensayo.id, ensayo.version)
+        calif = calificacion.calificar(pauta, respuestas_payload)
+        calif.clave_idempotencia = clave
+        resultado = calificacion.guardar(alumno.id, calif)
+    except IntegrityError:
+        # Otro reintento con la misma clave ganó la carrera: se responde lo que él guardó.
+        previa = idempotencia.buscar(alumno.id, clave) if clave is not None else None
+        if previa is None:
+            raise
+        return _repetir_envio(previa, ensayo)
+    except TiempoAgotado:
+        # 503 no significa "no guardado": el lote puede confirmarse después.
+        # Reintentar con la misma clave devuelve lo guardado o lo guarda una vez.
+        logger.warning("submit_ensayo: escritura no confirmada a tiempo (ensayo %s)", ensayo.id)
+        return Response({'error': 'El servidor está ocupado; el envío puede haberse guardado. '
+                                  'Reintente con la misma clave de idempotencia.',
+                         'submission_id': clave},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={'Idempotency-Key': clave, 'Retry-After': '1'})
+
+    return Response(calificacion.resumen(resultado, calif), status=status.HTTP_201_CREATED)
 
-        Respuesta.objects.create(
-            resultado=resultado,
-            pregunta=pregunta,
-            opcion=opcion_obj,
-            texto=texto if texto is not None else '',
-            correcta=correcta
-        )
 
-    if total_preguntas > 0:
-        puntaje = int((correctas / total_preguntas) * 1000)
-    else:
-        puntaje = 0
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estado_envio(request, ticket):
+    envio = get_object_or_404(EnvioPendiente.objects.select_related('resultado'), pk=ticket)
 
-    resultado.puntaje_total = puntaje
-    resultado.save()
+    user = request.user
+    if not (envio.alumno_id == user.id or getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
 
-    resp = {
-        'resultado_id': resultado.id,
-        'puntaje': resultado.puntaje_total,
-        'fecha': resultado.fecha.isoformat() if getattr(resultado, 'fecha', None) else None
+    # Si el proceso se reinició, los workers arrancan con la primera consulta.
+    if envio.estado in ('pendiente', 'procesando'):
+        cola.iniciar_workers()
+
+    data = {
+        'ticket': envio.id,
+        'ensayo_id': envio.ensayo_id,
+        'estado': envio.estado,
+        'resultado_id': envio.resultado_id,
+        'puntaje': envio.resultado.puntaje_total if envio.resultado else None,
+        'fecha': envio.resultado.fecha.isoformat() if envio.resultado else None,
     }
-    if errores:
-        resp['errores'] = errores
-
-    return Response(resp, status=status.HTTP_201_CREATED)
+    if envio.errores:
+        data['errores'] = envio.errores
+    return Response(data)
 
 
 @api_view(['GET'])
@@ -140,75 +273,34 @@ def results_summary(request, ensayo_id):
     if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
         return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
 
-    total_participantes = Resultado.objects.filter(ensayo=ensayo).values('alumno').distinct().count()
+    return Response(agregados.resumen(ensayo))
 
 
-    tipos_agg = Respuesta.objects.filter(pregunta__ensayo=ensayo) \
-        .values('pregunta__tipo') \
-        .annotate(respondidas=Count('id'), correctas=Count('id', filter=Q(correcta=True)))
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def item_analysis(request, ensayo_id):
+    ensayo = get_object_or_404(Ensayo, pk=ensayo_id)
 
-    by_type = []
-    for row in tipos_agg:
-        total_resp = row['respondidas'] or 0
-        correct_count = row['correctas'] or 0
-        pct_type = round((correct_count / total_resp * 100), 1) if total_resp > 0 else 0.0
-        by_type.append({
-            'tipo': row['pregunta__tipo'],
-            'respondidas': total_resp,
-            'correctas': correct_count,
-            'porcentaje_correctas': pct_type
-        })
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
 
-    
-    preguntas_agg = Respuesta.objects.filter(pregunta__ensayo=ensayo) \
-        .values('pregunta__id', 'pregunta__enunciado', 'pregunta__tipo', 'pregunta__explicacion_texto', 'pregunta__explicacion_url') \
-        .annotate(respondidas=Count('id'), correctas=Count('id', filter=Q(correcta=True)))
-
-    by_question = []
-    for row in preguntas_agg:
-        total_q = row['respondidas'] or 0
-        correct_q = row['correctas'] or 0
-        pct_q = round((correct_q / total_q * 100), 1) if total_q > 0 else 0.0
-        by_question.append({
-            'pregunta_id': row['pregunta__id'],
-            'texto': row.get('pregunta__enunciado') or '',
-            'tipo': row.get('pregunta__tipo') or '',
-            'respondidas': total_q,
-            'correctas': correct_q,
-            'porcentaje_correctas': pct_q,
-            'explicacion_texto': row.get('pregunta__explicacion_texto') or '',
-            'explicacion_url': row.get('pregunta__explicacion_url') or ''
-        })
+    return Response(analisis.obtener(ensayo.id))
 
-    
-    etiquetas_agg = Respuesta.objects.filter(pregunta__ensayo=ensayo) \
-        .values('pregunta__etiquetas__id', 'pregunta__etiquetas__nombre') \
-        .annotate(respondidas=Count('id'), correctas=Count('id', filter=Q(correcta=True))) \
-        .order_by('-respondidas')
-
-    by_tag = []
-    for row in etiquetas_agg:
-        tag_id = row.get('pregunta__etiquetas__id')
-        tag_name = row.get('pregunta__etiquetas__nombre') or 'Sin etiqueta'
-        total_tag = row['respondidas'] or 0
-        correct_tag = row['correctas'] or 0
-        pct = round((correct_tag / total_tag * 100), 1) if total_tag > 0 else 0.0
-        by_tag.append({
-            'tag_id': tag_id,
-            'tag': tag_name,
-            'respondidas': total_tag,
-            'correctas': correct_tag,
-            'porcentaje_correctas': pct
-        })
 
-    return Response({
-        'ensayo_id': ensayo.id,
-        'titulo': ensayo.titulo,
-        'total_participantes': total_participantes,
-        'by_type': by_type,
-        'by_question': by_question,
-        'by_tag': by_tag
-    })
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def irt_parametros(request, ensayo_id):
+    ensayo = get_object_or_404(Ensayo, pk=ensayo_id)
+
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+
+    data = irt.parametros(ensayo.id)
+    if data is None:
+        return Response({'detail': 'El ensayo aún no está calibrado.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(data)
 
 
 @api_view(['GET'])
@@ -221,36 +313,75 @@ def question_breakdown(request, ensayo_id, pregunta_id):
     if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
         return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
 
-    respuestas_qs = Respuesta.objects.filter(pregunta=pregunta)
-    total = respuestas_qs.count()
-    correctas = respuestas_qs.filter(correcta=True).count()
-    porcentaje_correctos = round((correctas / total * 100), 1) if total > 0 else 0.0
-
-    opciones_data = []
-    for opcion in pregunta.opciones.all():
-        count_op = respuestas_qs.filter(opcion=opcion).count()
-        porcentaje = round((count_op / total * 100), 1) if total > 0 else 0.0
-        opciones_data.append({
-            'id': opcion.id,
-            'texto': getattr(opcion, 'texto', ''),
-            'porcentaje': porcentaje
-        })
+    return Response(desglose.obtener(pregunta))
 
-    return Response({
-        'pregunta_id': pregunta.id,
-        'texto': getattr(pregunta, 'enunciado', ''),
-        'tipo': pregunta.tipo,
-        'total_respondieron': total,
-        'porcentaje_correctos': porcentaje_correctos,
-        'opciones': opciones_data
-    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def buscar_preguntas(request):
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+    if not busqueda.disponible():
+        return Response({'detail': 'La búsqueda requiere SQLite con FTS5.'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    texto = request.query_params.get('q', '').strip()
+    if not texto:
+        return Response({'error': 'Parámetro "q" requerido'}, status=status.HTTP_400_BAD_REQUEST)
+    pagina = _paginacion(request)
+    if pagina is None:
+        return Response({'error': 'desde y cantidad deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+
+    desde, cantidad = pagina
+    resultados, hay_mas = busqueda.buscar(
+        texto,
+        etiqueta=request.query_params.get('etiqueta') or None,
+        tipo=request.query_params.get('tipo') or None,
+        dificultad=request.query_params.get('dificultad') or None,
+        desde=desde,
+        cantidad=cantidad,
+    )
+    return Response({'q': texto, 'desde': desde, 'cantidad': cantidad, 'hay_mas': hay_mas, 'resultados': resultados})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ranking_ensayo(request, ensayo_id):
+    ensayo = get_object_or_404(Ensayo, pk=ensayo_id)
+    pagina = _paginacion(request)
+    if pagina is None:
+        return Response({'error': 'desde y cantidad deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = _ranking(request, ranking.tablero_ensayo(ensayo.id), pagina)
+    data['ensayo_id'] = ensayo.id
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ranking_curso(request, curso):
+    pagina = _paginacion(request)
+    if pagina is None:
+        return Response({'error': 'desde y cantidad deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = _ranking(request, ranking.tablero_curso(curso), pagina)
+    data['curso'] = curso
+    return Response(data)
+
+
+def _ranking(request, tablero, pagina):
+    # Nombres y puntajes de todos sólo para docentes y staff.
+    user = request.user
+    if getattr(user, 'rol', None) == 'docente' or user.is_staff:
+        return ranking.respuesta(tablero, user.id, *pagina)
+    return ranking.respuesta_alumno(tablero, user.id)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def ensayos_completados(request):
     usuario = request.user
-    resultados = Resultado.objects.filter(alumno=usuario).order_by('-fecha')
+    resultados = Resultado.objects.filter(alumno_id=usuario.id).order_by('-fecha')
     data = []
     for r in resultados:
         data.append({
@@ -272,10 +403,16 @@ def review_resultado(request, ensayo_id, resultado_id):
 
         user = request.user
         
-        if not (resultado.alumno == user or getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        if not (resultado.alumno_id == user.id or getattr(user, 'rol', None) == 'docente' or user.is_staff):
             return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
 
-        respuestas = Respuesta.objects.filter(resultado=resultado).select_related('pregunta', 'opcion')
+        respuestas = Respuesta.objects.filter(resultado=resultado) \
+            .select_related('pregunta__imagen', 'opcion').prefetch_related('pregunta__opciones')
+        if barajado.ACTIVO:
+            # Mismo orden de preguntas y opciones que vio el alumno en ese intento.
+            semilla = barajado.semilla(resultado.alumno_id, ensayo.id, resultado.intento)
+            posicion = {pid: i for i, pid in enumerate(barajado.ordenar(semilla, [r.pregunta_id for r in respuestas]))}
+            respuestas = sorted(respuestas, key=lambda r: posicion[r.pregunta_id])
         preguntas_data = []
         for resp in respuestas:
             preg = resp.pregunta
@@ -291,7 +428,11 @@ def review_resultado(request, ensayo_id, resultado_id):
 
             correct_option = None
             opciones_list = []
-            for op in preg.opciones.all():
+            opciones = list(preg.opciones.all())
+            if barajado.ACTIVO:
+                orden = {oid: i for i, oid in enumerate(barajado.ordenar(semilla, [op.id for op in opciones]))}
+                opciones.sort(key=lambda op: orden[op.id])
+            for op in opciones:
                 opciones_list.append({
                     'id': op.id,
                     'texto': getattr(op, 'texto', '') or ''
@@ -315,6 +456,8 @@ def review_resultado(request, ensayo_id, resultado_id):
                 'explicacion_texto': getattr(preg, 'explicacion_texto', '') or '',
                 'explicacion_url': getattr(preg, 'explicacion_url', '') or '',
                 'all_options': opciones_list,
+                'formulas': formulas.mapa(preg.enunciado, preg.explicacion_texto, *(op.texto for op in opciones)),
+                'imagen': imagenes.descripcion(preg.imagen),
             })
 
         resp_obj = {
@@ -322,6 +465,7 @@ def review_resultado(request, ensayo_id, resultado_id):
             'ensayo_id': ensayo.id,
             'ensayo_titulo': getattr(ensayo, 'titulo', ''),
             'puntaje': resultado.puntaje_total,
+            'intento': resultado.intento,
             'fecha': resultado.fecha.isoformat() if getattr(resultado, 'fecha', None) else '',
             'preguntas': preguntas_data
         }
@@ -330,6 +474,118 @@ def review_resultado(request, ensayo_id, resultado_id):
         logger.exception("Error en review_resultado: %s", e)
         return Response({'detail': 'Error interno al obtener revisión'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def crear_ensayo(request):
+    """Crea un ensayo con todas sus preguntas, opciones y etiquetas (ver EnsayoNuevoSerializer)."""
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = EnsayoNuevoSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({'error': 'Ensayo inválido', 'detalle': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    ensayo = autoria.crear(serializer.validated_data, creador=user)
+    return Response({
+        'id': ensayo.id,
+        'titulo': ensayo.titulo,
+        'materia': ensayo.materia,
+        'curso': ensayo.curso,
+        'version': ensayo.version,
+        'pregunta_ids': ensayo.pregunta_ids,
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def importar_preguntas(request):
+    """
+    Importa un banco de preguntas (multipart: `archivo`, opcional `formato`)
+    al ensayo `ensayo_id` o a uno nuevo con `titulo`, `materia` y `curso`.
+    Sólo hasta ENSAYOS_IMPORTACION_WEB_MAX_BYTES; lo demás, por el comando.
+    """
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response({'error': 'Falta el archivo'}, status=status.HTTP_400_BAD_REQUEST)
+    if archivo.size > importacion.MAX_BYTES_WEB:
+        return Response({'error': f'El archivo supera los {importacion.MAX_BYTES_WEB // 1024} KB que se importan '
+                                  'por la web; use el comando `python manage.py importar_preguntas`.'},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    formato = request.data.get('formato') or importacion.formato_de(archivo.name)
+    if formato not in importacion.FORMATOS:
+        return Response({'error': f'Formato no soportado; use {", ".join(importacion.FORMATOS)}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if request.data.get('ensayo_id'):
+        ensayo = get_object_or_404(Ensayo, pk=request.data['ensayo_id'])
+    elif request.data.get('titulo'):
+        ensayo = Ensayo.objects.create(
+            titulo=request.data['titulo'],
+            materia=request.data.get('materia') or 'Materia',
+            curso=request.data.get('curso') or 'Curso',
+            creador_id=user.id,
+        )
+    else:
+        return Response({'error': 'Indique ensayo_id o titulo'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Los archivos grandes Django ya los dejó en disco; se leen por partes.
+    texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+    informe = importacion.importar(texto, formato, ensayo)
+    return Response({'ensayo_id': ensayo.id, **informe.como_dict()}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def generar_ensayo(request):
+    """
+    Arma un ensayo desde el banco de preguntas. Body:
+    {titulo, materia, curso, n_preguntas, por_etiqueta: {nombre: mínimo},
+     dificultad: {min, max}, tipo, excluir_vistas_dias, semilla}
+    """
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+
+    data = request.data
+    titulo = data.get('titulo')
+    materia = data.get('materia')
+    curso = data.get('curso')
+    if not (titulo and materia and curso):
+        return Response({'error': 'titulo, materia y curso son requeridos'}, status=status.HTTP_400_BAD_REQUEST)
+    por_etiqueta = data.get('por_etiqueta') or {}
+    dificultad = data.get('dificultad') or None
+    try:
+        n = int(data.get('n_preguntas'))
+        por_etiqueta = {str(nombre): int(k) for nombre, k in dict(por_etiqueta).items()}
+        banda = (float(dificultad.get('min', '-inf')), float(dificultad.get('max', 'inf'))) if dificultad else None
+        dias = int(data['excluir_vistas_dias']) if data.get('excluir_vistas_dias') else None
+        semilla = int(data['semilla']) if data.get('semilla') is not None else None
+    except (TypeError, ValueError, AttributeError):
+        return Response({'error': 'Parámetros numéricos inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+    # La comparación también descarta NaN, que no es <= a nada.
+    if banda is not None and not banda[0] <= banda[1]:
+        return Response({'error': 'dificultad: min debe ser un número menor o igual a max'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= n <= ensamblador.MAX_PREGUNTAS:
+        return Response({'error': f'n_preguntas debe estar entre 1 y {ensamblador.MAX_PREGUNTAS}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        ensayo, resumen = ensamblador.generar(
+            titulo, materia, curso, user, n,
+            por_etiqueta=por_etiqueta, banda=banda, tipo=data.get('tipo') or None,
+            excluir_vistas_dias=dias, semilla=semilla,
+        )
+    except ensamblador.Infactible as e:
+        return Response({'error': str(e), **e.detalle}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'ensayo_id': ensayo.id, **resumen}, status=status.HTTP_201_CREATED)
+
+
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def editar_explicacion(request, pregunta_id):
@@ -356,3 +612,94 @@ def editar_explicacion(request, pregunta_id):
         'explicacion_texto': pregunta.explicacion_texto,
         'explicacion_url': pregunta.explicacion_url
     }, status=status.HTTP_200_OK)
+
+
+@require_GET
+def formula_svg(request, clave):
+    """
+    SVG de una fórmula (ensayos.formulas). La clave es el hash de la fuente,
+    así que el contenido de una URL no cambia nunca: cache inmutable y
+    pública, sin autenticación (los <img> no envían el token).
+    """
+    etag = f'"{clave}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        contenido = formulas.svg(clave)
+        if contenido is None:
+            raise Http404
+        response = HttpResponse(contenido, content_type='image/svg+xml')
+        # Un SVG puede traer scripts: que el navegador no ejecute nada si se abre directo.
+        response['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'"
+        response['X-Content-Type-Options'] = 'nosniff'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def subir_imagen(request):
+    """
+    Sube una imagen (multipart: `archivo`) y, si viene `pregunta_id`, la
+    asocia a esa pregunta. Si ya existía una imagen con el mismo contenido
+    se reutiliza y responde 200 en vez de 201.
+    """
+    user = request.user
+    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response({'error': 'Falta el archivo'}, status=status.HTTP_400_BAD_REQUEST)
+    pregunta = None
+    if request.data.get('pregunta_id'):
+        pregunta = get_object_or_404(Pregunta, pk=request.data['pregunta_id'])
+
+    try:
+        imagen, creada = imagenes.guardar(archivo)
+    except imagenes.ImagenInvalida as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if pregunta is not None and pregunta.imagen_id != imagen.id:
+        pregunta.imagen = imagen
+        pregunta.save(update_fields=['imagen'])
+    return Response({
+        **imagenes.descripcion(imagen),
+        'pregunta_id': pregunta.id if pregunta else None,
+    }, status=status.HTTP_201_CREATED if creada else status.HTTP_200_OK)
+
+
+@require_GET
+def imagen_archivo(request, hash_, nombre):
+    """
+    Original o variante de una imagen (ensayos.imagenes). Como en formula_svg,
+    la URL lleva el hash del contenido y la versión de las variantes, así que
+    se sirve con cache inmutable y sin autenticación.
+    """
+    etag = f'"{hash_}-{nombre}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        ruta = imagenes.ruta_archivo(hash_, nombre)
+        if ruta is None:
+            raise Http404
+        response = FileResponse(open(ruta, 'rb'), content_type=imagenes.TIPOS[ruta.suffix[1:]])
+        response['X-Content-Type-Options'] = 'nosniff'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estadisticas_cache(request):
+    if not request.user.is_staff:
+        return Response({'detail': PERMISO_INSUF}, status=status.HTTP_403_FORBIDDEN)
+
+    return Response({
+        'pautas': calificacion.estadisticas_pautas(),
+        'escritor': calificacion.estadisticas_escritor(),
+        'ranking': ranking.estadisticas(),
+        'snapshots': snapshots.estadisticas(),
+        'tokens': autenticacion.estadisticas(),
+    })
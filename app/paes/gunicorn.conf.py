@@ -0,0 +1,63 @@
+"""
+Servidor de producción: `gunicorn` desde esta carpeta lee este archivo.
+
+Un proceso maestro mantiene GUNICORN_WORKERS procesos (pre-fork), cada uno
+con GUNICORN_THREADS hilos atendiendo peticiones (worker gthread). Todo se
+ajusta con variables de entorno; los valores por defecto están pensados para
+SQLite y un servidor de pocos núcleos.
+
+- Recarga sin cortar peticiones: `kill -HUP <pid del maestro>` (o
+  `docker compose kill -s HUP backend`). El maestro levanta workers con el
+  código nuevo y los viejos terminan lo que tienen en curso, hasta
+  GUNICORN_GRACEFUL_TIMEOUT segundos.
+- GUNICORN_TIMEOUT: un worker que pasa ese tiempo sin dar señales de vida se
+  reinicia (y se vuelca el stack de sus hilos al log). Con un solo hilo eso
+  equivale a un límite por petición; con varios, una petición lenta no lo
+  dispara y el límite lo ponen los plazos propios de cada módulo (p.ej.
+  USUARIOS_LOGIN_ESPERA).
+- GUNICORN_MAX_REQUESTS (+ un azar de hasta GUNICORN_MAX_REQUESTS_JITTER):
+  cada worker se recicla después de atender esa cantidad de peticiones,
+  para que la memoria que crezca de a poco se libere y no se reinicien
+  todos a la vez.
+
+No se usa preload_app: cada worker importa la aplicación después del fork,
+así los hilos y pools que ésta crea (ensayos.escritor, los pools de fórmulas,
+imágenes y login) nunca se heredan a medias, y HUP recarga el código.
+"""
+import faulthandler
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'paes.settings_produccion')
+
+
+def _entero(variable, defecto):
+    return int(os.environ.get(variable, defecto))
+
+
+wsgi_app = 'paes.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+worker_class = 'gthread'
+workers = _entero('GUNICORN_WORKERS', max(2, multiprocessing.cpu_count()))
+threads = _entero('GUNICORN_THREADS', 4)
+keepalive = _entero('GUNICORN_KEEPALIVE', 5)
+timeout = _entero('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _entero('GUNICORN_GRACEFUL_TIMEOUT', 30)
+max_requests = _entero('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _entero('GUNICORN_MAX_REQUESTS_JITTER', 200)
+preload_app = False
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+# El latido de los workers es un archivo; en Docker, /dev/shm evita que un
+# disco lento los haga parecer colgados.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def worker_abort(worker):
+    # SIGABRT por GUNICORN_TIMEOUT: dónde estaba cada hilo.
+    worker.log.warning('Worker %s sin responder; stack de sus hilos:', worker.pid)
+    faulthandler.dump_traceback(all_threads=True)
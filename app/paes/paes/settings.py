@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -60,6 +63,8 @@ CORS_ALLOWED_ORIGINS = ['http://localhost:5173']
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
 ROOT_URLCONF = 'paes.urls'
 
 TEMPLATES = [
@@ -91,6 +96,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Con varios procesos conviene apuntar esto a un backend compartido: settings_produccion
+# usa una cache en archivos (o Redis con DJANGO_REDIS_URL).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -127,6 +145,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Archivos subidos (imágenes de preguntas, ver ensayos.imagenes).
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = 'media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -134,11 +156,107 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'usuarios.Usuario'
 
+# Autenticación de la API (usuarios.autenticacion): 'token' (Token en la base,
+# con cache) o 'jwt' (JWT firmados de corta vida que se validan sin consultar
+# la base). En modo 'jwt' los Token ya emitidos siguen sirviendo. Con más de
+# un proceso (gunicorn), 'jwt' necesita USUARIOS_TOKEN_CACHE_COMPARTIDA: sin
+# ella un JWT revocado sólo se rechaza en el proceso que lo revocó.
+USUARIOS_AUTENTICACION = 'token'
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        ['usuarios.autenticacion.JWTSinEstado'] if USUARIOS_AUTENTICACION == 'jwt' else []
+    ) + [
+        'usuarios.autenticacion.TokenCacheado',
     ]
-}
\ No newline at end of file
+}
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_USER_CLASS': 'usuarios.autenticacion.UsuarioToken',
+    # Guarda en el token un hash de la contraseña: cambiarla invalida los de refresco.
+    'CHECK_REVOKE_TOKEN': True,
+}
+
+# Ensayos: cantidad máxima de pautas compiladas en la cache de cada proceso.
+ENSAYOS_PAUTAS_CACHE_MAX = 256
+# Snapshots serializados del detalle de ensayos que se mantienen en memoria.
+ENSAYOS_SNAPSHOTS_CACHE_MAX = 256
+# Cada alumno recibe las preguntas y opciones en un orden propio por intento.
+ENSAYOS_BARAJAR = True
+# Tableros de ránking (por ensayo y por curso) que se mantienen en memoria.
+ENSAYOS_RANKING_CACHE_MAX = 128
+# Puestos a cada lado del propio que ve un alumno en el ránking (sin nombres).
+ENSAYOS_RANKING_VECINOS = 2
+
+# Envíos asíncronos: si es True, submit_ensayo encola por defecto y responde
+# 202 (también se puede pedir por envío con ?modo=async).
+ENSAYOS_ENVIO_ASINCRONO = False
+ENSAYOS_COLA_WORKERS = 2
+ENSAYOS_COLA_LOTE = 50
+
+# Claves de idempotencia de submit_ensayo: vigencia en segundos.
+ENSAYOS_IDEMPOTENCIA_TTL = 24 * 60 * 60
+
+# Group commit: los envíos concurrentes se guardan juntos en una transacción
+# por ventana de ENSAYOS_ESCRITURA_VENTANA_MS milisegundos.
+ENSAYOS_ESCRITURA_AGRUPADA = True
+ENSAYOS_ESCRITURA_VENTANA_MS = 5
+ENSAYOS_ESCRITURA_MAX_LOTE = 200
+
+# Calibración TRI (manage.py calibrar_irt): 'rasch' o '2pl', y mínimo de
+# resultados para ajustar un ensayo.
+ENSAYOS_IRT_MODELO = '2pl'
+ENSAYOS_IRT_MIN_ALUMNOS = 30
+
+# Generador de ensayos (POST /api/ensayos/generar/): segundos que el banco de
+# preguntas queda en memoria antes de recargarse.
+ENSAYOS_BANCO_TTL = 300
+
+# Fórmulas $...$ pre-renderizadas a SVG (ensayos.formulas): carpeta donde se
+# guardan, color y tamaño del texto, y procesos que las renderizan (0: se
+# renderizan recién cuando alguien las pide).
+ENSAYOS_FORMULAS_DIR = BASE_DIR / 'formulas'
+ENSAYOS_FORMULAS_COLOR = '#e7f1ea'
+ENSAYOS_FORMULAS_TAMANO = 16
+ENSAYOS_FORMULAS_PROCESOS = 2
+
+# Importación de preguntas por la API (ensayos.importacion): corre dentro de
+# la petición, así que los archivos más grandes que esto se rechazan (413) y
+# se importan con `manage.py importar_preguntas`.
+ENSAYOS_IMPORTACION_WEB_MAX_BYTES = 2 * 1024 * 1024
+
+# Imágenes de preguntas (ensayos.imagenes): tamaño máximo aceptado y procesos
+# que generan las variantes (0: se generan recién cuando alguien las pide).
+ENSAYOS_IMAGENES_MAX_BYTES = 10 * 1024 * 1024
+ENSAYOS_IMAGENES_PROCESOS = 2
+
+# Tokens de sesión (usuarios.autenticacion): segundos de vida de cada token,
+# segundos que un proceso recuerda un token sin volver a consultarlo (lo que
+# puede tardar en notar una revocación hecha en otro proceso), cuántos
+# recuerda, y una cache de CACHES compartida entre procesos (None: ninguna;
+# p.ej. Redis). En ella viven también los JWT revocados.
+USUARIOS_TOKEN_VIDA = 7 * 24 * 60 * 60
+USUARIOS_TOKEN_CACHE_TTL = 60
+USUARIOS_TOKEN_CACHE_MAX = 10000
+USUARIOS_TOKEN_CACHE_COMPARTIDA = None
+
+# Login (usuarios.login): hilos que verifican contraseñas, cuántos logins más
+# pueden esperar turno (el resto recibe 503), segundos máximos de espera, y
+# cubetas (capacidad, recarga por segundo) de intentos por IP y de intentos
+# fallidos por cuenta.
+USUARIOS_LOGIN_HILOS = 4
+USUARIOS_LOGIN_COLA = 64
+USUARIOS_LOGIN_ESPERA = 10
+USUARIOS_LOGIN_LIMITE_IP = (200, 20)
+USUARIOS_LOGIN_LIMITE_CUENTA = (10, 1 / 60)
+
+# Alta masiva (usuarios.importacion): procesos que hashean contraseñas
+# (None: uno por CPU), y cuántas filas acepta el admin, que importa dentro de
+# la petición y sin pool; para más, `manage.py importar_usuarios`.
+USUARIOS_IMPORTACION_PROCESOS = None
+USUARIOS_IMPORTACION_WEB_MAX_FILAS = 20
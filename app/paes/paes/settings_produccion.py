@@ -0,0 +1,90 @@
+"""
+Settings para servir con gunicorn (ver gunicorn.conf.py): los de settings.py
+con DEBUG apagado, conexiones persistentes y SQLite en modo WAL.
+
+Lo que cambia entre despliegues se lee del entorno:
+
+- DJANGO_SECRET_KEY: obligatoria; sin ella sólo se arranca con DJANGO_DEBUG=1.
+- DJANGO_ALLOWED_HOSTS y DJANGO_CORS_ORIGINS: listas separadas por comas.
+- DJANGO_DEBUG=1 para ver errores completos mientras se prueba.
+- DJANGO_CACHE_DIR: carpeta de la cache compartida por los workers;
+  DJANGO_REDIS_URL (redis://...) la reemplaza por Redis.
+"""
+import os
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CORS_ALLOWED_ORIGINS, DATABASES, SECRET_KEY
+
+
+def _lista(variable, defecto):
+    valor = os.environ.get(variable)
+    return [v.strip() for v in valor.split(',') if v.strip()] if valor else defecto
+
+
+DEBUG = os.environ.get('DJANGO_DEBUG') == '1'
+# La clave de desarrollo está en el repositorio: con ella cualquiera firma
+# sesiones y JWT válidos.
+if os.environ.get('DJANGO_SECRET_KEY'):
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+elif not DEBUG:
+    raise ImproperlyConfigured('Defina DJANGO_SECRET_KEY (o DJANGO_DEBUG=1 para pruebas locales).')
+ALLOWED_HOSTS = _lista('DJANGO_ALLOWED_HOSTS', ['localhost', '127.0.0.1'])
+CORS_ALLOWED_ORIGINS = _lista('DJANGO_CORS_ORIGINS', CORS_ALLOWED_ORIGINS)
+
+# Sin DEBUG Django no sirve los archivos del admin; collectstatic los deja
+# aquí y paes/urls.py los sirve (SERVIR_ESTATICOS).
+STATIC_ROOT = Path(os.environ.get('DJANGO_STATIC_ROOT', BASE_DIR / 'static'))
+SERVIR_ESTATICOS = True
+
+# Cada hilo de cada worker mantiene su conexión abierta entre peticiones en
+# vez de abrir una por petición; CONN_HEALTH_CHECKS descarta las que murieron.
+#
+# SQLite en WAL: los lectores no esperan al escritor y cada commit es un
+# append al -wal en vez de reescribir páginas (synchronous=NORMAL sigue
+# siendo seguro en WAL ante caídas del proceso). Las transacciones parten en
+# IMMEDIATE: toman el lock de escritura al empezar y esperan hasta `timeout`
+# segundos, en vez de fallar con "database is locked" al querer pasar de
+# lectura a escritura a mitad de camino.
+DATABASES = {
+    **DATABASES,
+    'default': {
+        **DATABASES['default'],
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA mmap_size=134217728;'
+            ),
+        },
+    },
+}
+
+# gunicorn corre varios workers: con la LocMemCache de settings.py cada uno
+# tendría su cache, y lo que invalida uno (desglose, análisis, JWT revocados)
+# seguiría vigente en los demás. La cache en archivos la comparten todos los
+# procesos de la máquina; con varias máquinas, Redis.
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_DIR', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+    }
+USUARIOS_TOKEN_CACHE_COMPARTIDA = 'default'
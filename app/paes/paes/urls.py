@@ -1,9 +1,11 @@
 # app/paes/paes/urls.py
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from django.views.static import serve
 from rest_framework import routers
 from ensayos.views import ExamViewSet
-from usuarios.views import LoginAPIView, current_user
+from usuarios.views import LoginAPIView, current_user, logout, refrescar_token
 from ensayos import views as ensayos_views
 
 router = routers.DefaultRouter()
@@ -14,8 +16,14 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
     path('api/login/', LoginAPIView.as_view(), name='login'),
+    path('api/logout/', logout, name='logout'),
+    path('api/token/refresh/', refrescar_token, name='refrescar_token'),
     path('current_user/', current_user, name='current_user'),
     path('api/ensayos/', include('ensayos.urls')),
     path('api/preguntas/<int:pregunta_id>/explicacion/', ensayos_views.editar_explicacion, name='editar_explicacion'),
     
 ]
+
+if getattr(settings, 'SERVIR_ESTATICOS', False):
+    # Sin DEBUG (settings_produccion): los archivos del admin, ya reunidos con collectstatic.
+    urlpatterns += [re_path(r'^static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT})]
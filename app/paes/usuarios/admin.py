@@ -1,5 +1,86 @@
-from django.contrib import admin
+import csv
+import io
 
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from . import importacion
 from .models import Usuario
 
-admin.site.register(Usuario)
\ No newline at end of file
+
+class ImportarUsuariosForm(forms.Form):
+    archivo = forms.FileField(help_text='CSV con email,password por fila (cabecera opcional).')
+    rol = forms.ChoiceField(choices=Usuario.ROL, initial=Usuario.ROL[0][0],
+                            help_text='Rol de las filas que no traen columna rol.')
+    reporte = forms.BooleanField(required=False, label='Descargar reporte',
+                                 help_text='Responde con un CSV de las filas con errores o ya existentes.')
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        try:
+            filas = importacion.contar_filas(archivo.file, importacion.MAX_FILAS_WEB)
+        except (UnicodeDecodeError, csv.Error):
+            raise forms.ValidationError('El archivo no es un CSV en UTF-8.')
+        if filas > importacion.MAX_FILAS_WEB:
+            raise forms.ValidationError(
+                f'Desde aquí se importan hasta {importacion.MAX_FILAS_WEB} usuarios; para más use '
+                'el comando python manage.py importar_usuarios.')
+        return archivo
+
+
+@admin.register(Usuario)
+class UsuarioAdmin(admin.ModelAdmin):
+    list_display = ('username', 'email', 'rol', 'is_active', 'date_joined')
+    list_filter = ('rol', 'is_active')
+    search_fields = ('username', 'email')
+    change_list_template = 'admin/usuarios/usuario/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='usuarios_usuario_importar'),
+            *super().get_urls(),
+        ]
+
+    def importar_view(self, request):
+        """Lo mismo que el comando importar_usuarios, subiendo un CSV de pocas filas."""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = ImportarUsuariosForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            reporte = io.StringIO()
+            escritor = csv.writer(reporte)
+            escritor.writerow(['fila', 'duplicada_de', 'errores'])
+            informe = importacion.Informe(al_reportar=lambda e: escritor.writerow(
+                [e['fila'], e.get('duplicada_de', ''), ' | '.join(e.get('errores', []))]))
+            # Los archivos grandes Django ya los dejó en disco; se leen por partes.
+            texto = io.TextIOWrapper(form.cleaned_data['archivo'].file, encoding='utf-8-sig', newline='')
+            # Pocas filas (ImportarUsuariosForm): se hashean aquí, sin levantar un pool de procesos.
+            importacion.importar(texto, form.cleaned_data['rol'], informe=informe, procesos=1)
+
+            nivel = messages.WARNING if informe.abortada or informe.con_error else messages.SUCCESS
+            self.message_user(request, (
+                f'{informe.creadas} usuarios creados, {informe.duplicadas} ya existían y {informe.con_error} '
+                f'con error de {informe.leidas} filas en {informe.segundos:.1f} s.'
+                + (f' Importación interrumpida: {informe.abortada}' if informe.abortada else '')), nivel)
+            if form.cleaned_data['reporte'] and informe.duplicadas + informe.con_error:
+                respuesta = HttpResponse(reporte.getvalue(), content_type='text/csv; charset=utf-8')
+                respuesta['Content-Disposition'] = 'attachment; filename="importacion_usuarios.csv"'
+                return respuesta
+            for entrada in informe.errores[:20]:
+                self.message_user(request, f'Fila {entrada["fila"]}: ' + (
+                    f'ya existe el usuario {entrada["duplicada_de"]}' if 'duplicada_de' in entrada
+                    else '; '.join(entrada['errores'])), messages.WARNING)
+            return redirect('admin:usuarios_usuario_changelist')
+
+        return TemplateResponse(request, 'admin/usuarios/usuario/importar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar usuarios',
+            'form': form,
+            'max_filas': importacion.MAX_FILAS_WEB,
+        })
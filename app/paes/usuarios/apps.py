@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import login
+        login.configurar_registro()
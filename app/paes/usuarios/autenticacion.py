@@ -0,0 +1,352 @@
+"""
+Autenticación por token con cache y vencimiento.
+
+TokenAuthentication de DRF hace un SELECT de Token con JOIN a Usuario en cada
+petición autenticada. TokenCacheado resuelve la clave primero en una cache LRU
+del proceso (con TTL) y, si USUARIOS_TOKEN_CACHE_COMPARTIDA nombra una cache
+de Django (p.ej. Redis), en esa cache compartida entre procesos; sólo si no
+está en ninguna consulta la base de datos.
+
+Cada token vence USUARIOS_TOKEN_VIDA segundos después de emitirse
+(VencimientoToken.expira; los emitidos antes de existir esa tabla vencen
+contando desde Token.created). Cerrar sesión o cambiar la contraseña borra
+el token y lo saca de la cache de este proceso y de la compartida; las caches
+de los demás procesos lo olvidan a más tardar USUARIOS_TOKEN_CACHE_TTL
+segundos después. Los vencidos se borran por lotes de vez en cuando al emitir
+tokens, y con el comando purgar_tokens.
+
+Con USUARIOS_AUTENTICACION = 'jwt' el login entrega, en vez de un Token de
+la base, un JWT de acceso de corta vida (SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'])
+y uno de refresco.
+JWTSinEstado valida la firma y arma un UsuarioToken con los claims (id,
+username, rol, is_staff), así que autenticar y revisar el rol no consulta la
+base. Revocar un JWT (o todos los de un usuario, al cambiar su contraseña)
+lo agrega a ListaNegra, en memoria del proceso, y a la cache compartida. Con
+varios procesos (gunicorn) hace falta USUARIOS_TOKEN_CACHE_COMPARTIDA: sin
+ella los demás procesos siguen aceptando el token de acceso revocado hasta
+que vence (minutos), aunque ninguno lo refresca, porque el refresco consulta
+la base.
+"""
+import copy
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from ensayos.cache import CacheLRU
+
+from .models import Usuario, VencimientoToken
+
+MODO = getattr(settings, 'USUARIOS_AUTENTICACION', 'token')
+VIDA = getattr(settings, 'USUARIOS_TOKEN_VIDA', 7 * 24 * 60 * 60)
+TTL_CACHE = getattr(settings, 'USUARIOS_TOKEN_CACHE_TTL', 60)
+CACHE_COMPARTIDA = getattr(settings, 'USUARIOS_TOKEN_CACHE_COMPARTIDA', None)
+PREFIJO = 'usuarios:token:'
+PREFIJO_JTI = 'usuarios:jti:'
+PREFIJO_JWT_USUARIO = 'usuarios:jwt_usuario:'
+# Cada cuánto (segundos) un proceso aprovecha una emisión para purgar tokens vencidos.
+INTERVALO_PURGA = getattr(settings, 'USUARIOS_TOKEN_PURGA', 10 * 60)
+LOTE_PURGA = 1000
+
+_tokens = CacheLRU(getattr(settings, 'USUARIOS_TOKEN_CACHE_MAX', 10000), ttl=TTL_CACHE)
+_ultima_purga = 0.0
+_purga_lock = threading.Lock()
+
+
+class Sesion:
+    """Lo que se cachea por clave: el token, su usuario y cuándo vence."""
+    __slots__ = ('token', 'usuario', 'expira')
+
+    def __init__(self, token, usuario, expira):
+        self.token = token
+        self.usuario = usuario
+        self.expira = expira
+
+
+def _compartida():
+    return caches[CACHE_COMPARTIDA] if CACHE_COMPARTIDA else None
+
+
+def expiracion(token):
+    try:
+        return token.vencimiento.expira
+    except VencimientoToken.DoesNotExist:
+        return token.created + timedelta(seconds=VIDA)
+
+
+def vigente(token):
+    return expiracion(token) > timezone.now()
+
+
+def _cargar(clave):
+    compartida = _compartida()
+    if compartida is not None:
+        sesion = compartida.get(PREFIJO + clave)
+        if sesion is not None:
+            return sesion
+    token = Token.objects.select_related('user', 'vencimiento').filter(key=clave).first()
+    if token is None:
+        return None
+    sesion = Sesion(token, token.user, expiracion(token))
+    if compartida is not None:
+        restante = (sesion.expira - timezone.now()).total_seconds()
+        if restante > 0:
+            compartida.set(PREFIJO + clave, sesion, min(restante, TTL_CACHE))
+    return sesion
+
+
+class TokenCacheado(TokenAuthentication):
+    """TokenAuthentication con cache de sesiones y vencimiento (ver el docstring del módulo)."""
+
+    def authenticate_credentials(self, key):
+        sesion = _tokens.obtener_o_cargar(key, lambda: _cargar(key))
+        if sesion is None:
+            raise exceptions.AuthenticationFailed('Token inválido.')
+        if sesion.expira <= timezone.now():
+            raise exceptions.AuthenticationFailed('Token vencido.')
+        if not sesion.usuario.is_active:
+            raise exceptions.AuthenticationFailed('Usuario inactivo o eliminado.')
+        # Copia superficial: cada petición puede modificar su request.user sin tocar la cache.
+        return copy.copy(sesion.usuario), sesion.token
+
+
+def emitir(usuario):
+    """
+    Token vigente del usuario, o uno nuevo si no tiene o el que tiene venció
+    (así los logins repetidos no escriben). Sin consultas si el usuario se
+    leyó con select_related('auth_token__vencimiento'). Devuelve (token, creado).
+    """
+    try:
+        token = usuario.auth_token
+    except Token.DoesNotExist:
+        token = None
+    if token is not None and vigente(token):
+        return token, False
+    _purgar_si_corresponde()
+    try:
+        with transaction.atomic():
+            if token is not None:
+                revocar([token.key])
+            token = Token.objects.create(user=usuario)
+            VencimientoToken.objects.create(token=token, expira=timezone.now() + timedelta(seconds=VIDA))
+    except IntegrityError:
+        # Otro login del mismo usuario lo creó al mismo tiempo.
+        return Token.objects.select_related('vencimiento').get(user=usuario), False
+    return token, True
+
+
+def olvidar(claves):
+    """Saca las claves de la cache de este proceso y de la compartida."""
+    claves = list(claves)
+    for clave in claves:
+        _tokens.invalidar(clave)
+    compartida = _compartida()
+    if compartida is not None and claves:
+        compartida.delete_many([PREFIJO + clave for clave in claves])
+
+
+def revocar(claves):
+    claves = list(claves)
+    if not claves:
+        return
+    Token.objects.filter(key__in=claves).delete()
+    # Al confirmar: así nadie vuelve a cachear el token leído antes del DELETE.
+    transaction.on_commit(lambda: olvidar(claves))
+
+
+def revocar_usuario(usuario_id):
+    """Revoca todos los tokens del usuario (p.ej. al cambiar su contraseña)."""
+    revocar(Token.objects.filter(user_id=usuario_id).values_list('key', flat=True))
+
+
+def purgar_vencidos():
+    """Borra los tokens vencidos por lotes; devuelve cuántos borró."""
+    ahora = timezone.now()
+    vencidos = (Token.objects.filter(vencimiento__expira__lte=ahora)
+                | Token.objects.filter(vencimiento__isnull=True, created__lte=ahora - timedelta(seconds=VIDA)))
+    borrados = 0
+    while True:
+        claves = list(vencidos.values_list('key', flat=True)[:LOTE_PURGA])
+        if not claves:
+            return borrados
+        with transaction.atomic():
+            VencimientoToken.objects.filter(token_id__in=claves).delete()
+            Token.objects.filter(key__in=claves).delete()
+        olvidar(claves)
+        borrados += len(claves)
+
+
+def _purgar_si_corresponde():
+    global _ultima_purga
+    ahora = time.monotonic()
+    with _purga_lock:
+        if ahora - _ultima_purga < INTERVALO_PURGA:
+            return
+        _ultima_purga = ahora
+    purgar_vencidos()
+
+
+class ListaNegra:
+    """
+    JWT revocados de este proceso. Por cada jti (16 bytes) se guarda hasta
+    cuándo vale el token, y por usuario desde cuándo valen sus tokens (se
+    fija al cambiar la contraseña); lo que ya venció se descarta al agregar.
+    """
+
+    def __init__(self):
+        self._jtis = {}
+        self._usuarios = {}
+        self._lock = threading.Lock()
+        self._proxima_limpieza = 0.0
+
+    def revocar(self, jti, exp):
+        with self._lock:
+            self._jtis[bytes.fromhex(jti)] = exp
+            self._limpiar()
+
+    def revocar_usuario(self, usuario_id):
+        # Los tokens de acceso emitidos hasta este segundo (iat) quedan revocados hasta que venzan.
+        ahora = time.time()
+        with self._lock:
+            self._usuarios[usuario_id] = (int(ahora), ahora + jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+            self._limpiar()
+        return int(ahora)
+
+    def contiene(self, payload):
+        try:
+            if bytes.fromhex(payload.get(jwt_settings.JTI_CLAIM, '')) in self._jtis:
+                return True
+        except ValueError:
+            return True
+        desde, _ = self._usuarios.get(payload.get(jwt_settings.USER_ID_CLAIM), (-1, 0))
+        return payload.get('iat', 0) <= desde
+
+    def _limpiar(self):
+        ahora = time.time()
+        if ahora < self._proxima_limpieza:
+            return
+        self._proxima_limpieza = ahora + 60
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > ahora}
+        self._usuarios = {uid: v for uid, v in self._usuarios.items() if v[1] > ahora}
+
+    def __len__(self):
+        return len(self._jtis) + len(self._usuarios)
+
+
+lista_negra = ListaNegra()
+
+
+class UsuarioToken(TokenUser):
+    """Usuario de una petición autenticada con JWT, armado sólo con los claims."""
+
+    @property
+    def rol(self):
+        return self.token.get('rol', 'alumno')
+
+
+class JWTSinEstado(JWTStatelessUserAuthentication):
+    """
+    Valida el JWT de acceso sin tocar la base; rechaza los de ListaNegra y,
+    si hay cache compartida, los revocados en otros procesos.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if lista_negra.contiene(token.payload) or _revocado_en_otro_proceso(token.payload):
+            raise InvalidToken('Token revocado.')
+        return token
+
+
+def _expira(token):
+    return datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc).isoformat()
+
+
+def _poner_claims(refresco, usuario):
+    # Los claims del refresco se copian a cada token de acceso que se derive de él.
+    refresco['username'] = usuario.username
+    refresco['rol'] = usuario.rol
+    refresco['is_staff'] = usuario.is_staff
+
+
+def emitir_jwt(usuario):
+    """{'access', 'refresh', 'expira'} para el usuario, con su rol en los claims."""
+    refresco = RefreshToken.for_user(usuario)
+    _poner_claims(refresco, usuario)
+    acceso = refresco.access_token
+    return {'access': str(acceso), 'refresh': str(refresco), 'expira': _expira(acceso)}
+
+
+def _revocado_en_otro_proceso(payload):
+    compartida = _compartida()
+    if compartida is None:
+        return False
+    jti = PREFIJO_JTI + str(payload.get(jwt_settings.JTI_CLAIM, ''))
+    usuario = PREFIJO_JWT_USUARIO + str(payload.get(jwt_settings.USER_ID_CLAIM))
+    # Una sola ida a la cache por petición.
+    revocados = compartida.get_many([jti, usuario])
+    return jti in revocados or payload.get('iat', 0) <= revocados.get(usuario, -1)
+
+
+def refrescar_jwt(crudo):
+    """
+    Token de acceso nuevo a partir de uno de refresco. A diferencia de
+    autenticar, consulta la base: el usuario tiene que seguir activo, con la
+    misma contraseña, y su rol actual es el que va en el token nuevo.
+    """
+    try:
+        refresco = RefreshToken(crudo)
+    except TokenError as e:
+        raise exceptions.AuthenticationFailed(str(e))
+    if lista_negra.contiene(refresco.payload) or _revocado_en_otro_proceso(refresco.payload):
+        raise exceptions.AuthenticationFailed('Token revocado.')
+    usuario = Usuario.objects.filter(pk=refresco.get(jwt_settings.USER_ID_CLAIM)).first()
+    if (usuario is None or not usuario.is_active
+            or refresco.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(usuario.password)):
+        raise exceptions.AuthenticationFailed('Token revocado.')
+    _poner_claims(refresco, usuario)
+    acceso = refresco.access_token
+    return {'access': str(acceso), 'expira': _expira(acceso)}
+
+
+def revocar_jwt(*tokens):
+    """Agrega a ListaNegra (y a la cache compartida, si hay) los tokens dados, ya validados."""
+    compartida = _compartida()
+    for token in tokens:
+        lista_negra.revocar(token[jwt_settings.JTI_CLAIM], token['exp'])
+        restante = token['exp'] - time.time()
+        if compartida is not None and restante > 0:
+            compartida.set(PREFIJO_JTI + token[jwt_settings.JTI_CLAIM], 1, restante)
+
+
+def revocar_jwt_usuario(usuario_id):
+    """Revoca los JWT de acceso ya emitidos al usuario (los de refresco los invalida el cambio de contraseña)."""
+    desde = lista_negra.revocar_usuario(usuario_id)
+    compartida = _compartida()
+    if compartida is not None:
+        compartida.set(PREFIJO_JWT_USUARIO + str(usuario_id), desde,
+                       jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def revocar_jwt_crudo(crudo):
+    """Revoca un token de refresco recibido como texto; los inválidos se ignoran."""
+    try:
+        revocar_jwt(RefreshToken(crudo))
+    except TokenError:
+        pass
+
+
+def estadisticas():
+    return {**_tokens.estadisticas(), 'lista_negra': len(lista_negra)}
@@ -0,0 +1,259 @@
+"""
+Alta masiva de usuarios desde CSV (p.ej. usuarios_prueba.csv, o un colegio
+SIP completo).
+
+Casi todo el costo de crear un usuario es el hash de su contraseña (PBKDF2
+con cientos de miles de iteraciones). Aquí el archivo se lee como flujo, en
+lotes de TAMANO_LOTE filas, y por cada lote:
+
+1. se descartan las filas inválidas y las repetidas, con una sola consulta
+   (por email y username, ambos con índice único) contra los ya existentes;
+2. las contraseñas de las filas nuevas se hashean en un pool de procesos
+   (USUARIOS_IMPORTACION_PROCESOS, por defecto uno por CPU), antes de abrir
+   la transacción para no bloquear la base mientras tanto;
+3. se guardan los Usuario, sus Token y sus VencimientoToken con un
+   bulk_create por modelo en una transacción. Como cada alumno ya tiene un
+   token vigente, el primer login masivo no escribe en la base.
+
+Formato: una fila por usuario con email y contraseña. La cabecera es
+opcional; si la primera celda es "email", se leen además por nombre las
+columnas rol, username, nombre y apellidos. Sin username se usa el email.
+
+Las filas con errores o ya existentes se informan con ensayos.importacion.
+Informe (`duplicada_de` es el id del usuario existente) y no detienen la
+importación.
+"""
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, reset_queries, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+
+from ensayos.importacion import Informe
+
+from . import autenticacion
+from .models import Usuario, VencimientoToken
+
+TAMANO_LOTE = 1000
+PROCESOS = getattr(settings, 'USUARIOS_IMPORTACION_PROCESOS', None) or os.cpu_count() or 1
+# Desde el admin la importación corre dentro de la petición y hashea en el
+# mismo proceso; más filas que esto van por el comando importar_usuarios.
+MAX_FILAS_WEB = getattr(settings, 'USUARIOS_IMPORTACION_WEB_MAX_FILAS', 20)
+COLUMNAS = ('email', 'password', 'rol', 'username', 'nombre', 'apellidos')
+# Los mismos nombres que acepta el login.
+SINONIMOS = {'contraseña': 'password', 'contrasena': 'password'}
+ROLES = {valor for valor, _ in Usuario.ROL}
+MAX_EMAIL = Usuario._meta.get_field('email').max_length
+MAX_USERNAME = Usuario._meta.get_field('username').max_length
+MAX_NOMBRE = Usuario._meta.get_field('nombre').max_length
+MAX_APELLIDOS = Usuario._meta.get_field('apellidos').max_length
+
+_validar_username = UnicodeUsernameValidator()
+
+
+# Lectura
+
+def filas_csv(texto):
+    """Entrega (fila, {columna: valor}) con el número de fila de la planilla."""
+    lector = csv.reader(texto)
+    columnas = COLUMNAS
+    for fila, celdas in enumerate(lector, start=1):
+        if not any(c.strip() for c in celdas):
+            continue
+        if fila == 1 and celdas[0].strip().lower() == 'email':
+            columnas = [SINONIMOS.get(c.strip().lower(), c.strip().lower()) for c in celdas]
+            continue
+        yield fila, dict(zip(columnas, celdas))
+
+
+def contar_filas(archivo, hasta):
+    """
+    Filas de usuario del archivo binario `archivo`, contando hasta `hasta` + 1
+    como mucho. Deja el archivo al principio.
+    """
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    try:
+        return sum(1 for _ in itertools.islice(filas_csv(texto), hasta + 1))
+    finally:
+        # Sin detach, cerrar el envoltorio cerraría también el archivo.
+        texto.detach()
+        archivo.seek(0)
+
+
+def validar(dato, rol=Usuario.ROL[0][0]):
+    """Devuelve (usuario, []) con los campos listos para guardar, o (None, errores)."""
+    errores = []
+    email = Usuario.objects.normalize_email((dato.get('email') or '').strip())
+    try:
+        validate_email(email)
+        if len(email) > MAX_EMAIL:
+            raise ValidationError('largo')
+    except ValidationError:
+        errores.append('email: inválido.' if email else 'email: requerido.')
+    password = dato.get('password') or ''
+    if not password:
+        errores.append('password: requerida.')
+    rol = (dato.get('rol') or '').strip().lower() or rol
+    if rol not in ROLES:
+        errores.append(f'rol: "{rol}" no es válido.')
+    username = (dato.get('username') or '').strip() or email
+    try:
+        _validar_username(username)
+        if len(username) > MAX_USERNAME:
+            raise ValidationError('largo')
+    except ValidationError:
+        errores.append(f'username: hasta {MAX_USERNAME} letras, dígitos y @/./+/-/_.')
+    nombre = (dato.get('nombre') or '').strip()
+    apellidos = (dato.get('apellidos') or '').strip()
+    if len(nombre) > MAX_NOMBRE:
+        errores.append(f'nombre: hasta {MAX_NOMBRE} caracteres.')
+    if len(apellidos) > MAX_APELLIDOS:
+        errores.append(f'apellidos: hasta {MAX_APELLIDOS} caracteres.')
+    if errores:
+        return None, errores
+    return {'email': email, 'password': password, 'rol': rol, 'username': username,
+            'nombre': nombre, 'apellidos': apellidos}, []
+
+
+# Hash de contraseñas
+
+def _hashear(contrasena, ruta_hasher):
+    # Corre en el pool: lo mismo que make_password, con el hasher por defecto del proceso que importa.
+    hasher = import_string(ruta_hasher)()
+    return hasher.encode(contrasena, hasher.salt())
+
+
+def abrir_pool(procesos=PROCESOS):
+    """Pool de procesos para hashear, o None para hacerlo en este proceso (procesos < 2)."""
+    if procesos < 2:
+        return None
+    # spawn como en ensayos.formulas; cada proceso carga Django una vez al partir.
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=django.setup)
+
+
+def hashear(contrasenas, pool=None):
+    """Hashes de las contraseñas, en orden, repartidos entre los procesos del pool."""
+    if pool is None:
+        return [make_password(c) for c in contrasenas]
+    hasher = get_hasher()
+    ruta = f'{type(hasher).__module__}.{type(hasher).__qualname__}'
+    # De a pocas por envío: cada hash tarda décimas de segundo, así que enviar
+    # cuesta poco y ningún proceso queda ocioso al final del lote.
+    return list(pool.map(_hashear, contrasenas, [ruta] * len(contrasenas), chunksize=8))
+
+
+# Importación
+
+def _separar(lote, informe):
+    """
+    Reporta las filas cuyo email o username ya existe (una consulta) y
+    devuelve (nuevas, repetidas): repetidas son las que repiten una fila
+    anterior del mismo lote, como (fila, email de esa fila).
+    """
+    por_email, por_username = {}, {}
+    for uid, email, username in Usuario.objects.filter(
+            Q(email__in={u['email'] for _, u in lote}) | Q(username__in={u['username'] for _, u in lote})
+    ).values_list('id', 'email', 'username'):
+        por_email[email], por_username[username] = uid, uid
+    nuevas, repetidas, emails, usernames = [], [], {}, {}
+    for fila, usuario in lote:
+        email, username = usuario['email'], usuario['username']
+        previo = por_email.get(email) or por_username.get(username)
+        if previo is not None:
+            informe.duplicada(fila, previo)
+        elif email in emails or username in usernames:
+            repetidas.append((fila, emails.get(email) or usernames[username]))
+        else:
+            emails[email] = usernames[username] = email
+            nuevas.append((fila, usuario))
+    return nuevas, repetidas
+
+
+def _insertar(nuevas):
+    expira = timezone.now() + timedelta(seconds=autenticacion.VIDA)
+    with transaction.atomic():
+        creados = Usuario.objects.bulk_create([
+            Usuario(username=u['username'], email=u['email'], password=u['clave'], rol=u['rol'],
+                    nombre=u['nombre'], apellidos=u['apellidos'])
+            for _, u in nuevas
+        ])
+        tokens = Token.objects.bulk_create([Token(key=Token.generate_key(), user_id=c.id) for c in creados])
+        VencimientoToken.objects.bulk_create([VencimientoToken(token_id=t.key, expira=expira) for t in tokens])
+    return creados
+
+
+def _guardar_lote(lote, pool, informe):
+    nuevas, repetidas = _separar(lote, informe)
+    for (_, usuario), clave in zip(nuevas, hashear([u['password'] for _, u in nuevas], pool)):
+        usuario['clave'] = clave
+    try:
+        creados = _insertar(nuevas)
+    except IntegrityError:
+        # Otro proceso creó alguno de estos usuarios entre la consulta y el INSERT.
+        nuevas, _ = _separar(nuevas, informe)
+        creados = _insertar(nuevas)
+    por_email = {c.email: c.id for c in creados}
+    faltan = {email for _, email in repetidas} - por_email.keys()
+    if faltan:
+        por_email.update(Usuario.objects.filter(email__in=faltan).values_list('email', 'id'))
+    for fila, email in repetidas:
+        informe.duplicada(fila, por_email[email])
+    informe.creadas += len(creados)
+
+
+def importar(texto, rol=Usuario.ROL[0][0], tamano_lote=TAMANO_LOTE, informe=None, al_avanzar=None,
+             procesos=PROCESOS):
+    """
+    Crea los usuarios del flujo de texto CSV `texto` (`rol` es el de las filas
+    sin columna rol). Con `procesos` < 2 hashea en este proceso. Cada lote se
+    confirma por separado. Llama a `al_avanzar(informe)` después de cada
+    lote. Devuelve el Informe.
+    """
+    informe = informe or Informe()
+    lote = []
+    pool = abrir_pool(procesos)
+    try:
+        for fila, dato in filas_csv(texto):
+            informe.leidas += 1
+            usuario, errores = validar(dato, rol)
+            if errores:
+                informe.error(fila, errores)
+                continue
+            lote.append((fila, usuario))
+            if len(lote) >= tamano_lote:
+                _guardar_lote(lote, pool, informe)
+                lote = []
+                reset_queries()
+                informe.segundos = time.perf_counter() - informe.inicio
+                if al_avanzar:
+                    al_avanzar(informe)
+        if lote:
+            _guardar_lote(lote, pool, informe)
+    except (csv.Error, UnicodeDecodeError) as e:
+        informe.abortada = str(e)
+        if lote:
+            _guardar_lote(lote, pool, informe)
+    except BrokenProcessPool:
+        informe.abortada = 'Se cayó un proceso del pool de contraseñas.'
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    informe.segundos = time.perf_counter() - informe.inicio
+    return informe
@@ -0,0 +1,199 @@
+"""
+Inicio de sesión bajo ráfagas (p.ej. loadtests/1_diseno_login.jmx: 100
+usuarios en 10 segundos).
+
+- La contraseña se verifica en un pool acotado de hilos (PBKDF2 suelta el
+  GIL mientras calcula). Así a lo más USUARIOS_LOGIN_HILOS hashes corren a
+  la vez y los hilos del servidor no quedan todos calculando; si además hay
+  USUARIOS_LOGIN_COLA esperando, el login responde 503 de inmediato.
+- Si el email no existe se calcula igual un hash, para que el tiempo de
+  respuesta no delate qué cuentas existen.
+- Si el hash guardado usa parámetros viejos (menos iteraciones u otro
+  algoritmo), se recalcula en el mismo pool y se guarda con un UPDATE.
+- Cubetas de tokens en memoria limitan los intentos por IP (todos) y por
+  cuenta (sólo los fallidos).
+- Los intentos se registran en el logger 'usuarios.login' como clave=valor,
+  a través de una cola: escribir el log no bloquea la petición. Nunca se
+  registra la contraseña, y el email va enmascarado.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as TiempoAgotado
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password, verify_password
+
+from .models import Usuario
+
+HILOS = getattr(settings, 'USUARIOS_LOGIN_HILOS', 4)
+COLA = getattr(settings, 'USUARIOS_LOGIN_COLA', 64)
+# Segundos que una petición espera su turno en el pool antes de rendirse.
+ESPERA = getattr(settings, 'USUARIOS_LOGIN_ESPERA', 10)
+# (capacidad, recarga por segundo) de cada cubeta.
+LIMITE_IP = getattr(settings, 'USUARIOS_LOGIN_LIMITE_IP', (200, 20))
+LIMITE_CUENTA = getattr(settings, 'USUARIOS_LOGIN_LIMITE_CUENTA', (10, 1 / 60))
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(HILOS + COLA)
+
+
+class Ocupado(Exception):
+    pass
+
+
+class Cubetas:
+    """
+    Una cubeta de tokens por clave: cada intento saca uno, y se rellenan a
+    `por_segundo` hasta `capacidad`. Guarda a lo más `max_claves` cubetas;
+    se descartan las menos usadas (una cubeta olvidada equivale a una llena).
+    """
+
+    def __init__(self, capacidad, por_segundo, max_claves=10000):
+        self.capacidad = capacidad
+        self.por_segundo = por_segundo
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _nivel(self, clave, ahora):
+        tokens, antes = self._cubetas.get(clave, (self.capacidad, ahora))
+        return min(self.capacidad, tokens + (ahora - antes) * self.por_segundo)
+
+    def espera(self, clave):
+        """Segundos hasta que haya un token para la clave (0 si ya hay), sin sacarlo."""
+        with self._lock:
+            tokens = self._nivel(clave, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.por_segundo
+
+    def tomar(self, clave):
+        """Saca un token si hay; devuelve la espera como `espera()`."""
+        ahora = time.monotonic()
+        with self._lock:
+            tokens = self._nivel(clave, ahora)
+            if tokens < 1:
+                return (1 - tokens) / self.por_segundo
+            self._cubetas[clave] = (tokens - 1, ahora)
+            self._cubetas.move_to_end(clave)
+            while len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+        return 0.0
+
+
+por_ip = Cubetas(*LIMITE_IP)
+por_cuenta = Cubetas(*LIMITE_CUENTA)
+
+
+def _clave_cuenta(email):
+    return (email or '').strip().lower()
+
+
+def limitar(ip, email):
+    """Segundos que debe esperar este intento antes de procesarse (0: adelante)."""
+    espera = por_cuenta.espera(_clave_cuenta(email))
+    if espera:
+        return espera
+    return por_ip.tomar(ip)
+
+
+def registrar_fallo(email):
+    por_cuenta.tomar(_clave_cuenta(email))
+
+
+def buscar(email, con_token=True):
+    """El usuario del email (con su Token y vencimiento en la misma consulta), o None."""
+    if not email:
+        return None
+    usuarios = Usuario.objects.filter(email=email)
+    if con_token:
+        usuarios = usuarios.select_related('auth_token__vencimiento')
+    return usuarios.first()
+
+
+def _verificar(contrasena, encoded):
+    # Corre en el pool. Con una contraseña inutilizable verify_password calcula un hash de todos modos.
+    correcta, actualizar = verify_password(contrasena, encoded)
+    return correcta, make_password(contrasena) if correcta and actualizar else None
+
+
+def _encargar(*args):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix='login')
+    return _pool.submit(_verificar, *args)
+
+
+def verificar(usuario, contrasena):
+    """
+    True si la contraseña es la del usuario (None: no existe, y se compara
+    igual contra nada). Levanta Ocupado si el pool y su cola están llenos.
+    """
+    if not _cupos.acquire(blocking=False):
+        raise Ocupado
+    try:
+        tarea = _encargar(contrasena or '', usuario.password if usuario is not None else UNUSABLE_PASSWORD_PREFIX)
+        try:
+            correcta, nuevo = tarea.result(timeout=ESPERA)
+        except TiempoAgotado:
+            tarea.cancel()
+            raise Ocupado
+    finally:
+        _cupos.release()
+    if nuevo is not None and usuario.is_active:
+        # Sin save(): no hay que disparar las señales de cambio de contraseña.
+        Usuario.objects.filter(pk=usuario.pk, password=usuario.password).update(password=nuevo)
+        usuario.password = nuevo
+    return correcta and usuario.is_active
+
+
+def enmascarar(email):
+    usuario, arroba, dominio = (email or '').partition('@')
+    return (usuario[:1] + '***' + arroba + dominio) if usuario else ''
+
+
+class FormatoClaveValor(logging.Formatter):
+    """`fecha nivel mensaje clave=valor ...` con los campos pasados en extra={'campos': {...}}."""
+
+    def format(self, record):
+        linea = f'{self.formatTime(record)} {record.levelname} {record.getMessage()}'
+        campos = getattr(record, 'campos', None)
+        if campos:
+            linea += ' ' + ' '.join(f'{k}={v}' for k, v in campos.items())
+        return linea
+
+
+def configurar_registro():
+    """
+    Manda 'usuarios.login' a stderr a través de una cola y un hilo aparte,
+    salvo que LOGGING ya le haya puesto handlers.
+    """
+    if logger.handlers:
+        return
+    cola = queue.SimpleQueue()
+    salida = logging.StreamHandler()
+    salida.setFormatter(FormatoClaveValor())
+    oyente = QueueListener(cola, salida, respect_handler_level=True)
+    oyente.start()
+    atexit.register(oyente.stop)
+    logger.addHandler(QueueHandler(cola))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def registrar(resultado, ip, email, inicio, usuario=None, nivel=logging.INFO):
+    logger.log(nivel, 'login', extra={'campos': {
+        'resultado': resultado,
+        'cuenta': enmascarar(email),
+        'usuario_id': usuario.pk if usuario is not None else '-',
+        'ip': ip,
+        'ms': round((time.perf_counter() - inicio) * 1000),
+    }})
@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from usuarios import autenticacion
+from usuarios.models import Usuario
+
+
+class _Deshacer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compara el costo por petición de autenticar con Token en la base (DRF), con '
+            'TokenCacheado y con JWT sin estado, incluida la revisión del rol. Crea un usuario '
+            'de prueba dentro de una transacción que al final se deshace.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._medir(options['peticiones'])
+                raise _Deshacer
+        except _Deshacer:
+            pass
+
+    def _medir(self, n):
+        usuario = Usuario.objects.create_user(username='benchmark-autenticacion', email='benchmark@autenticacion.invalid',
+                                              password=None, rol='docente')
+        token, _ = autenticacion.emitir(usuario)
+        acceso = autenticacion.emitir_jwt(usuario)['access']
+        fabrica = APIRequestFactory()
+
+        def peticion(cabecera):
+            return fabrica.get('/api/ensayos/1/results/summary/', HTTP_AUTHORIZATION=cabecera)
+
+        def frio(request):
+            autenticacion._tokens.invalidar(token.key)
+            return autenticacion.TokenCacheado().authenticate(request)
+
+        escenarios = [
+            ('Token en la base (DRF)', 'Token ' + token.key, TokenAuthentication().authenticate),
+            ('TokenCacheado, sin cache', 'Token ' + token.key, frio),
+            ('TokenCacheado, con cache', 'Token ' + token.key, autenticacion.TokenCacheado().authenticate),
+            ('JWT sin estado', 'Bearer ' + acceso, autenticacion.JWTSinEstado().authenticate),
+        ]
+        self.stdout.write(f'{"modo":<26} {"µs prom":>8} {"µs p99":>8} {"consultas":>9}')
+        for nombre, cabecera, autenticar in escenarios:
+            autenticar(Request(peticion(cabecera)))  # calentar
+            tiempos = []
+            with CaptureQueriesContext(connection) as consultas:
+                for _ in range(n):
+                    request = Request(peticion(cabecera))
+                    inicio = time.perf_counter()
+                    user, _ = autenticar(request)
+                    # La misma revisión de rol que results_summary o question_breakdown.
+                    if not (getattr(user, 'rol', None) == 'docente' or user.is_staff):
+                        raise AssertionError(nombre)
+                    tiempos.append(time.perf_counter() - inicio)
+            tiempos.sort()
+            self.stdout.write(
+                f'{nombre:<26} {statistics.fmean(tiempos) * 1e6:>8.1f} '
+                f'{tiempos[int(len(tiempos) * 0.99)] * 1e6:>8.1f} {len(consultas) / n:>9.2f}')
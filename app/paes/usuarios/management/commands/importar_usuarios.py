@@ -0,0 +1,60 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios import importacion
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = ('Crea usuarios desde un CSV (email,password; ver usuarios/importacion.py) leyendo el '
+            'archivo por partes y hasheando las contraseñas en un pool de procesos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--rol', choices=sorted(importacion.ROLES), default=Usuario.ROL[0][0],
+                            help='Rol de las filas que no traen columna rol.')
+        parser.add_argument('--lote', type=int, default=importacion.TAMANO_LOTE)
+        parser.add_argument('--procesos', type=int, default=importacion.PROCESOS,
+                            help='Procesos para hashear contraseñas (1: sin pool).')
+        parser.add_argument('--reporte', help='Escribe aquí (CSV) todas las filas con errores o ya existentes.')
+
+    def handle(self, *args, **options):
+        reporte = open(options['reporte'], 'w', newline='', encoding='utf-8') if options['reporte'] else None
+        try:
+            if reporte:
+                escritor = csv.writer(reporte)
+                escritor.writerow(['fila', 'duplicada_de', 'errores'])
+                al_reportar = lambda e: escritor.writerow(
+                    [e['fila'], e.get('duplicada_de', ''), ' | '.join(e.get('errores', []))])
+            else:
+                al_reportar = None
+            informe = importacion.Informe(al_reportar=al_reportar)
+            try:
+                texto = open(options['archivo'], encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError(f'No se pudo abrir el archivo: {e}')
+            with texto:
+                importacion.importar(texto, options['rol'], options['lote'], informe, self._avance,
+                                     options['procesos'])
+        finally:
+            if reporte:
+                reporte.close()
+
+        resumen = informe.como_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen["creadas"]} usuarios creados, {resumen["duplicadas"]} ya existían, '
+            f'{resumen["con_error"]} con error de {resumen["leidas"]} filas en {resumen["segundos"]:.1f} s '
+            f'({resumen["filas_por_segundo"]} filas/s).'))
+        if not reporte:
+            for entrada in resumen['errores'][:20]:
+                self.stdout.write(f'  fila {entrada["fila"]}: '
+                                  + (f'ya existe el usuario {entrada["duplicada_de"]}' if 'duplicada_de' in entrada
+                                     else '; '.join(entrada['errores'])))
+            if resumen['duplicadas'] + resumen['con_error'] > 20:
+                self.stdout.write('  ... (use --reporte para ver todas)')
+        if informe.abortada:
+            raise CommandError(f'Importación interrumpida: {informe.abortada}')
+
+    def _avance(self, informe):
+        self.stdout.write(f'{informe.leidas} filas, {informe.creadas} creados ({informe.filas_por_segundo} filas/s)')
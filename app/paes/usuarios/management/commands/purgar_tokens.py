@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from usuarios import autenticacion
+
+
+class Command(BaseCommand):
+    help = 'Borra por lotes los tokens de sesión que ya vencieron (ver usuarios/autenticacion.py).'
+
+    def handle(self, *args, **options):
+        borrados = autenticacion.purgar_vencidos()
+        self.stdout.write(self.style.SUCCESS(f'{borrados} tokens vencidos borrados.'))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 11:30
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def vencer_tokens_existentes(apps, schema_editor):
+    # Los tokens ya emitidos vencen USUARIOS_TOKEN_VIDA después de su creación.
+    Token = apps.get_model('authtoken', 'Token')
+    VencimientoToken = apps.get_model('usuarios', 'VencimientoToken')
+    vida = timedelta(seconds=getattr(settings, 'USUARIOS_TOKEN_VIDA', 7 * 24 * 60 * 60))
+    VencimientoToken.objects.bulk_create(
+        [VencimientoToken(token_id=key, expira=creado + vida)
+         for key, creado in Token.objects.values_list('key', 'created').iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0004_alter_tokenproxy_options'),
+        ('usuarios', '0002_remove_usuario_correo_alter_usuario_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VencimientoToken',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vencimiento', serialize=False, to='authtoken.token')),
+                ('expira', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(vencer_tokens_existentes, migrations.RunPython.noop),
+    ]
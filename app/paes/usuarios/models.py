@@ -11,4 +11,17 @@ class Usuario(AbstractUser):
     )
     rol = models.CharField(max_length=10, choices=ROL, default='alumno')
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+
+class VencimientoToken(models.Model):
+    """
+    Cuándo vence cada Token de DRF (usuarios.autenticacion). Va en una tabla
+    aparte porque el modelo Token no es nuestro; el índice sobre `expira` es
+    el que usa purgar_tokens para borrar los vencidos por lotes.
+    """
+    token = models.OneToOneField('authtoken.Token', on_delete=models.CASCADE, primary_key=True, related_name='vencimiento')
+    expira = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.token_id[:8]}… vence {self.expira:%Y-%m-%d %H:%M}'
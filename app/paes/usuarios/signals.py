@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import Usuario
+from . import autenticacion
+
+
+@receiver(post_save, sender=Usuario)
+def actualizar_sesiones(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    # AbstractBaseUser guarda en _password la contraseña nueva hasta terminar save().
+    if getattr(instance, '_password', None) is not None:
+        autenticacion.revocar_usuario(instance.pk)
+        autenticacion.revocar_jwt_usuario(instance.pk)
+    else:
+        # Cambió otra cosa (rol, is_active...): que las caches no sigan con el usuario viejo.
+        claves = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+        if claves:
+            transaction.on_commit(lambda: autenticacion.olvidar(claves))
+
+
+@receiver(pre_delete, sender=Usuario)
+def olvidar_sesiones(sender, instance, **kwargs):
+    claves = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+    if claves:
+        transaction.on_commit(lambda: autenticacion.olvidar(claves))
@@ -1,3 +1,340 @@
-from django.test import TestCase
+import io
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import autenticacion, importacion, login
+from .models import Usuario, VencimientoToken
+
+
+# Hashear con PBKDF2 completo sólo haría lentas las pruebas.
+RAPIDO = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+
+def contenido(response):
+    return json.loads(response.content)
+
+
+class PBKDF2Rapido(PBKDF2PasswordHasher):
+    """PBKDF2 de una iteración: el hasher "actual" de la prueba de actualización de hashes."""
+    iterations = 1
+
+
+@RAPIDO
+class TokenAPITest(TestCase):
+    """
+    Pruebas del login con Token: reutilización, vencimiento y revocación al
+    cerrar sesión o cambiar la contraseña.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(username='alumno_token', email='alumno@token.cl',
+                                                  password='password', rol='alumno')
+
+    def entrar(self):
+        with self.assertLogs('usuarios.login'):
+            response = APIClient().post(reverse('login'), {'email': 'alumno@token.cl', 'password': 'password'},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return contenido(response)
+
+    def cliente(self, clave):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {clave}')
+        return client
+
+    def test_login_reutiliza_el_token_vigente(self):
+        """Prueba 1: dos logins seguidos entregan el mismo token, que autentica."""
+        primero = self.entrar()
+        self.assertEqual(self.entrar()['token'], primero['token'])
+        response = self.cliente(primero['token']).get(reverse('current_user'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(contenido(response)['email'], 'alumno@token.cl')
+
+    def test_token_vencido(self):
+        """Prueba 2: un token vencido se rechaza y el login siguiente emite otro."""
+        clave = self.entrar()['token']
+        VencimientoToken.objects.filter(token_id=clave).update(expira=timezone.now() - timedelta(seconds=1))
+        autenticacion.olvidar([clave])
+        response = self.cliente(clave).get(reverse('current_user'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(contenido(response)['detail'], 'Token vencido.')
+
+        nueva = self.entrar()['token']
+        self.assertNotEqual(nueva, clave)
+        self.assertFalse(Token.objects.filter(key=clave).exists())
+
+    def test_logout_revoca(self):
+        """Prueba 3: después de cerrar sesión el token ya no autentica, aunque estuviera en cache."""
+        clave = self.entrar()['token']
+        client = self.cliente(clave)
+        self.assertEqual(client.get(reverse('current_user')).status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(reverse('logout')).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(client.get(reverse('current_user')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cambio_de_contrasena_revoca(self):
+        """Prueba 4: cambiar la contraseña revoca los tokens del usuario."""
+        clave = self.entrar()['token']
+        client = self.cliente(clave)
+        self.assertEqual(client.get(reverse('current_user')).status_code, status.HTTP_200_OK)
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        usuario.set_password('otra-password')
+        with self.captureOnCommitCallbacks(execute=True):
+            usuario.save()
+        self.assertEqual(client.get(reverse('current_user')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_purga_de_vencidos(self):
+        """Prueba 5: purgar_vencidos borra sólo los tokens vencidos."""
+        vigente = self.entrar()['token']
+        otro = Usuario.objects.create_user(username='otro_token', email='otro@token.cl', password='password')
+        vencido = Token.objects.create(user=otro)
+        VencimientoToken.objects.create(token=vencido, expira=timezone.now() - timedelta(days=1))
+        self.assertEqual(autenticacion.purgar_vencidos(), 1)
+        self.assertEqual(list(Token.objects.values_list('key', flat=True)), [vigente])
+
+
+@RAPIDO
+class LoginTest(TestCase):
+    """Pruebas de usuarios.login: cubetas de intentos, pool lleno y actualización del hash."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(username='alumno_login', email='alumno@login.cl',
+                                                  password='password', rol='alumno')
+
+    def setUp(self):
+        # Cubetas propias por prueba: las del módulo las comparten todas.
+        for parche in (mock.patch.object(login, 'por_ip', login.Cubetas(*login.LIMITE_IP)),
+                       mock.patch.object(login, 'por_cuenta', login.Cubetas(3, 1 / 60))):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def entrar(self, password='password'):
+        with self.assertLogs('usuarios.login'):
+            return APIClient().post(reverse('login'), {'email': 'alumno@login.cl', 'password': password},
+                                    format='json')
+
+    def test_cubetas(self):
+        """Prueba 1: cada clave tiene su cubeta, que se vacía y se rellena con el tiempo."""
+        cubetas = login.Cubetas(2, 1, max_claves=2)
+        with mock.patch.object(login.time, 'monotonic', return_value=100.0) as reloj:
+            self.assertEqual((cubetas.tomar('a'), cubetas.tomar('a')), (0.0, 0.0))
+            self.assertEqual(cubetas.tomar('a'), 1.0)
+            self.assertEqual(cubetas.tomar('b'), 0.0)
+            reloj.return_value = 100.5
+            self.assertEqual(cubetas.espera('a'), 0.5)
+            reloj.return_value = 101.0
+            self.assertEqual(cubetas.tomar('a'), 0.0)
+            # Con max_claves=2 la menos usada se olvida, que es como tenerla llena.
+            cubetas.tomar('c')
+            self.assertNotIn('b', cubetas._cubetas)
+
+    def test_limite_por_cuenta(self):
+        """Prueba 2: sólo los fallos gastan la cubeta de la cuenta; agotada, responde 429."""
+        self.assertEqual(self.entrar().status_code, status.HTTP_200_OK)
+        for _ in range(3):
+            self.assertEqual(self.entrar('mala').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.entrar()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Otra cuenta desde la misma IP no se ve afectada.
+        self.assertEqual(login.limitar('127.0.0.1', 'otra@login.cl'), 0)
+
+    def test_limite_por_ip(self):
+        """Prueba 3: la cubeta de la IP cuenta todos los intentos, también los correctos."""
+        with mock.patch.object(login, 'por_ip', login.Cubetas(1, 1 / 60)):
+            self.assertEqual(self.entrar().status_code, status.HTTP_200_OK)
+            self.assertEqual(self.entrar().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_pool_lleno(self):
+        """Prueba 4: sin cupos en el pool de verificación el login responde 503 de inmediato."""
+        with mock.patch.object(login, '_cupos', threading.BoundedSemaphore(1)) as cupos:
+            cupos.acquire()
+            response = self.entrar()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        # Un intento rechazado por ocupado no cuenta como fallo de la cuenta.
+        self.assertEqual(login.por_cuenta.espera('alumno@login.cl'), 0)
+
+    def test_hash_viejo_se_actualiza(self):
+        """Prueba 5: un hash con el algoritmo anterior se recalcula al entrar y se guarda."""
+        Usuario.objects.filter(pk=self.usuario.pk).update(
+            password=make_password('password', hasher='md5'))
+        hashers = ['usuarios.tests.PBKDF2Rapido', 'django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.assertEqual(self.entrar().status_code, status.HTTP_200_OK)
+            password = Usuario.objects.get(pk=self.usuario.pk).password
+            self.assertTrue(password.startswith('pbkdf2_sha256$1$'))
+            self.assertEqual(self.entrar().status_code, status.HTTP_200_OK)
+        self.assertEqual(Usuario.objects.get(pk=self.usuario.pk).password, password)
+
+
+@RAPIDO
+class JWTTest(TestCase):
+    """
+    Pruebas del modo JWT: login, refresco y lista negra, en este proceso y,
+    con cache compartida, en los demás (simulados con una ListaNegra vacía).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(username='docente_jwt', email='docente@jwt.cl',
+                                                  password='password', rol='docente')
+
+    def setUp(self):
+        # Los ids se repiten entre pruebas: cada una parte con su propia ListaNegra.
+        for parche in (mock.patch.object(autenticacion, 'MODO', 'jwt'),
+                       mock.patch.object(autenticacion, 'lista_negra', autenticacion.ListaNegra())):
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.addCleanup(cache.clear)
+
+    def entrar(self):
+        with self.assertLogs('usuarios.login'):
+            response = APIClient().post(reverse('login'), {'email': 'docente@jwt.cl', 'password': 'password'},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return contenido(response)
+
+    def autenticar(self, acceso):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {acceso}')
+        return autenticacion.JWTSinEstado().authenticate(request)
+
+    def otro_proceso(self):
+        """Como un worker que no vio la revocación: su ListaNegra está vacía."""
+        parche = mock.patch.object(autenticacion, 'lista_negra', autenticacion.ListaNegra())
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_login_y_claims(self):
+        """Prueba 1: el JWT de acceso autentica sin consultar la base y lleva el rol."""
+        data = self.entrar()
+        self.assertEqual(data['tipo'], 'Bearer')
+        with self.assertNumQueries(0):
+            usuario, _ = self.autenticar(data['token'])
+        self.assertEqual((usuario.id, usuario.rol), (self.usuario.id, 'docente'))
+
+    def test_refresco(self):
+        """Prueba 2: el de refresco entrega otro de acceso; revocado, ya no."""
+        data = self.entrar()
+        response = APIClient().post(reverse('refrescar_token'), {'refresh': data['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.autenticar(contenido(response)['token']))
+
+        autenticacion.revocar_jwt_crudo(data['refresh'])
+        response = APIClient().post(reverse('refrescar_token'), {'refresh': data['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocar_en_este_proceso(self):
+        """Prueba 3: un JWT revocado se rechaza en el proceso que lo revocó."""
+        acceso = self.entrar()['token']
+        autenticacion.revocar_jwt(AccessToken(acceso))
+        with self.assertRaises(InvalidToken):
+            self.autenticar(acceso)
+
+    def test_sin_cache_compartida_otro_proceso_lo_acepta(self):
+        """Prueba 4: sin cache compartida, otro proceso no se entera de la revocación."""
+        acceso = self.entrar()['token']
+        autenticacion.revocar_jwt(AccessToken(acceso))
+        self.otro_proceso()
+        self.assertTrue(self.autenticar(acceso))
+
+    @mock.patch.object(autenticacion, 'CACHE_COMPARTIDA', 'default')
+    def test_cache_compartida_revoca_en_otro_proceso(self):
+        """Prueba 5: con cache compartida, otro proceso rechaza el JWT revocado."""
+        acceso = self.entrar()['token']
+        autenticacion.revocar_jwt(AccessToken(acceso))
+        self.otro_proceso()
+        with self.assertRaises(InvalidToken):
+            self.autenticar(acceso)
+
+    @mock.patch.object(autenticacion, 'CACHE_COMPARTIDA', 'default')
+    def test_cambio_de_contrasena_revoca_en_otro_proceso(self):
+        """Prueba 6: cambiar la contraseña revoca los JWT de acceso emitidos, también en otro proceso."""
+        acceso = self.entrar()['token']
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        usuario.set_password('otra-password')
+        usuario.save()
+        self.otro_proceso()
+        with self.assertRaises(InvalidToken):
+            self.autenticar(acceso)
+
+
+@RAPIDO
+class ImportarUsuariosTest(TestCase):
+    """Pruebas del alta masiva desde CSV: filas con error, repetidas y ya existentes."""
+
+    CSV = (
+        'email,password,rol,nombre\n'
+        'ana@colegio.cl,clave-ana,alumno,Ana\n'
+        'beto@colegio.cl,clave-beto,docente,Beto\n'
+        'no-es-email,clave,alumno,\n'
+        'carla@colegio.cl,,alumno,\n'
+        'dani@colegio.cl,clave-dani,rector,\n'
+        'ANA@colegio.cl,otra,alumno,\n'
+        'existente@colegio.cl,clave,alumno,\n'
+        'ana@colegio.cl,repetida,alumno,\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.existente = Usuario.objects.create_user(username='existente@colegio.cl', email='existente@colegio.cl',
+                                                    password='password')
+        cls.admin = Usuario.objects.create_superuser(username='admin_importar', email='admin@importar.cl',
+                                                     password='password')
+
+    def test_importar(self):
+        """Prueba 1: se crean las válidas, con token vigente; el resto se informa por fila."""
+        informe = importacion.importar(io.StringIO(self.CSV), procesos=1)
+        self.assertEqual((informe.leidas, informe.creadas, informe.duplicadas, informe.con_error), (8, 3, 2, 3))
+        errores = {e['fila']: e for e in informe.errores}
+        self.assertEqual(set(errores), {4, 5, 6, 8, 9})
+        self.assertEqual(errores[8]['duplicada_de'], self.existente.id)
+
+        ana = Usuario.objects.get(email='ana@colegio.cl')
+        self.assertEqual((ana.rol, ana.nombre), ('alumno', 'Ana'))
+        self.assertTrue(ana.check_password('clave-ana'))
+        self.assertEqual(Usuario.objects.get(email='beto@colegio.cl').rol, 'docente')
+        self.assertTrue(autenticacion.vigente(Token.objects.get(user=ana)))
+
+    def test_reimportar_no_duplica(self):
+        """Prueba 2: importar el mismo archivo otra vez no crea nada."""
+        importacion.importar(io.StringIO(self.CSV), procesos=1)
+        informe = importacion.importar(io.StringIO(self.CSV), procesos=1)
+        self.assertEqual(informe.creadas, 0)
+        self.assertEqual(Usuario.objects.count(), 5)
+
+    def subir(self, texto):
+        client = Client()
+        client.force_login(self.admin)
+        archivo = SimpleUploadedFile('usuarios.csv', texto.encode('utf-8'), content_type='text/csv')
+        return client.post(reverse('admin:usuarios_usuario_importar'), {'archivo': archivo, 'rol': 'alumno'})
+
+    def test_admin_importa(self):
+        """Prueba 3: el admin importa un archivo chico y vuelve al listado."""
+        response = self.subir(self.CSV)
+        self.assertRedirects(response, reverse('admin:usuarios_usuario_changelist'))
+        self.assertTrue(Usuario.objects.filter(email='beto@colegio.cl').exists())
+
+    def test_admin_rechaza_archivos_grandes(self):
+        """Prueba 4: sobre el máximo de filas el admin no importa nada y sugiere el comando."""
+        filas = ''.join(f'alumno{i}@colegio.cl,clave{i}\n' for i in range(importacion.MAX_FILAS_WEB + 1))
+        response = self.subir(filas)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'importar_usuarios')
+        self.assertFalse(Usuario.objects.filter(email__startswith='alumno').exists())
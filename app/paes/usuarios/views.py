@@ -1,55 +1,112 @@
+import logging
+import math
+import time
+
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.authtoken.models import Token
-from django.contrib.auth import authenticate
-from .serializers import UserSerializer, LoginSerializer
-
-from rest_framework.permissions import AllowAny
-
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from django.contrib.auth import authenticate
+from .serializers import UserSerializer
 from .models import Usuario
+from . import autenticacion, login
 
 class LoginAPIView(APIView):
-    permission_classes = [AllowAny] 
+    permission_classes = [AllowAny]
+    # Un token vencido guardado en el cliente no debe impedir iniciar sesión.
+    authentication_classes = []
     def post(self, request):
+        """Ver usuarios/login.py: pool de verificación, límites por IP y cuenta, y registro."""
+        inicio = time.perf_counter()
         email = request.data.get('email')
         contraseña = request.data.get('contraseña') or request.data.get('contrasena') or request.data.get('password')
+        ip = request.META.get('REMOTE_ADDR', '')
 
-        print("🔹 Intento de login con email:", email)
-        print("🔹 Contraseña recibida:", contraseña)
+        espera = login.limitar(ip, email)
+        if espera:
+            login.registrar('limitado', ip, email, inicio, nivel=logging.WARNING)
+            response = Response({'error': 'Demasiados intentos; espere un momento.'},
+                                status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(math.ceil(espera))
+            return response
 
+        usuario = login.buscar(email, con_token=autenticacion.MODO != 'jwt')
         try:
-            usuario = Usuario.objects.get(email=email)
-            print("Usuario encontrado:", usuario.username)
-        except Usuario.DoesNotExist:
-            print("Usuario no encontrado con email:", email)
+            correcta = login.verificar(usuario, contraseña)
+        except login.Ocupado:
+            login.registrar('ocupado', ip, email, inicio, usuario, nivel=logging.WARNING)
+            response = Response({'error': 'El servidor está ocupado, intente nuevamente.'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
+        if not correcta:
+            login.registrar_fallo(email)
+            login.registrar('fallido', ip, email, inicio, usuario)
             return Response({'error': 'email o contraseña inválidos'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        if usuario.check_password(contraseña):
-            print("Contraseña correcta")
-
-            token, created = Token.objects.get_or_create(user=usuario)
-            print("Token:", token.key)
-
+        if autenticacion.MODO == 'jwt':
+            # `token` es el de acceso; el cliente lo renueva con POST /api/token/refresh/.
+            jwt = autenticacion.emitir_jwt(usuario)
+            login.registrar('ok', ip, email, inicio, usuario)
             return Response({
-                'token': token.key,
+                'token': jwt['access'],
+                'refresh': jwt['refresh'],
+                'tipo': 'Bearer',
                 'rol': usuario.rol,
                 'username': usuario.username,
+                'expira': jwt['expira'],
             }, status=status.HTTP_200_OK)
-        else:
-            print("Contraseña incorrecta")
-            return Response({'error': 'email o contraseña inválidos'}, status=status.HTTP_401_UNAUTHORIZED)
 
+        # Reutiliza el token si sigue vigente; si venció se emite otro.
+        token, created = autenticacion.emitir(usuario)
+        login.registrar('ok', ip, email, inicio, usuario)
+        return Response({
+            'token': token.key,
+            'tipo': 'Token',
+            'rol': usuario.rol,
+            'username': usuario.username,
+            'expira': autenticacion.expiracion(token).isoformat(),
+        }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    """
+    Revoca el token con que se autenticó la petición y, con JWT, también el
+    de refresco si viene en el body (`refresh`).
+    """
+    if isinstance(request.auth, Token):
+        autenticacion.revocar([request.auth.key])
+    elif request.auth is not None:
+        autenticacion.revocar_jwt(request.auth)
+        if request.data.get('refresh'):
+            autenticacion.revocar_jwt_crudo(request.data['refresh'])
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def refrescar_token(request):
+    """Token de acceso nuevo a partir del de refresco (`refresh`), en modo JWT."""
+    if not request.data.get('refresh'):
+        return Response({'error': 'Falta el token de refresco'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        jwt = autenticacion.refrescar_jwt(request.data['refresh'])
+    except AuthenticationFailed as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({'token': jwt['access'], 'tipo': 'Bearer', 'expira': jwt['expira']})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user(request):
-    serializer = UserSerializer(request.user)
+    usuario = request.user
+    if not isinstance(usuario, Usuario):
+        # Con JWT request.user sólo tiene los claims; aquí se necesita el email.
+        usuario = Usuario.objects.get(pk=usuario.id)
+    serializer = UserSerializer(usuario)
     return Response(serializer.data)
\ No newline at end of file
@@ -9,6 +9,19 @@ export const login = async (email, password) => {
     return response.data;
 };
 
-export const logout = () => {
-    localStorage.removeItem('token');
+// Revoca el token en el servidor y limpia la sesión local, aunque el
+// servidor no responda (el token igual vence solo).
+export const logout = async () => {
+    const token = localStorage.getItem('token');
+    const tipo = localStorage.getItem('tipo_token') || 'Token';
+    const refresh = localStorage.getItem('refresh');
+    try {
+        if (token) {
+            await api.post('logout/', refresh ? { refresh } : null, { headers: { Authorization: tipo + ' ' + token } });
+        }
+    } catch (e) {
+        console.warn('No se pudo revocar el token en el servidor', e);
+    } finally {
+        localStorage.clear();
+    }
 };
\ No newline at end of file
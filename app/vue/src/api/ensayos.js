@@ -10,17 +10,51 @@ const api = axios.create({
 });
 
 
+// Las rutas que entrega el backend (p.ej. los SVG de fórmulas) son absolutas desde la raíz.
+export function urlAbsoluta(ruta) {
+  return new URL(ruta, API_BASE).href;
+}
+
+// `tipo` viene del login: 'Token' (token en la base) o 'Bearer' (JWT).
 function authHeader() {
   const token = localStorage.getItem('token');
-  return token ? { Authorization: 'Token ' + token } : {};
+  const tipo = localStorage.getItem('tipo_token') || 'Token';
+  return token ? { Authorization: tipo + ' ' + token } : {};
 }
 
+// Con JWT el token de acceso dura minutos: ante un 401 se pide uno nuevo con
+// el de refresco y se reintenta la petición una vez.
+let refrescando = null;
+api.interceptors.response.use(undefined, async (error) => {
+  const original = error.config;
+  const refresh = localStorage.getItem('refresh');
+  if (error.response?.status !== 401 || !refresh || original._reintento || original.url === '/token/refresh/') throw error;
+  original._reintento = true;
+  refrescando = refrescando || api.post('/token/refresh/', { refresh }).finally(() => { refrescando = null; });
+  try {
+    const { data } = await refrescando;
+    localStorage.setItem('token', data.token);
+  } catch (e) {
+    throw error;
+  }
+  original.headers = { ...original.headers, ...authHeader() };
+  return api(original);
+});
+
 
 
+// /exams/ responde un resumen paginado por cursor ({ next, results }); se
+// siguen los `next` hasta juntar todos los ensayos.
 export async function fetchAllEnsayos() {
   try {
-    const resp = await api.get('/exams/', { headers: { ...authHeader() } });
-    return resp.data;
+    let resp = await api.get('/exams/', { headers: { ...authHeader() } });
+    if (Array.isArray(resp.data)) return resp.data;
+    const ensayos = [...resp.data.results];
+    while (resp.data.next) {
+      resp = await api.get(resp.data.next, { headers: { ...authHeader() } });
+      ensayos.push(...resp.data.results);
+    }
+    return ensayos;
   } catch (err) {
 
     const resp = await api.get('/ensayos/', { headers: { ...authHeader() } });
@@ -28,6 +62,15 @@ export async function fetchAllEnsayos() {
   }
 }
 
+// `ensayo` es el documento completo: { titulo, materia, curso, preguntas: [
+//   { enunciado, tipo, etiquetas: [nombres], opciones: [{ texto, es_correcta }] } ] }
+export async function crearEnsayo(ensayo) {
+  const res = await api.post('/ensayos/crear/', ensayo, {
+    headers: { 'Content-Type': 'application/json', ...authHeader() }
+  });
+  return res.data;
+}
+
 export async function fetchEnsayo(id) {
   try {
     const resp = await api.get(`/exams/${id}/`, { headers: { ...authHeader() } });
@@ -38,14 +81,40 @@ export async function fetchEnsayo(id) {
   }
 }
 
-export async function submitEnsayo(ensayoId, respuestas) {
+export function nuevaClaveEnvio() {
+  if (window.crypto && window.crypto.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// `submissionId` debe ser el mismo en todos los reintentos de un mismo envío:
+// el backend responde los duplicados con lo que guardó la primera vez.
+export async function submitEnsayo(ensayoId, respuestas, submissionId = nuevaClaveEnvio()) {
   const url = `/ensayos/${ensayoId}/submit/`;
   const resp = await api.post(url, Array.isArray(respuestas) ? respuestas : { respuestas }, {
-    headers: { 'Content-Type': 'application/json', ...authHeader() }
+    headers: { 'Content-Type': 'application/json', 'Idempotency-Key': submissionId, ...authHeader() }
   });
+  // En modo asíncrono el backend responde 202 con un ticket; se consulta
+  // hasta que el envío quede calificado.
+  if (resp.status === 202) {
+    return esperarEnvio(resp.data.ticket);
+  }
   return resp.data;
 }
 
+export async function getEstadoEnvio(ticket) {
+  const res = await api.get(`/ensayos/envios/${ticket}/`, { headers: { ...authHeader() } });
+  return res.data;
+}
+
+async function esperarEnvio(ticket, intervaloMs = 1000) {
+  for (;;) {
+    const data = await getEstadoEnvio(ticket);
+    if (data.estado === 'completado') return data;
+    if (data.estado === 'error') throw new Error('No se pudo calificar el envío');
+    await new Promise(r => setTimeout(r, intervaloMs));
+  }
+}
+
 export async function getResultsSummary(ensayoId) {
   const url = `/ensayos/${ensayoId}/results/summary/`;
   const resp = await api.get(url, { headers: { ...authHeader() } });
@@ -58,6 +127,18 @@ export async function getQuestionBreakdown(ensayoId, preguntaId) {
   return resp.data;
 }
 
+// Docentes y staff reciben `top` (la página pedida, con nombres); un alumno
+// recibe `vecinos`: su puesto y los de alrededor, sin nombres.
+export async function getRankingEnsayo(ensayoId, desde = 0, cantidad = 20) {
+  const res = await api.get(`/ensayos/${ensayoId}/ranking/`, { params: { desde, cantidad }, headers: { ...authHeader() } });
+  return res.data;
+}
+
+export async function getRankingCurso(curso, desde = 0, cantidad = 20) {
+  const res = await api.get(`/ensayos/ranking/curso/${encodeURIComponent(curso)}/`, { params: { desde, cantidad }, headers: { ...authHeader() } });
+  return res.data;
+}
+
 export async function getEnsayosCompletados() {
   const res = await api.get('/ensayos/completados/', { headers: { ...authHeader() } });
   return res.data;